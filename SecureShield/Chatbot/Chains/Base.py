@@ -1,4 +1,7 @@
 # Import necessary modules and classes
+import re
+from typing import Optional, Sequence
+
 from langchain.prompts import (
     ChatPromptTemplate,
     HumanMessagePromptTemplate,
@@ -19,6 +22,22 @@ class PromptTemplate(BaseModel):
     )
 
 
+class BatchableChain:
+    """Mixin giving a wrapper of a prompt chain (`self.chain`) a concurrent `batch`."""
+
+    def chain_inputs(self, inputs) -> dict:
+        """Map the inputs of the wrapper to the inputs of its prompt chain."""
+        return {
+            "user_input": inputs["user_input"],
+            "chat_history": inputs["chat_history"],
+            "format_instructions": self.format_instructions,
+        }
+
+    def batch(self, inputs, config=None, **kwargs):
+        # One request per input, sent concurrently up to config["max_concurrency"]
+        return self.chain.batch([self.chain_inputs(item) for item in inputs], config, **kwargs)
+
+
 def generate_prompt_templates(
     prompt_template: PromptTemplate, memory: bool
 ) -> ChatPromptTemplate:
@@ -81,3 +100,29 @@ def generate_agent_prompt_template(
     )
 
     return prompt
+
+
+# Calendar dates, whose numbers are never identifiers
+DATE_PATTERN = re.compile(r"\b\d{4}-\d{1,2}-\d{1,2}\b|\b\d{1,2}[/.]\d{1,2}[/.]\d{2,4}\b")
+
+
+def strip_dates(text: str) -> str:
+    """Remove calendar dates such as 2024-03-05 or 05/03/2024 from a message."""
+    return DATE_PATTERN.sub(" ", text)
+
+
+def find_identifier(text: str, keywords: Sequence[str]) -> Optional[str]:
+    """Return the number following the first of the keywords found, e.g. 'client #12'.
+
+    Args:
+        text: The lowercased user input, without dates.
+        keywords: Entity names in order of preference, e.g. ("client", "policy").
+
+    Returns:
+        The identifier, or None if no keyword is followed by a number.
+    """
+    for keyword in keywords:
+        match = re.search(rf"\b{keyword}s?\s*(?:id\s*)?(?:number\s*)?#?\s*(\d+)\b", text)
+        if match:
+            return match.group(1)
+    return None
@@ -4,13 +4,14 @@ from langchain_core.output_parsers import StrOutputParser
 from pydantic import BaseModel, Field
 
 from Chains.Base import PromptTemplate, generate_prompt_templates
+from model_registry import get_llm
 
 
 class ChitChatResponseChain(Runnable):
-    def __init__(self, llm, memory=True):
+    def __init__(self, llm=None, memory=True, registry=None):
         super().__init__()
 
-        self.llm = llm
+        self.llm = llm or get_llm("chitchat.response", registry)
         prompt_template = PromptTemplate(
             system_template=""" 
             As an AI language model engaging in friendly chitchat for SecureShield, your main objectives are to maintain a conversational tone.
@@ -66,10 +67,10 @@ class ChitChatClassifier(BaseModel):
 
 
 class ChitChatClassifierChain(Runnable):
-    def __init__(self, llm, memory=False):
+    def __init__(self, llm=None, memory=False, registry=None):
         super().__init__()
 
-        self.llm = llm
+        self.llm = llm or get_llm("chitchat.classify", registry)
         prompt_template = PromptTemplate(
             system_template=""" 
             You are specialized in distinguishing between chitchat and insurance-related user messages.
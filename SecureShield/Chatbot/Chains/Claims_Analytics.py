@@ -0,0 +1,176 @@
+import re
+from Chains.Base import BatchableChain, PromptTemplate, generate_prompt_templates
+from langchain.schema.runnable.base import Runnable
+from langchain.output_parsers import PydanticOutputParser
+from pydantic import BaseModel
+from dotenv import load_dotenv
+from analytics import ClaimsAnalyticsQuery, summarize_claims
+from database import connect
+from model_registry import get_llm, with_deterministic_fallback
+from coalescing import coalesce_read
+from tracing import span
+
+load_dotenv()
+
+# Words in the user input mapped to breakdown dimensions
+DIMENSION_WORDS = {
+    "policy type": "policy_type",
+    "type of policy": "policy_type",
+    "claim type": "claim_type",
+    "type of claim": "claim_type",
+    "status": "status",
+    "level": "policy_level",
+    "tier": "policy_level",
+    "month": "submission_month",
+    "client": "client",
+}
+
+CLAIM_TYPES = ("vehicle accident", "theft", "medical", "fire damage", "flood damage")
+
+def extract_analytics_query_deterministic(inputs) -> ClaimsAnalyticsQuery:
+    """Model-free extraction used when the extraction stage exceeds its budget."""
+    text = inputs["user_input"].lower()
+
+    if re.search(r"\baverage\b|\bmean\b", text):
+        metric = "average_claimed"
+    elif re.search(r"\b(amount|total|sum) (approved|paid)\b|\bpaid out\b", text):
+        metric = "amount_approved"
+    elif re.search(r"\b(amount|total|sum|value)\b", text) and not re.search(r"\bhow many\b|\bnumber of\b", text):
+        metric = "amount_claimed"
+    else:
+        metric = "count"
+
+    group_by = []
+    for clause in re.findall(r"\b(?:per|by|for each|broken down by|grouped by)\s+([a-z ]+)", text):
+        for word, dimension in DIMENSION_WORDS.items():
+            if clause.startswith(word) and dimension not in group_by:
+                group_by.append(dimension)
+
+    # "amount approved" names the metric, not a status filter
+    status = re.search(r"\b(approved|denied|pending)\b", re.sub(r"\b(amount|total|sum) approved\b", "", text))
+    policy_type = re.search(r"\b(health|house|car)\b", text)
+    claim_type = next((claim_type for claim_type in CLAIM_TYPES if claim_type in text), None)
+    return ClaimsAnalyticsQuery(
+        metric=metric,
+        group_by=group_by,
+        status=status.group(1) if status and "status" not in group_by else None,
+        policy_type=policy_type.group(1).capitalize() if policy_type and "policy_type" not in group_by else None,
+        claim_type=claim_type if "claim_type" not in group_by else None,
+    )
+
+class ExtractAnalyticsQuery(BatchableChain, Runnable):
+    def __init__(self, llm, memory=False):
+        super().__init__()
+        self.llm = llm
+        prompt_template = PromptTemplate(
+            system_template="""
+            You are part of a database management team for SecureShield Insurance.
+            Your task is to turn a manager's question about claim statistics into an aggregate query.
+            Choose:
+            - 'metric': 'count' (number of claims), 'amount_claimed' (total amount claimed), 'amount_approved'\
+              (total amount approved) or 'average_claimed' (average amount claimed).
+            - 'group_by': the breakdowns the user asks for ("per", "by", "for each"), any of 'policy_type',\
+              'claim_type', 'status', 'policy_level', 'submission_month' and 'client'. Leave it empty for a single total.
+            - 'status', 'policy_type' and 'claim_type': filters on the claims, only if the user mentions them.
+              Statuses are approved, denied and pending. Policy types are Health, House and Car.
+
+            Here is the user input:
+            {user_input}
+
+            Chat History:
+            {chat_history}
+
+            {format_instructions}
+            """,
+            human_template="user input: {user_input}",
+        )
+
+        self.prompt = generate_prompt_templates(prompt_template, memory=memory)
+        self.output_parser = PydanticOutputParser(pydantic_object=ClaimsAnalyticsQuery)
+        self.format_instructions = self.output_parser.get_format_instructions()
+
+        self.chain = with_deterministic_fallback(
+            self.prompt | self.llm | self.output_parser,
+            extract_analytics_query_deterministic,
+        )
+
+    def invoke(self, inputs):
+        # Identical self-contained questions of any session share one extraction;
+        # each session still queries and answers with its own history
+        return coalesce_read(
+            "analytics.extract",
+            inputs,
+            extract_analytics_query_deterministic,
+            lambda: self.chain.invoke(self.chain_inputs(inputs)),
+        )
+
+class ClaimsAnalyticsOutput(BaseModel):
+    output: str
+
+class ClaimsAnalyticsChain(Runnable):
+    def __init__(self, memory=True, registry=None):
+        # Initialize LLMs for each stage and extract the aggregate query
+        self.llm = get_llm("analytics.response", registry)
+        self.extract_chain = ExtractAnalyticsQuery(get_llm("analytics.extract", registry))
+
+        prompt_bot_return = PromptTemplate(
+            system_template="""
+            You are part of the database manager team for SecureShield Insurance.
+            A manager asked a question about claim statistics. The figures were computed from the claims database\
+            and are given below as a table.
+
+            Based on the table, answer the question in a friendly and concise way, quoting the relevant figures.
+            Do not make up figures that are not in the table.
+            Do not greet the user at the beginning of the message, as this is in the middle of the conversation.
+
+            Here is the user input:
+            {user_input}
+
+            Chat History:
+            {chat_history}
+
+            Result of the query:
+            {status}
+
+            {format_instructions}
+            """,
+            human_template="user input: {user_input}",
+        )
+
+        self.prompt = generate_prompt_templates(prompt_bot_return, memory=memory)
+        self.output_parser = PydanticOutputParser(pydantic_object=ClaimsAnalyticsOutput)
+        self.format_instructions = self.output_parser.get_format_instructions()
+
+        # Fall back to the raw table if the response stage times out
+        self.chain = with_deterministic_fallback(
+            self.prompt | self.llm | self.output_parser,
+            lambda inputs: ClaimsAnalyticsOutput(output=inputs["status"]),
+        )
+
+    def run_query(self, query: ClaimsAnalyticsQuery, con, config=None) -> str:
+        """Run the extracted aggregate query and return the operation status."""
+        with span("analytics.sql", metric=query.metric, group_by=",".join(query.group_by)):
+            return summarize_claims(con, query).render()
+
+    def invoke(self, user_input, config):
+        with span("analytics.extract"):
+            query = self.extract_chain.invoke(user_input)
+
+        con = connect()
+        try:
+            self.status = self.run_query(query, con)
+        except Exception as e:
+            self.status = f"Error: {e}"
+        finally:
+            con.close()
+
+        # Generate the final response
+        with span("analytics.response"):
+            response = self.chain.invoke({
+                "user_input": user_input['user_input'],
+                'chat_history': user_input['chat_history'],
+                "status": self.status,
+                "format_instructions": self.format_instructions
+            })
+
+        return response.output
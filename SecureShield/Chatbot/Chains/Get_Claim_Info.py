@@ -1,12 +1,17 @@
-import sqlite3
-from Chains.Base import PromptTemplate, generate_prompt_templates
+import re
+from Chains.Base import BatchableChain, PromptTemplate, find_identifier, generate_prompt_templates, strip_dates
 from langchain.schema.runnable.base import Runnable
-from langchain_openai import ChatOpenAI
 from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel
 from typing import Type
 from langchain_community.tools import BaseTool
 from dotenv import load_dotenv
+from database import connect
+from hot_tables import database_path, get_hot_tables
+from result_sets import PagedQuery, fetch_first_page, fetch_next_page, fetch_page, session_key
+from model_registry import get_llm, with_deterministic_fallback
+from coalescing import coalesce_read
+from tracing import span
 
 load_dotenv()
 
@@ -15,7 +20,31 @@ class ClaimQueryType(BaseModel):
     value: str
     num_results: int = 5  # Default to 5 results if not specified
 
-class ExtractClaimQuery(Runnable):
+def extract_claim_query_deterministic(inputs) -> ClaimQueryType:
+    """Model-free extraction used when the extraction stage exceeds its budget."""
+    lowered = strip_dates(inputs["user_input"].lower())
+    if re.search(r"\bnext (page|results)\b|\b(show|more) (more|results)\b", lowered):
+        return ClaimQueryType(query_type="next_page", value="")
+
+    if "client" in lowered:
+        query_type, keywords = "claims_by_client", ("client",)
+    elif "policy" in lowered:
+        query_type, keywords = "claims_by_policy", ("policy",)
+    elif "status" in lowered:
+        query_type, keywords = "claim_status", ("claim",)
+    else:
+        query_type, keywords = "claim_details", ("claim",)
+
+    # The number named by the query type, e.g. the client in "claims of client 7"
+    value = find_identifier(lowered, keywords)
+    if value is None:
+        ids = re.findall(r"\d+", lowered)
+        if not ids:
+            raise ValueError("No identifier found in the user input.")
+        value = ids[0]
+    return ClaimQueryType(query_type=query_type, value=value)
+
+class ExtractClaimQuery(BatchableChain, Runnable):
     def __init__(self, llm, memory=False):
         super().__init__()
         self.llm = llm
@@ -28,7 +57,9 @@ class ExtractClaimQuery(Runnable):
             - 'claims_by_client': Return all claims associated with a particular client by client_id.
             - 'claims_by_policy': Return all claims associated with a specific policy by policy_id.
             - 'claim_details': Return full details of a claim by its claim_id.
+            - 'next_page': Return the next page of the previous claim results (value can be empty).
 
+            Set 'num_results' to the number of results the user asked for, if any.
             The system will look for the specific data and format in the user input.
 
             Here is the user input:
@@ -46,15 +77,20 @@ class ExtractClaimQuery(Runnable):
         self.output_parser = PydanticOutputParser(pydantic_object=ClaimQueryType)
         self.format_instructions = self.output_parser.get_format_instructions()
 
-        self.chain = self.prompt | self.llm | self.output_parser
+        self.chain = with_deterministic_fallback(
+            self.prompt | self.llm | self.output_parser,
+            extract_claim_query_deterministic,
+        )
 
     def invoke(self, inputs):
-        result = self.chain.invoke({
-            "user_input": inputs["user_input"],
-            "chat_history": inputs["chat_history"],
-            "format_instructions": self.format_instructions,
-        })
-        return result
+        # Identical self-contained questions of any session share one extraction;
+        # each session still queries and answers with its own history
+        return coalesce_read(
+            "claim_info.extract",
+            inputs,
+            extract_claim_query_deterministic,
+            lambda: self.chain.invoke(self.chain_inputs(inputs)),
+        )
     
 class GetClaimInfoOutput(BaseModel):
     output: str
@@ -65,10 +101,10 @@ class GetClaimInfoChain(Runnable):
     args_schema: Type[BaseModel] = ClaimQueryType
     return_direct: bool = True
 
-    def __init__(self, memory=True):
-        # Initialize LLM and extract claim query information
-        self.llm = ChatOpenAI(model="gpt-4", temperature=0)
-        self.extract_chain = ExtractClaimQuery(self.llm)
+    def __init__(self, memory=True, registry=None):
+        # Initialize LLMs for each stage and extract claim query information
+        self.llm = get_llm("claim_info.response", registry)
+        self.extract_chain = ExtractClaimQuery(get_llm("claim_info.extract", registry))
 
         prompt_bot_return = PromptTemplate(
             system_template="""
@@ -102,68 +138,99 @@ class GetClaimInfoChain(Runnable):
         self.output_parser = PydanticOutputParser(pydantic_object=GetClaimInfoOutput)
         self.format_instructions = self.output_parser.get_format_instructions()
 
-        self.chain = self.prompt | self.llm | self.output_parser
-
-    def invoke(self, user_input, config):
-        # Connect to the claims database
-        con = sqlite3.connect("SecureShield/secure_shield.db")
-        cursor = con.cursor()
+        # Fall back to the raw operation status if the response stage times out
+        self.chain = with_deterministic_fallback(
+            self.prompt | self.llm | self.output_parser,
+            lambda inputs: GetClaimInfoOutput(output=inputs["status"]),
+        )
 
-        try:
-            query_info = self.extract_chain.invoke(user_input)
-            num_results = query_info.num_results
-            query_type = query_info.query_type
-            value = query_info.value
+    def run_query(self, query_info: ClaimQueryType, con, config) -> str:
+        """Run the extracted claim query and return the operation status."""
+        num_results = query_info.num_results
+        query_type = query_info.query_type
+        value = query_info.value
 
+        with span("claim_info.sql", query_type=query_type):
             if query_type == 'claim_status':
                 # Get claim status by claim_id
-                cursor.execute("SELECT status FROM Claims WHERE claim_id = ?", (value,))
-                result = cursor.fetchone()
+                result = con.execute("SELECT status FROM Claims WHERE claim_id = ?", (value,)).fetchone()
                 if result:
-                    self.status = f"The status of claim {value} is: {result[0]}"
+                    status = f"The status of claim {value} is: {result[0]}"
                 else:
-                    self.status = f"Claim {value} not found in the database."
+                    status = f"Claim {value} not found in the database."
 
             elif query_type == 'claims_by_client':
-                # Get claims for a client (either by name or client_id)
-                cursor.execute("SELECT claim_id, claim_type, status FROM Claims WHERE user_id = (SELECT client_id FROM Clients WHERE name = ? OR client_id = ?)", (value, value))
-                results = cursor.fetchall()
-                if results:
-                    self.status = f"Claims for client '{value}': {results}"
+                # Get claims for a client (either by name or client_id), resolved from the hot tables
+                title = f"Claims for client '{value}'"
+                hot_tables = get_hot_tables(database_path(con))
+                if hot_tables is None:
+                    sql = "SELECT claim_id, claim_type, status FROM Claims WHERE user_id = (SELECT client_id FROM Clients WHERE name = ? OR client_id = ?)"
+                    params = (value, value)
+                else:
+                    sql = "SELECT claim_id, claim_type, status FROM Claims WHERE user_id = ?"
+                    params = (hot_tables.resolve_client(value),)
+
+                if params[0] is None:
+                    # Unknown client: the same answer as an empty result set
+                    status = f"{title}: no results."
                 else:
-                    self.status = f"No claims found for client '{value}'."
+                    query = PagedQuery(sql=sql, params=params, key_column="claim_id", title=title)
+                    status = fetch_first_page(con, query, num_results, session_key(config)).render()
 
             elif query_type == 'claims_by_policy':
                 # Get claims for a policy (by policy_id)
-                cursor.execute("SELECT claim_id, claim_type, status FROM Claims WHERE policy_id = ?", (value,))
-                results = cursor.fetchall()
-                if results:
-                    self.status = f"Claims for policy {value}: {results}"
-                else:
-                    self.status = f"No claims found for policy {value}."
+                query = PagedQuery(
+                    sql="SELECT claim_id, claim_type, status FROM Claims WHERE policy_id = ?",
+                    params=(value,),
+                    key_column="claim_id",
+                    title=f"Claims for policy {value}",
+                )
+                status = fetch_first_page(con, query, num_results, session_key(config)).render()
 
             elif query_type == 'claim_details':
                 # Get full details of a specific claim
-                cursor.execute("SELECT * FROM Claims WHERE claim_id = ?", (value,))
-                result = cursor.fetchone()
-                if result:
-                    self.status = f"Claim details for claim_id {value}: {result}"
+                query = PagedQuery(
+                    sql="SELECT * FROM Claims WHERE claim_id = ?",
+                    params=(value,),
+                    key_column="claim_id",
+                    title=f"Claim details for claim_id {value}",
+                )
+                status = fetch_page(con, query, page_size=1).render()
+
+            elif query_type == 'next_page':
+                # Continue the previous result set of this conversation
+                page = fetch_next_page(con, session_key(config))
+                if page:
+                    status = page.render()
                 else:
-                    self.status = f"No details found for claim {value}."
+                    status = "There are no previous results to continue."
 
             else:
-                self.status = "Invalid query type."
+                status = "Invalid query type."
+
+        return status
 
+    def invoke(self, user_input, config):
+        # Connect to the claims database
+        con = connect()
+
+        try:
+            with span("claim_info.extract"):
+                query_info = self.extract_chain.invoke(user_input)
+            self.status = self.run_query(query_info, con, config)
         except Exception as e:
             self.status = f"Error: {e}"
+        finally:
+            con.close()
 
         # Generate the final response
-        response = self.chain.invoke({
-            "user_input": user_input['user_input'],
-            'chat_history': user_input['chat_history'],
-            "status": self.status,
-            "format_instructions": self.format_instructions
-        })
+        with span("claim_info.response"):
+            response = self.chain.invoke({
+                "user_input": user_input['user_input'],
+                'chat_history': user_input['chat_history'],
+                "status": self.status,
+                "format_instructions": self.format_instructions
+            })
 
         return response.output
 
@@ -1,12 +1,16 @@
-import sqlite3
-from Chains.Base import PromptTemplate, generate_prompt_templates
+import re
+from Chains.Base import BatchableChain, PromptTemplate, find_identifier, generate_prompt_templates, strip_dates
 from langchain.schema.runnable.base import Runnable
-from langchain_openai import ChatOpenAI
 from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel
 from typing import Type
 from langchain_community.tools import BaseTool
 from dotenv import load_dotenv
+from database import connect
+from result_sets import PagedQuery, fetch_first_page, fetch_next_page, fetch_page, session_key
+from model_registry import get_llm, with_deterministic_fallback
+from coalescing import coalesce_read
+from tracing import span
 
 load_dotenv()
 
@@ -15,7 +19,26 @@ class PolicyQueryType(BaseModel):
     value: str
     num_results: int = 5  # Default to 5 results if not specified
 
-class ExtractPolicyQuery(Runnable):
+def extract_policy_query_deterministic(inputs) -> PolicyQueryType:
+    """Model-free extraction used when the extraction stage exceeds its budget."""
+    lowered = strip_dates(inputs["user_input"].lower())
+    if re.search(r"\bnext (page|results)\b|\b(show|more) (more|results)\b", lowered):
+        return PolicyQueryType(query_type="next_page", value="")
+
+    for policy_type in ("House", "Health", "Car"):
+        if policy_type.lower() in lowered:
+            return PolicyQueryType(query_type="policies_by_type", value=policy_type)
+
+    query_type = "policies_by_client" if "client" in lowered else "policy_details"
+    value = find_identifier(lowered, ("client",) if query_type == "policies_by_client" else ("policy",))
+    if value is None:
+        ids = re.findall(r"\d+", lowered)
+        if not ids:
+            raise ValueError("No identifier found in the user input.")
+        value = ids[0]
+    return PolicyQueryType(query_type=query_type, value=value)
+
+class ExtractPolicyQuery(BatchableChain, Runnable):
     def __init__(self, llm, memory=False):
         super().__init__()
         self.llm = llm
@@ -27,7 +50,9 @@ class ExtractPolicyQuery(Runnable):
             - 'policy_details': Return full details of a policy by its policy_id.
             - 'policies_by_client': Return all policies associated with a particular client by client_id.
             - 'policies_by_type': Return all policies associated with a specific policy type (House, Health or Car).
+            - 'next_page': Return the next page of the previous policy results (value can be empty).
 
+            Set 'num_results' to the number of results the user asked for, if any.
             The system will look for the specific data and format in the user input.
 
             Here is the user input:
@@ -45,15 +70,20 @@ class ExtractPolicyQuery(Runnable):
         self.output_parser = PydanticOutputParser(pydantic_object=PolicyQueryType)
         self.format_instructions = self.output_parser.get_format_instructions()
 
-        self.chain = self.prompt | self.llm | self.output_parser
+        self.chain = with_deterministic_fallback(
+            self.prompt | self.llm | self.output_parser,
+            extract_policy_query_deterministic,
+        )
 
     def invoke(self, inputs):
-        result = self.chain.invoke({
-            "user_input": inputs["user_input"],
-            "chat_history": inputs["chat_history"],
-            "format_instructions": self.format_instructions,
-        })
-        return result
+        # Identical self-contained questions of any session share one extraction;
+        # each session still queries and answers with its own history
+        return coalesce_read(
+            "policy_info.extract",
+            inputs,
+            extract_policy_query_deterministic,
+            lambda: self.chain.invoke(self.chain_inputs(inputs)),
+        )
     
 class GetPolicyInfoOutput(BaseModel):
     output: str
@@ -64,10 +94,10 @@ class GetPolicyInfoChain(Runnable):
     args_schema: Type[BaseModel] = PolicyQueryType
     return_direct: bool = True
 
-    def __init__(self, memory=True):
-        # Initialize LLM and extract policy query information
-        self.llm = ChatOpenAI(model="gpt-4", temperature=0)
-        self.extract_chain = ExtractPolicyQuery(self.llm)
+    def __init__(self, memory=True, registry=None):
+        # Initialize LLMs for each stage and extract policy query information
+        self.llm = get_llm("policy_info.response", registry)
+        self.extract_chain = ExtractPolicyQuery(get_llm("policy_info.extract", registry))
 
         prompt_bot_return = PromptTemplate(
             system_template="""
@@ -100,59 +130,86 @@ class GetPolicyInfoChain(Runnable):
         self.output_parser = PydanticOutputParser(pydantic_object=GetPolicyInfoOutput)
         self.format_instructions = self.output_parser.get_format_instructions()
 
-        self.chain = self.prompt | self.llm | self.output_parser
-
-    def invoke(self, user_input, config):
-        # Connect to the policies database
-        con = sqlite3.connect("SecureShield/secure_shield.db")
-        cursor = con.cursor()
+        # Fall back to the raw operation status if the response stage times out
+        self.chain = with_deterministic_fallback(
+            self.prompt | self.llm | self.output_parser,
+            lambda inputs: GetPolicyInfoOutput(output=inputs["status"]),
+        )
 
-        try:
-            query_info = self.extract_chain.invoke(user_input)
-            num_results = query_info.num_results
-            query_type = query_info.query_type
-            value = query_info.value
+    def run_query(self, query_info: PolicyQueryType, con, config) -> str:
+        """Run the extracted policy query and return the operation status."""
+        num_results = query_info.num_results
+        query_type = query_info.query_type
+        value = query_info.value
 
+        with span("policy_info.sql", query_type=query_type):
             if query_type == 'policy_details':
                 # Get full details of a specific policy
-                cursor.execute("SELECT * FROM Policies WHERE policy_id = ?", (value,))
-                result = cursor.fetchone()
-                if result:
-                    self.status = f"Policy details for policy_id {value}: {result}"
-                else:
-                    self.status = f"No details found for policy {value}."
+                query = PagedQuery(
+                    sql="SELECT * FROM Policies WHERE policy_id = ?",
+                    params=(value,),
+                    key_column="policy_id",
+                    title=f"Policy details for policy_id {value}",
+                    cache_lookup="policy",
+                )
+                status = fetch_page(con, query, page_size=1).render()
 
             elif query_type == 'policies_by_client':
                 # Get policies for a client (either by name or client_id)
-                cursor.execute("SELECT policy_id, policy_type, policy_level FROM Policies WHERE user_id = (SELECT client_id FROM Clients WHERE name = ? OR client_id = ?)", (value, value))
-                results = cursor.fetchall()
-                if results:
-                    self.status = f"Policies for client '{value}': {results}"
-                else:
-                    self.status = f"No policies found for client '{value}'."
+                query = PagedQuery(
+                    sql="SELECT policy_id, policy_type, policy_level FROM Policies WHERE user_id = (SELECT client_id FROM Clients WHERE name = ? OR client_id = ?)",
+                    params=(value, value),
+                    key_column="policy_id",
+                    title=f"Policies for client '{value}'",
+                    cache_lookup="policies_by_client",
+                )
+                status = fetch_first_page(con, query, num_results, session_key(config)).render()
 
             elif query_type == 'policies_by_type':
                 # Get policies by type (e.g., Health, Car)
-                cursor.execute("SELECT policy_id, user_id, policy_level FROM Policies WHERE policy_type = ?", (value,))
-                results = cursor.fetchall()
-                if results:
-                    self.status = f"Policies of type '{value}': {results}"
+                query = PagedQuery(
+                    sql="SELECT policy_id, user_id, policy_level FROM Policies WHERE policy_type = ?",
+                    params=(value,),
+                    key_column="policy_id",
+                    title=f"Policies of type '{value}'",
+                    cache_lookup="policies_by_type",
+                )
+                status = fetch_first_page(con, query, num_results, session_key(config)).render()
+
+            elif query_type == 'next_page':
+                # Continue the previous result set of this conversation
+                page = fetch_next_page(con, session_key(config))
+                if page:
+                    status = page.render()
                 else:
-                    self.status = f"No policies found for type '{value}'."
+                    status = "There are no previous results to continue."
 
             else:
-                self.status = "Invalid query type."
+                status = "Invalid query type."
 
+        return status
+
+    def invoke(self, user_input, config):
+        # Connect to the policies database
+        con = connect()
+
+        try:
+            with span("policy_info.extract"):
+                query_info = self.extract_chain.invoke(user_input)
+            self.status = self.run_query(query_info, con, config)
         except Exception as e:
             self.status = f"Error: {e}"
+        finally:
+            con.close()
 
         # Generate the final response
-        response = self.chain.invoke({
-            "user_input": user_input['user_input'],
-            'chat_history': user_input['chat_history'],
-            "status": self.status,
-            "format_instructions": self.format_instructions
-        })
+        with span("policy_info.response"):
+            response = self.chain.invoke({
+                "user_input": user_input['user_input'],
+                'chat_history': user_input['chat_history'],
+                "status": self.status,
+                "format_instructions": self.format_instructions
+            })
 
         return response.output
     
@@ -1,21 +1,35 @@
-from Chains.Base import PromptTemplate, generate_prompt_templates
+from Chains.Base import BatchableChain, PromptTemplate, generate_prompt_templates
 from langchain.schema.runnable.base import Runnable
-from langchain_openai import ChatOpenAI
 from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel
 from dotenv import load_dotenv
+from model_registry import get_llm, with_deterministic_fallback
 
 load_dotenv()
 
 class Format(BaseModel):
     is_prompt_injection: bool 
 
+class UnverifiedInput(Format):
+    """Verdict given when the classifier could not check the input."""
 
-class IsPromptInjection(Runnable):
-    def __init__(self): 
+    is_prompt_injection: bool = True
+
+def refuse_unverified_input(inputs) -> Format:
+    """Fail closed: an input the classifier could not check is treated as an injection.
+
+    Used when the classification stage times out, is shed by the scheduler
+    or returns an unparsable answer, so slowing the classifier down never
+    lets an input through.
+    """
+    return UnverifiedInput()
+
+
+class IsPromptInjection(BatchableChain, Runnable):
+    def __init__(self, registry=None):
         super().__init__()
 
-        self.llm = ChatOpenAI(model='gpt-4o-mini', temperature=0.0)
+        self.llm = get_llm("prompt_injection.classify", registry)
 
         prompt_template = PromptTemplate(
             system_template=""" 
@@ -56,14 +70,13 @@ class IsPromptInjection(Runnable):
         self.output_parser = PydanticOutputParser(pydantic_object=Format)
         self.format_instructions = self.output_parser.get_format_instructions()
 
-        self.chain = self.prompt | self.llm | self.output_parser
+        self.chain = with_deterministic_fallback(
+            self.prompt | self.llm | self.output_parser,
+            refuse_unverified_input,
+        )
 
+    def chain_inputs(self, inputs) -> dict:
+        return {"user_input": inputs["user_input"], "format_instructions": self.format_instructions}
 
     def invoke(self, inputs):
-        result = self.chain.invoke(
-            {
-                "user_input": inputs["user_input"],
-                "format_instructions": self.format_instructions,
-            })
-        
-        return result
\ No newline at end of file
+        return self.chain.invoke(self.chain_inputs(inputs))
@@ -1,24 +1,100 @@
-from Chains.Base import PromptTemplate, generate_prompt_templates
-from pydantic import BaseModel
+from Chains.Base import BatchableChain, PromptTemplate, generate_prompt_templates, strip_dates
+from pydantic import BaseModel, Field
 from langchain import callbacks
 from langchain.tools import BaseTool
 from langchain.schema.runnable.base import Runnable
 from langchain.output_parsers import PydanticOutputParser
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
-from typing import Type
+from typing import List, Optional, Type
+import re
 import sqlite3
 from dotenv import load_dotenv
+from claim_updates import (
+    ClaimIdRange,
+    ClaimSelection,
+    UpdateResult,
+    parse_confirmation,
+    pop_pending_update,
+    remember_pending_update,
+    update_claim_statuses,
+)
+from database import connect
+from model_registry import get_llm, with_deterministic_fallback
+from result_sets import session_key
+from tracing import span
 
 load_dotenv()
 
+# Answer when the update cannot be extracted reliably; nothing is written
+REPHRASE_MESSAGE = (
+    "I could not reliably work out which claims to update, so nothing was changed. "
+    "Please rephrase the request, e.g. \"Set claim 12 to approved\"."
+)
+
+# Appended to previews; the update is only written after this explicit reply
+CONFIRMATION_REQUEST = "Reply **confirm** to apply this update or **cancel** to discard it."
+
 # Define data models for the claim information
-class ClaimUpdate(BaseModel):
-    claim_id: int
-    status: str
+class ClaimUpdate(ClaimSelection):
+    status: str = Field(description="New status of the claims: approved, denied or pending")
+    dry_run: bool = Field(default=False, description="Only preview how many claims would change")
+
+STATUS_WORDS = {
+    "approve": "approved", "approved": "approved", "accept": "approved", "accepted": "approved",
+    "deny": "denied", "denied": "denied", "reject": "denied", "rejected": "denied",
+    "pending": "pending", "reopen": "pending",
+}
+
+# Claim ids and ranges named after "claim(s)", e.g. "claims 3, 5 and 101-180"
+CLAIM_NUMBER = r"\d+(?:\s*(?:-|\u2013|to|through)\s*\d+)?"
+CLAIM_LIST_PATTERN = re.compile(
+    rf"\bclaims?\s*(?:ids?\s*)?(?:numbers?\s*)?#?\s*({CLAIM_NUMBER}(?:\s*(?:,|and|&|or)\s*#?\s*{CLAIM_NUMBER})*)"
+)
+CLAIM_RANGE_PATTERN = re.compile(r"(\d+)\s*(?:-|\u2013|to|through)\s*(\d+)")
+
+def extract_claim_update_deterministic(inputs) -> ClaimUpdate:
+    """Model-free extraction of a claim update.
+
+    Only used by the offline fakes; real updates are always extracted by the
+    model, and the chain refuses to write when that stage fails.
+    """
+    text = strip_dates(inputs["user_input"].lower())
+
+    target = re.search(r"\b(?:to|as)\s+(approved|denied|pending)\b", text)
+    verb = re.search(r"\b(approve|accept|deny|reject|reopen)\b", text)
+    current = re.search(r"\b(approved|denied|pending)\s+claims\b", text)
+    if target:
+        status = target.group(1)
+    elif verb:
+        status = STATUS_WORDS[verb.group(1)]
+    else:
+        mentioned = re.findall(r"\b(approved|denied|pending)\b", text)
+        if not mentioned:
+            raise ValueError("Could not identify the new claim status.")
+        status = mentioned[-1]
+
+    # Only numbers named as claims select claims; clients, policies and dates do not
+    policy = re.search(r"\bpolic(?:y|ies)\s*(?:id\s*)?#?\s*(\d+)", text)
+    claim_ids: List[int] = []
+    ranges: List[ClaimIdRange] = []
+    for claim_list in CLAIM_LIST_PATTERN.findall(text):
+        ranges += [ClaimIdRange(start=int(start), end=int(end)) for start, end in CLAIM_RANGE_PATTERN.findall(claim_list)]
+        claim_ids += [int(claim_id) for claim_id in re.findall(r"\d+", CLAIM_RANGE_PATTERN.sub(" ", claim_list))]
+
+    update = ClaimUpdate(
+        claim_ids=claim_ids,
+        ranges=ranges,
+        policy_id=int(policy.group(1)) if policy else None,
+        current_status=current.group(1) if current and current.group(1) != status else None,
+        status=status,
+        dry_run=bool(re.search(r"\b(preview|how many)\b", text)),
+    )
+    if update.is_empty():
+        raise ValueError("Could not identify which claims to update.")
+    return update
 
 # Define a class to extract claim ID and status from the user input
-class ExtractClaimToUpdate(Runnable):
+class ExtractClaimToUpdate(BatchableChain, Runnable):
     def __init__(self, llm, memory=False):
         super().__init__()
         self.llm = llm
@@ -26,12 +102,15 @@ class ExtractClaimToUpdate(Runnable):
         prompt_template = PromptTemplate(
             system_template=""" 
             You are a part of the database manager team for a insurance company platform. 
-            Given the user input, your task is to identify the claim id of the claim that the employee wants to update,\
+            Given the user input, your task is to identify the claims that the employee wants to update,\
             and which status they want update to.
-            Return the claim id and the status.
+            The employee may refer to one claim, a list of claim ids, ranges of claim ids (e.g. "claims 101-180"),\
+            or filters such as the policy id and the current status of the claims (e.g. "reject all pending claims on policy 7").
+            Return the claim ids, the ranges, the policy id and current status filters, and the new status.
+            Set dry_run to true only if the employee asks to preview or count the claims without changing them.
 
-            The system will search for the claim id in the database based on your extraction from the user input. 
-            Ensure you extract the claim ID and the status as accurately as possible.
+            The system will update every claim matching your extraction in the database. 
+            Ensure you extract the claims and the status as accurately as possible and leave unused filters empty.
             You can also take into consideration the chat history between you and the user.
             
             Here is the user input:
@@ -49,36 +128,33 @@ class ExtractClaimToUpdate(Runnable):
         self.output_parser = PydanticOutputParser(pydantic_object=ClaimUpdate)
         self.format_instructions = self.output_parser.get_format_instructions()
 
+        # No model-free fallback: a misread message must never select claims to write
         self.chain = self.prompt | self.llm | self.output_parser
 
     def invoke(self, inputs):
-        result = self.chain.invoke(
-            {
-                "user_input": inputs["user_input"],
-                "chat_history": inputs["chat_history"],
-                "format_instructions": self.format_instructions,
-            }
-        )
-        return result
+        return self.chain.invoke(self.chain_inputs(inputs))
 
 # Define the class to perform the claim status update operation
 class UpdateClaimStatusOutput(BaseModel):
     output: str
 
 class UpdateClaimStatusChain(Runnable):
-    def __init__(self, memory: bool = True) -> str:
-        self.llm = ChatOpenAI(model="gpt-4", temperature=0)
-        self.extract_chain = ExtractClaimToUpdate(self.llm)
+    def __init__(self, memory: bool = True, registry=None) -> str:
+        self.llm = get_llm("update_claim.response", registry)
+        self.extract_chain = ExtractClaimToUpdate(get_llm("update_claim.extract", registry))
         
         prompt_bot_return = PromptTemplate( 
             system_template = """
             You are a part of the database manager team for insurance company called SecureShield. 
-            The employee asked for an update in a claim status. 
+            The employee asked for an update in the status of one or more claims. 
 
-            There are 3 possible outcomes:
-            - The claim status was successfully updated ('success').
-            - The claim was not found ('not_found').
-            - There was an error updating the claim status ('error').
+            There are 5 possible outcomes:
+            - The claim statuses were successfully updated ('success'), with the number of claims per previous status.
+            - The update was previewed ('preview'), with the number of claims per status that would be updated.\
+              Nothing was changed yet; the system asks the employee for a confirmation separately.
+            - The employee cancelled a previewed update ('cancelled').
+            - No claim was found ('not_found').
+            - There was an error updating the claim statuses ('error').
 
             Given the employee input, the chat history and the operation status, your task is to return to the employee a message stating the result of the operation in a friendly way.
             Do not greet the user in the beggining of the message as this is already in the middle of the conversation.
@@ -100,45 +176,78 @@ class UpdateClaimStatusChain(Runnable):
         self.prompt = generate_prompt_templates(prompt_bot_return, memory=memory)
         self.output_parser = PydanticOutputParser(pydantic_object=UpdateClaimStatusOutput)
         self.format_instructions = self.output_parser.get_format_instructions()
-        self.chain = (self.prompt | self.llm | self.output_parser).with_config({"run_name": self.__class__.__name__})
+        # Fall back to the raw operation status if the response stage times out
+        self.chain = with_deterministic_fallback(
+            self.prompt | self.llm | self.output_parser,
+            lambda inputs: UpdateClaimStatusOutput(output=f"Claim update status: {inputs['status']}"),
+        ).with_config({"run_name": self.__class__.__name__})
 
-    def invoke(self, user_input, config):
-        claim_info = self.extract_chain.invoke(user_input)
-        claim_id = claim_info.claim_id
-        status = claim_info.status
+    def apply_update(self, claim_update: ClaimUpdate, con, confirmed_matched: Optional[int] = None) -> UpdateResult:
+        """Apply the extracted update, or preview it if it needs a confirmation.
 
-        # Update claim status in the database
-        con = sqlite3.connect("SecureShield/secure_shield.db")
-        cursor = con.cursor()
+        Raises:
+            ValueError: If the update is invalid or selects too many claims.
+            sqlite3.OperationalError: If the database is locked or unavailable.
+        """
+        with span("update_claim.sql") as sql_span:
+            result = update_claim_statuses(
+                con, claim_update, claim_update.status, dry_run=claim_update.dry_run, confirmed_matched=confirmed_matched
+            )
+            sql_span.set("matched", result.matched)
+            sql_span.set("applied", result.applied)
+            return result
 
-        cursor.execute(f"SELECT claim_id FROM Claims WHERE claim_id = ?", (claim_id,))
-        query_results = cursor.fetchone()
+    def invoke(self, user_input, config):
+        session = session_key(config)
+        confirmation = parse_confirmation(user_input["user_input"])
+        pending = pop_pending_update(session)
 
-        if not query_results: 
-            self.status = 'not_found'
+        if pending is not None and confirmation is False:
+            self.status = "cancelled: the previewed update was discarded; nothing was changed."
+            claim_update = None
         else:
+            if pending is not None and confirmation:
+                # Apply exactly what was previewed, if it still selects the same number of claims
+                claim_update = ClaimUpdate(**pending.selection.model_dump(), status=pending.new_status)
+                confirmed_matched = pending.matched
+            else:
+                try:
+                    with span("update_claim.extract"):
+                        claim_update = self.extract_chain.invoke(user_input)
+                except Exception as e:
+                    print(f"Error: {e}")
+                    return REPHRASE_MESSAGE
+                confirmed_matched = None
+
+            # Update the status of all selected claims in one transaction
+            con = connect()
             try:
-                cursor.execute(
-                    "UPDATE Claims SET status = ? WHERE claim_id = ?",
-                    (status, claim_id)
-                )
-                con.commit()
-                self.status = 'success'
-            except sqlite3.OperationalError as e:
+                result = self.apply_update(claim_update, con, confirmed_matched)
+                self.status = result.describe()
+            except (ValueError, sqlite3.OperationalError) as e:
                 print(f"Error: {e}")
-                self.status = 'error'
+                result = None
+                self.status = f"error: {e}"
             finally:
-                cursor.close()
                 con.close()
 
+            # Dry runs only count the claims, so there is nothing to confirm
+            if result is not None and result.needs_confirmation:
+                remember_pending_update(session, claim_update, result)
+            else:
+                claim_update = None
+
         #Generate response based on status
-        response = self.chain.invoke({
-            "user_input": user_input['user_input'],
-            'chat_history': user_input['chat_history'], 
-            "status": self.status,
-            "format_instructions": self.format_instructions
-        })
+        with span("update_claim.response"):
+            response = self.chain.invoke({
+                "user_input": user_input['user_input'],
+                'chat_history': user_input['chat_history'], 
+                "status": self.status,
+                "format_instructions": self.format_instructions
+            })
 
+        if claim_update is not None:
+            return f"{response.output}\n\n{CONFIRMATION_REQUEST}"
         return response.output
 
 
@@ -0,0 +1,274 @@
+# Import necessary modules and classes
+import sqlite3
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from result_sets import MAX_PAGE_SIZE, ResultPage
+
+# Dimensions kept in the ClaimStats summary table
+SUMMARY_DIMENSIONS = ("policy_type", "claim_type", "status")
+
+# Additional dimensions answered ad hoc from the raw rows with pandas
+ADHOC_DIMENSIONS = ("policy_level", "submission_month", "client")
+
+# Supported metrics and their SQL expression over ClaimStats
+METRICS = {
+    "count": "SUM(claim_count)",
+    "amount_claimed": "ROUND(SUM(amount_claimed), 2)",
+    "amount_approved": "ROUND(SUM(amount_approved), 2)",
+    "average_claimed": "ROUND(SUM(amount_claimed) / SUM(claim_count), 2)",
+}
+
+# Summary table of Claims joined with Policies
+STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS ClaimStats (
+    policy_type TEXT NOT NULL,
+    claim_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    claim_count INTEGER NOT NULL DEFAULT 0,
+    amount_claimed REAL NOT NULL DEFAULT 0,
+    amount_approved REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (policy_type, claim_type, status)
+)
+"""
+
+# Adds the amounts of the claims matching the trigger's WHERE clause to their groups
+_ADD_POLICY_CLAIMS = """
+    INSERT INTO ClaimStats (policy_type, claim_type, status, claim_count, amount_claimed, amount_approved)
+    SELECT {policy_type}, claim_type, status, COUNT(*), SUM(amount_claimed), COALESCE(SUM(amount_approved), 0)
+    FROM Claims WHERE policy_id = {policy_id}
+    GROUP BY claim_type, status
+    ON CONFLICT (policy_type, claim_type, status) DO UPDATE SET
+        claim_count = claim_count + excluded.claim_count,
+        amount_claimed = amount_claimed + excluded.amount_claimed,
+        amount_approved = amount_approved + excluded.amount_approved;
+"""
+
+# Subtracts the amounts of the claims of a policy from the groups of its old type
+_REMOVE_POLICY_CLAIMS = """
+    UPDATE ClaimStats SET
+        claim_count = claim_count - (SELECT COUNT(*) FROM Claims c
+            WHERE c.policy_id = OLD.policy_id AND c.claim_type = ClaimStats.claim_type AND c.status = ClaimStats.status),
+        amount_claimed = amount_claimed - (SELECT COALESCE(SUM(c.amount_claimed), 0) FROM Claims c
+            WHERE c.policy_id = OLD.policy_id AND c.claim_type = ClaimStats.claim_type AND c.status = ClaimStats.status),
+        amount_approved = amount_approved - (SELECT COALESCE(SUM(c.amount_approved), 0) FROM Claims c
+            WHERE c.policy_id = OLD.policy_id AND c.claim_type = ClaimStats.claim_type AND c.status = ClaimStats.status)
+    WHERE policy_type = OLD.policy_type;
+"""
+
+# Triggers keeping ClaimStats in sync. Every change to Claims, or to the type
+# or existence of a Policy, moves its amounts from the old group to the new
+# one, so the table never needs a full rebuild.
+STATS_TRIGGERS = {
+    "claim_stats_insert": """
+CREATE TRIGGER IF NOT EXISTS claim_stats_insert AFTER INSERT ON Claims
+BEGIN
+    INSERT INTO ClaimStats (policy_type, claim_type, status, claim_count, amount_claimed, amount_approved)
+    SELECT COALESCE((SELECT policy_type FROM Policies WHERE policy_id = NEW.policy_id), 'Unknown'),
+           NEW.claim_type, NEW.status, 1, NEW.amount_claimed, COALESCE(NEW.amount_approved, 0)
+    WHERE true
+    ON CONFLICT (policy_type, claim_type, status) DO UPDATE SET
+        claim_count = claim_count + excluded.claim_count,
+        amount_claimed = amount_claimed + excluded.amount_claimed,
+        amount_approved = amount_approved + excluded.amount_approved;
+END
+""",
+    "claim_stats_delete": """
+CREATE TRIGGER IF NOT EXISTS claim_stats_delete AFTER DELETE ON Claims
+BEGIN
+    UPDATE ClaimStats SET
+        claim_count = claim_count - 1,
+        amount_claimed = amount_claimed - OLD.amount_claimed,
+        amount_approved = amount_approved - COALESCE(OLD.amount_approved, 0)
+    WHERE policy_type = COALESCE((SELECT policy_type FROM Policies WHERE policy_id = OLD.policy_id), 'Unknown')
+      AND claim_type = OLD.claim_type AND status = OLD.status;
+END
+""",
+    "claim_stats_update": """
+CREATE TRIGGER IF NOT EXISTS claim_stats_update
+AFTER UPDATE OF policy_id, claim_type, status, amount_claimed, amount_approved ON Claims
+BEGIN
+    UPDATE ClaimStats SET
+        claim_count = claim_count - 1,
+        amount_claimed = amount_claimed - OLD.amount_claimed,
+        amount_approved = amount_approved - COALESCE(OLD.amount_approved, 0)
+    WHERE policy_type = COALESCE((SELECT policy_type FROM Policies WHERE policy_id = OLD.policy_id), 'Unknown')
+      AND claim_type = OLD.claim_type AND status = OLD.status;
+    INSERT INTO ClaimStats (policy_type, claim_type, status, claim_count, amount_claimed, amount_approved)
+    SELECT COALESCE((SELECT policy_type FROM Policies WHERE policy_id = NEW.policy_id), 'Unknown'),
+           NEW.claim_type, NEW.status, 1, NEW.amount_claimed, COALESCE(NEW.amount_approved, 0)
+    WHERE true
+    ON CONFLICT (policy_type, claim_type, status) DO UPDATE SET
+        claim_count = claim_count + excluded.claim_count,
+        amount_claimed = amount_claimed + excluded.amount_claimed,
+        amount_approved = amount_approved + excluded.amount_approved;
+END
+""",
+    "claim_stats_policy_type": f"""
+CREATE TRIGGER IF NOT EXISTS claim_stats_policy_type AFTER UPDATE OF policy_type ON Policies
+WHEN OLD.policy_type IS NOT NEW.policy_type
+BEGIN{_REMOVE_POLICY_CLAIMS}{_ADD_POLICY_CLAIMS.format(policy_type="NEW.policy_type", policy_id="NEW.policy_id")}END
+""",
+    # The claims of a deleted policy are counted under 'Unknown', like claims of a missing one
+    "claim_stats_policy_delete": f"""
+CREATE TRIGGER IF NOT EXISTS claim_stats_policy_delete AFTER DELETE ON Policies
+BEGIN{_REMOVE_POLICY_CLAIMS}{_ADD_POLICY_CLAIMS.format(policy_type="'Unknown'", policy_id="OLD.policy_id")}END
+""",
+}
+
+
+class ClaimsAnalyticsQuery(BaseModel):
+    """An aggregate question over the claims."""
+
+    metric: str = Field(default="count", description=f"One of: {', '.join(METRICS)}")
+    group_by: List[str] = Field(
+        default_factory=list,
+        description=f"Breakdown dimensions, any of: {', '.join(SUMMARY_DIMENSIONS + ADHOC_DIMENSIONS)}",
+    )
+    status: Optional[str] = Field(default=None, description="Only claims with this status")
+    policy_type: Optional[str] = Field(default=None, description="Only claims of policies of this type")
+    claim_type: Optional[str] = Field(default=None, description="Only claims of this type")
+
+
+def _rebuild_claim_stats(con: sqlite3.Connection) -> None:
+    con.execute("DELETE FROM ClaimStats")
+    con.execute(
+        """
+        INSERT INTO ClaimStats (policy_type, claim_type, status, claim_count, amount_claimed, amount_approved)
+        SELECT COALESCE(p.policy_type, 'Unknown'), c.claim_type, c.status,
+               COUNT(*), SUM(c.amount_claimed), COALESCE(SUM(c.amount_approved), 0)
+        FROM Claims c LEFT JOIN Policies p ON p.policy_id = c.policy_id
+        GROUP BY 1, 2, 3
+        """
+    )
+
+
+def rebuild_claim_stats(con: sqlite3.Connection) -> None:
+    """Recompute the ClaimStats summary table from the Claims table."""
+    with con:
+        _rebuild_claim_stats(con)
+
+
+def install_claim_stats(con: sqlite3.Connection) -> None:
+    """Create the summary table and its triggers, backfilling it if any trigger was missing.
+
+    Part of the database migration; runs in one transaction, so concurrent
+    migrations and writes never see a partially built table.
+    """
+    with con:
+        con.execute("BEGIN IMMEDIATE")
+        installed = {
+            name
+            for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'claim_stats_%'")
+        }
+        con.execute(STATS_TABLE)
+        for statement in STATS_TRIGGERS.values():
+            con.execute(statement)
+        if not set(STATS_TRIGGERS) <= installed:
+            _rebuild_claim_stats(con)
+
+
+def has_claim_stats(con: sqlite3.Connection) -> bool:
+    """Return whether the database was migrated with the ClaimStats summary table."""
+    return con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ClaimStats'").fetchone() is not None
+
+
+def _where(query: ClaimsAnalyticsQuery, columns: dict):
+    conditions, params = [], []
+    for field in ("status", "policy_type", "claim_type"):
+        value = getattr(query, field)
+        if value:
+            conditions.append(f"LOWER({columns[field]}) = LOWER(?)")
+            params.append(value)
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def _title(query: ClaimsAnalyticsQuery) -> str:
+    filters = [f"{field}={getattr(query, field)}" for field in ("status", "policy_type", "claim_type") if getattr(query, field)]
+    title = f"Claims {query.metric}"
+    if query.group_by:
+        title += f" by {', '.join(query.group_by)}"
+    if filters:
+        title += f" ({', '.join(filters)})"
+    return title
+
+
+def summarize_claims(con: sqlite3.Connection, query: ClaimsAnalyticsQuery) -> ResultPage:
+    """Answer an aggregate question, from ClaimStats when possible.
+
+    Breakdowns by the summary dimensions read the small summary table only,
+    once the database is migrated. Other dimensions fall back to a vectorized pandas group-by over the rows
+    matching the filters.
+
+    Raises:
+        ValueError: If the metric or a dimension is not supported.
+    """
+    if query.metric not in METRICS:
+        raise ValueError(f"Unsupported metric '{query.metric}'.")
+    unknown = set(query.group_by) - set(SUMMARY_DIMENSIONS + ADHOC_DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unsupported breakdown: {', '.join(sorted(unknown))}.")
+    if not set(query.group_by) <= set(SUMMARY_DIMENSIONS) or not has_claim_stats(con):
+        return summarize_claims_adhoc(con, query)
+
+    where, params = _where(query, {field: field for field in SUMMARY_DIMENSIONS})
+    where += (" AND" if where else " WHERE") + " claim_count > 0"
+    dimensions = ", ".join(query.group_by)
+    sql = f"SELECT {dimensions + ', ' if dimensions else ''}{METRICS[query.metric]} AS {query.metric} FROM ClaimStats{where}"
+    if dimensions:
+        sql += f" GROUP BY {dimensions} ORDER BY {dimensions}"
+    cursor = con.execute(sql, params)
+    columns = [description[0] for description in cursor.description]
+    rows = [tuple(0 if value is None else value for value in row) for row in cursor]
+    return ResultPage(title=_title(query), columns=columns, rows=rows, has_more=False)
+
+
+def summarize_claims_adhoc(con: sqlite3.Connection, query: ClaimsAnalyticsQuery) -> ResultPage:
+    """Answer an aggregate question with a pandas group-by over the raw rows."""
+    import pandas as pd
+
+    where, params = _where(
+        query, {"status": "c.status", "policy_type": "p.policy_type", "claim_type": "c.claim_type"}
+    )
+    frame = pd.read_sql_query(
+        "SELECT c.claim_type, c.status, c.submission_date, c.amount_claimed, c.amount_approved, "
+        "p.policy_type, p.policy_level, cl.name AS client "
+        "FROM Claims c LEFT JOIN Policies p ON p.policy_id = c.policy_id "
+        f"LEFT JOIN Clients cl ON cl.client_id = c.user_id{where}",
+        con,
+        params=params,
+    )
+    frame["submission_month"] = pd.to_datetime(frame["submission_date"], errors="coerce").dt.strftime("%Y-%m")
+    frame["amount_approved"] = frame["amount_approved"].fillna(0)
+
+    if query.group_by:
+        grouped = frame.groupby(query.group_by, dropna=False)
+        aggregates = grouped.agg(
+            count=("claim_type", "size"),
+            amount_claimed=("amount_claimed", "sum"),
+            amount_approved=("amount_approved", "sum"),
+        )
+    else:
+        aggregates = pd.DataFrame(
+            {
+                "count": [len(frame)],
+                "amount_claimed": [frame["amount_claimed"].sum()],
+                "amount_approved": [frame["amount_approved"].sum()],
+            }
+        )
+    aggregates["average_claimed"] = aggregates["amount_claimed"] / aggregates["count"].where(aggregates["count"] > 0)
+    result = aggregates[[query.metric]].round(2).fillna(0)
+    # Keep the largest groups when a breakdown has too many to show
+    has_more = len(result) > MAX_PAGE_SIZE
+    if has_more:
+        result = result.nlargest(MAX_PAGE_SIZE, query.metric)
+    if query.group_by:
+        result = result.reset_index()
+
+    return ResultPage(
+        title=_title(query),
+        columns=list(result.columns),
+        rows=list(result.itertuples(index=False, name=None)),
+        has_more=has_more,
+    )
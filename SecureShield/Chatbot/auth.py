@@ -0,0 +1,197 @@
+# Import necessary modules and classes
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+from .database import connect
+
+# scrypt cost parameters; raise SECURESHIELD_SCRYPT_N as hardware gets faster
+SCRYPT_N = int(os.getenv("SECURESHIELD_SCRYPT_N", str(2**14)))
+SCRYPT_R = int(os.getenv("SECURESHIELD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("SECURESHIELD_SCRYPT_P", "1"))
+
+# Lifetime of a session token in seconds
+SESSION_TTL = float(os.getenv("SECURESHIELD_SESSION_TTL", str(12 * 3600)))
+
+# Marks a legacy plaintext password replaced by a hash; never accepted as a password
+DISABLED_PASSWORD_PREFIX = "!disabled$"
+
+# Password hashes computed at once; bounds CPU and memory during login bursts
+MAX_CONCURRENT_HASHES = int(os.getenv("SECURESHIELD_AUTH_MAX_CONCURRENCY", str(os.cpu_count() or 2)))
+
+
+class Session(BaseModel):
+    """An authenticated employee session."""
+
+    token: str
+    employee_id: int
+    first_name: str
+    email: str
+    conversation_id: str
+    expires_at: float
+
+
+class AuthenticationError(Exception):
+    """Raised when an email is unknown or a password is wrong."""
+
+
+def hash_password(password: str, salt: Optional[bytes] = None) -> Tuple[str, str]:
+    """Hash a password with scrypt.
+
+    Returns:
+        The encoded hash ('scrypt$n$r$p$hex') and the hex salt. The cost
+        parameters are kept in the hash so they can be raised later.
+    """
+    salt = salt or secrets.token_bytes(16)
+    digest = hashlib.scrypt(
+        password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, maxmem=256 * SCRYPT_N * SCRYPT_R
+    )
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${digest.hex()}", salt.hex()
+
+
+def _verify_hash(password: str, encoded: str, salt_hex: str) -> bool:
+    _, n, r, p, expected = encoded.split("$")
+    digest = hashlib.scrypt(
+        password.encode(), salt=bytes.fromhex(salt_hex), n=int(n), r=int(r), p=int(p), maxmem=256 * int(n) * int(r)
+    )
+    return hmac.compare_digest(digest.hex(), expected)
+
+
+def _needs_rehash(encoded: str) -> bool:
+    return encoded.split("$")[1:4] != [str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+
+
+def ensure_auth_columns(con) -> None:
+    """Add the password hash and salt columns to an existing Employees table."""
+    columns = {row[1] for row in con.execute("PRAGMA table_info(Employees)")}
+    with con:
+        if "password_hash" not in columns:
+            con.execute("ALTER TABLE Employees ADD COLUMN password_hash TEXT")
+        if "password_salt" not in columns:
+            con.execute("ALTER TABLE Employees ADD COLUMN password_salt TEXT")
+
+
+class AuthService:
+    """Authenticates employees and keeps their sessions in memory.
+
+    A login is a single lookup on the unique email index returning the hash,
+    salt and first name, followed by a scrypt verification outside any
+    database transaction. Legacy plaintext passwords are verified once and
+    upgraded to a hash. Issued tokens are validated from memory only.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, Session] = {}
+        self._lock = threading.Lock()
+        self._hash_slots = threading.BoundedSemaphore(MAX_CONCURRENT_HASHES)
+        self._schema_checked = False
+
+    def login(self, email: str, password: str) -> Session:
+        """Verify the credentials and open a new conversation.
+
+        Raises:
+            AuthenticationError: If the email is unknown or the password is wrong.
+        """
+        con = connect()
+        try:
+            if not self._schema_checked:
+                ensure_auth_columns(con)
+                self._schema_checked = True
+
+            row = con.execute(
+                "SELECT employee_id, first_name, password_hash, password_salt, password FROM Employees WHERE email = ?",
+                (email,),
+            ).fetchone()
+            if row is None:
+                raise AuthenticationError("Email not registered")
+            employee_id, first_name, password_hash, password_salt, legacy_password = row
+
+            with self._hash_slots:
+                if password_hash:
+                    valid = _verify_hash(password, password_hash, password_salt)
+                    upgrade = valid and _needs_rehash(password_hash)
+                else:
+                    valid = (
+                        bool(legacy_password)
+                        and not legacy_password.startswith(DISABLED_PASSWORD_PREFIX)
+                        and hmac.compare_digest(legacy_password.encode(), password.encode())
+                    )
+                    upgrade = valid
+                new_hash = hash_password(password) if upgrade else None
+            if not valid:
+                raise AuthenticationError("Incorrect password")
+
+            # Start a new conversation and store an upgraded hash in one write
+            with con:
+                if new_hash:
+                    # The plaintext column is NOT NULL; fill it with a random value no one can type
+                    con.execute(
+                        "UPDATE Employees SET password_hash = ?, password_salt = ?, password = ? WHERE employee_id = ?",
+                        (*new_hash, DISABLED_PASSWORD_PREFIX + secrets.token_hex(32), employee_id),
+                    )
+                # No RETURNING, which needs SQLite 3.35; the transaction keeps the two statements atomic
+                con.execute(
+                    "UPDATE Employees SET conversation_id = COALESCE(conversation_id, 0) + 1 WHERE employee_id = ?",
+                    (employee_id,),
+                )
+                conversation_id = con.execute(
+                    "SELECT conversation_id FROM Employees WHERE employee_id = ?", (employee_id,)
+                ).fetchone()[0]
+        finally:
+            con.close()
+
+        session = Session(
+            token=secrets.token_urlsafe(32),
+            employee_id=employee_id,
+            first_name=first_name,
+            email=email,
+            conversation_id=str(conversation_id),
+            expires_at=time.time() + SESSION_TTL,
+        )
+        with self._lock:
+            self._sessions[session.token] = session
+        return session
+
+    def validate(self, token: Optional[str]) -> Optional[Session]:
+        """Return the session of a token, or None if it is unknown or expired."""
+        if not token:
+            return None
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is not None and session.expires_at < time.time():
+                del self._sessions[token]
+                session = None
+        return session
+
+    def logout(self, token: Optional[str]) -> None:
+        """Revoke a session token."""
+        with self._lock:
+            self._sessions.pop(token, None)
+
+
+_auth_service: Optional[AuthService] = None
+_service_lock = threading.Lock()
+
+
+def get_auth_service() -> AuthService:
+    """Return the process-wide authentication service."""
+    global _auth_service
+    with _service_lock:
+        if _auth_service is None:
+            _auth_service = AuthService()
+        return _auth_service
+
+
+def authenticate(email: str, password: str) -> Session:
+    """Log an employee in with the process-wide authentication service.
+
+    Raises:
+        AuthenticationError: If the email is unknown or the password is wrong.
+    """
+    return get_auth_service().login(email, password)
@@ -0,0 +1,357 @@
+# Import necessary modules and classes
+import csv
+import json
+import os
+import sqlite3
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Union
+
+from pydantic import BaseModel
+
+from Chatbot.Chains.Chitchat import ChitChatClassifierChain, ChitChatResponseChain
+from Chatbot.Chains.Claims_Analytics import ClaimsAnalyticsChain
+from Chatbot.Chains.Get_Claim_Info import GetClaimInfoChain
+from Chatbot.Chains.Get_Policy_Info import GetPolicyInfoChain
+from Chatbot.Chains.Prompt_Injection_Tolerance import IsPromptInjection
+from Chatbot.Chains.Update_Claim_Status import UpdateClaimStatusChain
+from database import connect
+from decomposition import WRITE_INTENTS
+from rag import get_rag_chain
+from tracing import metrics, span
+
+# Maximum model calls in flight per stage of a batch
+BATCH_CONCURRENCY = int(os.getenv("SECURESHIELD_BATCH_CONCURRENCY", "8"))
+
+# Requests classified and grouped together
+BATCH_CHUNK_SIZE = int(os.getenv("SECURESHIELD_BATCH_CHUNK_SIZE", "200"))
+
+# CSV columns read as the request id and text, first match wins
+ID_COLUMNS = ("id", "request_id")
+TEXT_COLUMNS = ("message", "request", "text", "user_input")
+
+PROMPT_INJECTION_RESPONSE = "It was detected prompt injection risks or malicious content in your input."
+
+
+class BatchRequest(BaseModel):
+    request_id: str
+    text: str
+
+
+class BatchResult(BaseModel):
+    request_id: str
+    intent: Optional[str]
+    response: str
+    error: Optional[str] = None
+
+
+def _column(fieldnames: List[str], candidates) -> Optional[str]:
+    lowered = {name.strip().lower(): name for name in fieldnames}
+    return next((lowered[name] for name in candidates if name in lowered), None)
+
+
+def read_requests(source: Union[str, os.PathLike, Iterable]) -> Iterator[BatchRequest]:
+    """Read requests from a CSV file or an iterable.
+
+    A CSV needs a message column (message, request, text or user_input) and
+    may have an id column (id or request_id); rows are numbered from 1
+    otherwise. An iterable may hold strings, dicts with "text" or
+    "user_input" and an optional "id", or BatchRequests; strings are
+    numbered by position.
+
+    Raises:
+        ValueError: If the CSV has no message column.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="") as file:
+            reader = csv.DictReader(file)
+            text_column = _column(reader.fieldnames or [], TEXT_COLUMNS)
+            if text_column is None:
+                raise ValueError(f"{source} has no {'/'.join(TEXT_COLUMNS)} column.")
+            id_column = _column(reader.fieldnames, ID_COLUMNS)
+            for number, row in enumerate(reader, start=1):
+                request_id = row[id_column] if id_column and row[id_column] else str(number)
+                yield BatchRequest(request_id=request_id, text=row[text_column] or "")
+        return
+
+    for number, item in enumerate(source, start=1):
+        if isinstance(item, BatchRequest):
+            yield item
+        elif isinstance(item, dict):
+            text = item.get("text", item.get("user_input", ""))
+            yield BatchRequest(request_id=str(item.get("id", item.get("request_id", number))), text=text)
+        else:
+            yield BatchRequest(request_id=str(number), text=str(item))
+
+
+class BatchCheckpoint:
+    """JSON lines file of the results of a batch, used to resume it.
+
+    Besides one line per result, it holds the outcome of each claim update as
+    soon as its transaction commits, so a resumed batch answers from it
+    instead of applying the update again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        self.statuses: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                        if "status" in entry:
+                            self.statuses[entry["request_id"]] = entry["status"]
+                        else:
+                            self.done.add(entry["request_id"])
+                    except (ValueError, KeyError):
+                        # A line cut short by an interrupted run; the request is redone
+                        continue
+        self.file = open(path, "a")
+
+    def _write(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.file.write(line + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def record_statuses(self, requests: List[BatchRequest], statuses: List[str]) -> None:
+        """Record the outcome of the committed SQL of requests, before they are answered."""
+        entries = {request.request_id: status for request, status in zip(requests, statuses)}
+        self._write(json.dumps({"request_id": request_id, "status": status}) for request_id, status in entries.items())
+        self.statuses.update(entries)
+
+    def record(self, results: List[BatchResult]) -> None:
+        self._write(result.model_dump_json() for result in results)
+        self.done.update(result.request_id for result in results)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def _chunks(requests: Iterable[BatchRequest], size: int) -> Iterator[List[BatchRequest]]:
+    chunk: List[BatchRequest] = []
+    for request in requests:
+        chunk.append(request)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BatchProcessor:
+    """Runs batches of requests through the chains of a MainChatbot.
+
+    Requests are read in chunks. In each chunk the prompt-injection check runs
+    for all requests at once, the messages are routed with one encoder call,
+    and each intent group is extracted and answered with the chains' batch
+    interface around one SQL transaction. Claim updates run before reads, as
+    for compound messages, and model calls go through the scheduler like
+    interactive ones.
+
+    Requests have no chat history: "next page" follow-ups and references to
+    earlier messages are not supported, and updates of several claims are
+    only previewed since they cannot be confirmed.
+    """
+
+    def __init__(self, bot, max_concurrency: int = BATCH_CONCURRENCY, chunk_size: int = BATCH_CHUNK_SIZE):
+        self.bot = bot
+        self.chunk_size = chunk_size
+        self.config = {"max_concurrency": max_concurrency}
+        # Own chain instances without session history
+        self.prompt_injection = IsPromptInjection(registry=bot.registry)
+        self.sql_chains = {
+            "Update_Claim_Status": UpdateClaimStatusChain(registry=bot.registry),
+            "Get_Claim_Info": GetClaimInfoChain(registry=bot.registry),
+            "Get_Policy_Info": GetPolicyInfoChain(registry=bot.registry),
+            "Claims_Analytics": ClaimsAnalyticsChain(registry=bot.registry),
+        }
+        self.chitchat_classifier = ChitChatClassifierChain(registry=bot.registry)
+        self.chitchat = ChitChatResponseChain(registry=bot.registry)
+        self.rag = get_rag_chain(bot.rag_retriever, bot.registry)
+
+    def run(self, requests, checkpoint_path: Optional[str] = None) -> Iterator[BatchResult]:
+        """Process requests, yielding the results of each intent group as it completes.
+
+        Args:
+            requests: A CSV path or an iterable of requests (see read_requests).
+            checkpoint_path: JSON lines file the results are appended to
+                before they are yielded; the requests already in it are skipped.
+
+        Yields:
+            One BatchResult per request, grouped by intent within each chunk.
+        """
+        checkpoint = BatchCheckpoint(checkpoint_path) if checkpoint_path else None
+        # Paged results of the batch are remembered under their own session
+        session = {"configurable": {"user_id": "batch", "conversation_id": uuid.uuid4().hex}}
+        pending = (
+            request for request in read_requests(requests)
+            if checkpoint is None or request.request_id not in checkpoint.done
+        )
+        try:
+            for chunk in _chunks(pending, self.chunk_size):
+                for results in self.process_chunk(chunk, session, checkpoint):
+                    if checkpoint is not None:
+                        checkpoint.record(results)
+                    yield from results
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+    def classify(self, chunk: List[BatchRequest]) -> List[Optional[str]]:
+        """Route a chunk of requests with one encoder call."""
+        return self.bot.get_user_intents([request.text for request in chunk])
+
+    def process_chunk(
+        self, chunk: List[BatchRequest], session: Dict, checkpoint: Optional[BatchCheckpoint] = None
+    ) -> Iterator[List[BatchResult]]:
+        """Process one chunk, yielding the results of each intent group."""
+        with span("batch.prompt_injection"):
+            verdicts = self.prompt_injection.batch(
+                [{"user_input": request.text} for request in chunk], self.config, return_exceptions=True
+            )
+        safe = []
+        flagged = []
+        for request, verdict in zip(chunk, verdicts):
+            if isinstance(verdict, Exception) or verdict.is_prompt_injection:
+                flagged.append(BatchResult(
+                    request_id=request.request_id, intent="prompt_injection", response=PROMPT_INJECTION_RESPONSE
+                ))
+            else:
+                safe.append(request)
+        if flagged:
+            yield flagged
+
+        with span("intent"):
+            intents = self.classify(safe)
+        groups: Dict[Optional[str], List[BatchRequest]] = {}
+        for request, intent in zip(safe, intents):
+            groups.setdefault(intent, []).append(request)
+
+        # Writes first, then reads, then the intents answered without the database
+        order = sorted(groups, key=lambda intent: (intent not in WRITE_INTENTS, intent not in self.sql_chains))
+        for intent in order:
+            requests = groups[intent]
+            metrics.inc("secureshield_batch_requests_total", len(requests), intent=str(intent))
+            with span(f"batch.{intent}", requests=len(requests)):
+                if intent in self.sql_chains:
+                    results = self.process_sql_group(intent, requests, session, checkpoint)
+                elif intent == "Chitchat":
+                    results = self.process_chitchat(requests)
+                else:
+                    results = self.process_unknown(requests)
+            yield results
+
+    def process_sql_group(
+        self,
+        intent: str,
+        requests: List[BatchRequest],
+        session: Dict,
+        checkpoint: Optional[BatchCheckpoint] = None,
+    ) -> List[BatchResult]:
+        """Extract, query and answer a group of requests of one database intent.
+
+        Claim updates already committed by an interrupted run are answered
+        from the checkpoint instead of being applied again.
+        """
+        chain = self.sql_chains[intent]
+        inputs = [{"user_input": request.text, "chat_history": []} for request in requests]
+        recorded = checkpoint.statuses if checkpoint is not None and intent in WRITE_INTENTS else {}
+        todo = [index for index, request in enumerate(requests) if request.request_id not in recorded]
+        statuses = [recorded.get(request.request_id) for request in requests]
+        if todo:
+            with span("batch.extract"):
+                extracted = chain.extract_chain.batch(
+                    [inputs[index] for index in todo], self.config, return_exceptions=True
+                )
+            for index, status in zip(todo, self.run_sql(intent, extracted, session)):
+                statuses[index] = status
+            if checkpoint is not None and intent in WRITE_INTENTS:
+                # Committed updates must not be applied again if answering them is interrupted
+                checkpoint.record_statuses([requests[index] for index in todo], [statuses[index] for index in todo])
+
+        with span("batch.response"):
+            responses = chain.chain.batch(
+                [
+                    {**item, "status": status, "format_instructions": chain.format_instructions}
+                    for item, status in zip(inputs, statuses)
+                ],
+                self.config,
+                return_exceptions=True,
+            )
+        return [
+            BatchResult(request_id=request.request_id, intent=intent, response=status, error=repr(response))
+            if isinstance(response, Exception)
+            else BatchResult(request_id=request.request_id, intent=intent, response=response.output)
+            for request, status, response in zip(requests, statuses, responses)
+        ]
+
+    def run_sql(self, intent: str, extracted: List[Any], session: Dict) -> List[str]:
+        """Run the extracted queries of a group on one connection and return their statuses."""
+        chain = self.sql_chains[intent]
+        statuses: List[str] = []
+        con = connect()
+        try:
+            con.isolation_level = None
+            # One transaction for the group: a write lock for updates, a snapshot for reads
+            con.execute("BEGIN IMMEDIATE" if intent in WRITE_INTENTS else "BEGIN")
+            with span("batch.sql"):
+                for query in extracted:
+                    if isinstance(query, Exception):
+                        statuses.append(f"Error: {query}")
+                    elif intent in WRITE_INTENTS:
+                        # Updates of several claims need a confirmation turn, so a batch only previews them
+                        try:
+                            statuses.append(chain.apply_update(query, con).describe())
+                        except (ValueError, sqlite3.Error) as e:
+                            # Rolled back to its savepoint; the rest of the group still commits
+                            statuses.append(f"Error: {e}")
+                    else:
+                        try:
+                            statuses.append(chain.run_query(query, con, session))
+                        except Exception as e:
+                            statuses.append(f"Error: {e}")
+            con.execute("COMMIT")
+        except BaseException:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            raise
+        finally:
+            con.close()
+        return statuses
+
+    def process_chitchat(self, requests: List[BatchRequest], intent: str = "Chitchat") -> List[BatchResult]:
+        responses = self.chitchat.batch(
+            [{"customer_input": request.text, "chat_history": []} for request in requests],
+            self.config,
+            return_exceptions=True,
+        )
+        return [self._result(request, intent, response) for request, response in zip(requests, responses)]
+
+    def process_unknown(self, requests: List[BatchRequest]) -> List[BatchResult]:
+        """Answer unrouted requests with a chitchat response or from the policy documents."""
+        classifications = self.chitchat_classifier.batch(
+            [{"customer_input": request.text, "chat_history": []} for request in requests],
+            self.config,
+            return_exceptions=True,
+        )
+        is_chitchat = [
+            not isinstance(classification, Exception) and classification.chitchat for classification in classifications
+        ]
+        chitchat = [request for request, flag in zip(requests, is_chitchat) if flag]
+        questions = [request for request, flag in zip(requests, is_chitchat) if not flag]
+        results = self.process_chitchat(chitchat, intent=None) if chitchat else []
+        if questions:
+            with span("rag.chain"):
+                answers = self.rag.rag_chain.batch(
+                    [request.text for request in questions], self.config, return_exceptions=True
+                )
+            results.extend(self._result(request, None, answer) for request, answer in zip(questions, answers))
+        return results
+
+    @staticmethod
+    def _result(request: BatchRequest, intent: Optional[str], response: Any) -> BatchResult:
+        if isinstance(response, Exception):
+            return BatchResult(request_id=request.request_id, intent=intent, response="", error=repr(response))
+        return BatchResult(request_id=request.request_id, intent=intent, response=response)
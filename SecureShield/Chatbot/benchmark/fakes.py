@@ -0,0 +1,176 @@
+# Import necessary modules and classes
+import json
+import math
+import re
+import time
+import zlib
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.vectorstores import InMemoryVectorStore
+from semantic_router.encoders import BaseEncoder
+
+from Chains.Claims_Analytics import extract_analytics_query_deterministic
+from Chains.Get_Claim_Info import extract_claim_query_deterministic
+from Chains.Get_Policy_Info import extract_policy_query_deterministic
+from Chains.Update_Claim_Status import extract_claim_update_deterministic
+from model_registry import ModelRegistry
+
+# Number of dimensions of the hashed bag-of-words embeddings
+EMBEDDING_DIMS = 256
+
+# Short policy passages standing in for the chunks of the documents in Policies/,
+# with the product and tier metadata written by ingestion.py
+POLICY_PASSAGES = [
+    ("AutoGuard covers vehicle accidents, theft and third-party liability for Car policies.", "AutoGuard", "all"),
+    ("AutoGuard Gold adds roadside assistance and a replacement vehicle for up to 30 days.", "AutoGuard", "Gold"),
+    ("HealthCare covers hospital stays, specialist visits and prescribed medication.", "HealthCare", "all"),
+    ("HealthCare Silver and Gold include dental care; Bronze covers emergencies only.", "HealthCare", "all"),
+    ("HomeProtect covers fire, flooding and burglary damage to House policies.", "HomeProtect", "all"),
+    ("HomeProtect Gold includes temporary accommodation while the home is repaired.", "HomeProtect", "Gold"),
+]
+
+
+def _tokenize(text: str) -> List[str]:
+    return re.findall(r"[a-z]+", text.lower())
+
+
+def hash_embedding(text: str, dims: int = EMBEDDING_DIMS) -> List[float]:
+    """Embed a text as a normalized, signed hashed bag of words.
+
+    Deterministic across processes, so results are reproducible in CI.
+    """
+    vector = [0.0] * dims
+    for token in _tokenize(text):
+        digest = zlib.crc32(token.encode())
+        vector[digest % dims] += 1.0 if digest & 1 << 31 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class FakeEncoder(BaseEncoder):
+    """Offline stand-in for the router's sentence-transformers encoder."""
+
+    name: str = "hashed-bag-of-words"
+    score_threshold: float = 0.2
+    type: str = "fake"
+
+    def __call__(self, docs: List[Any]) -> List[List[float]]:
+        return [hash_embedding(str(doc)) for doc in docs]
+
+
+class FakeEmbeddings(Embeddings):
+    """Offline stand-in for OpenAIEmbeddings."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [hash_embedding(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return hash_embedding(text)
+
+
+class FakeVectorStore(InMemoryVectorStore):
+    """InMemoryVectorStore that also accepts Pinecone-style `$in` metadata filters."""
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, filter=None, **kwargs):
+        if isinstance(filter, dict):
+            conditions = filter
+            filter = lambda doc: all(  # noqa: E731
+                doc.metadata.get(key) in condition["$in"] for key, condition in conditions.items()
+            )
+        return super().similarity_search_with_score_by_vector(embedding, k=k, filter=filter, **kwargs)
+
+
+def build_fake_retriever(k: int = 2):
+    """Build an in-memory retriever over the stand-in policy passages."""
+    vector_store = FakeVectorStore(embedding=FakeEmbeddings())
+    vector_store.add_documents([
+        Document(page_content=text, metadata={"product": product, "tier": tier})
+        for text, product, tier in POLICY_PASSAGES
+    ])
+    return vector_store.as_retriever(search_kwargs={"k": k})
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model with configurable latency and token rate.
+
+    Answers in the format each registry stage expects, so chains run end to
+    end without network access. Simulated time is `latency` plus the
+    completion tokens divided by `tokens_per_second`.
+    """
+
+    stage: str
+    latency: float = 0.05
+    tokens_per_second: float = 200.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _answer(self, user_input: str) -> str:
+        inputs = {"user_input": user_input}
+        if self.stage == "prompt_injection.classify":
+            return json.dumps({"is_prompt_injection": False})
+        if self.stage == "chitchat.classify":
+            return json.dumps({"chitchat": "policy" not in user_input.lower()})
+        if self.stage == "claim_info.extract":
+            return extract_claim_query_deterministic(inputs).model_dump_json()
+        if self.stage == "policy_info.extract":
+            return extract_policy_query_deterministic(inputs).model_dump_json()
+        if self.stage == "update_claim.extract":
+            return extract_claim_update_deterministic(inputs).model_dump_json()
+        if self.stage == "analytics.extract":
+            return extract_analytics_query_deterministic(inputs).model_dump_json()
+        if self.stage.endswith(".response") and self.stage.split(".")[0] in (
+            "claim_info",
+            "policy_info",
+            "update_claim",
+            "analytics",
+        ):
+            return json.dumps({"output": f"Here is what I found for: {user_input}"})
+        return f"Thanks for asking about {user_input[:60]}. SecureShield is here to help."
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        human = [message for message in messages if isinstance(message, HumanMessage)]
+        text = human[-1].content if human else messages[-1].content
+        user_input = text.split(": ", 1)[-1]
+
+        content = self._answer(user_input)
+        prompt_tokens = sum(len(str(message.content)) for message in messages) // 4
+        completion_tokens = max(1, len(content) // 4)
+        time.sleep(self.latency + completion_tokens / self.tokens_per_second)
+
+        message = AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def build_fake_registry(latency: float = 0.05, tokens_per_second: float = 200.0) -> ModelRegistry:
+    """Build a model registry whose every tier is served by FakeChatModel.
+
+    The tiers name fake models, so their circuit breakers and shared cache
+    entries are never those of the real models.
+    """
+    registry = ModelRegistry()
+    registry.tiers = {tier: f"fake-{model}" for tier, model in registry.tiers.items()}
+    registry.llm_factory = lambda stage, tier, timeout, temperature: FakeChatModel(
+        stage=stage, latency=latency, tokens_per_second=tokens_per_second
+    )
+    return registry
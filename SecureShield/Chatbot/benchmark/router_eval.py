@@ -0,0 +1,266 @@
+"""Offline accuracy and latency evaluation of the intent router.
+
+Runs a labeled utterance set (router/synthetic_intetions.json by default)
+through the routes of router/layer.json for one or more encoders. Messages
+are encoded in batches and scored against the route index with one matrix
+product, reproducing `RouteLayer.retrieve_multiple_routes` (the first route
+above its threshold wins, as in `MainChatbot.get_user_intent`). The report
+has per-intent precision/recall, a confusion matrix, a sweep over score
+thresholds and the latency of single `retrieve_multiple_routes` calls, plus a
+side-by-side comparison of the encoders.
+
+Usage:
+    python SecureShield/Chatbot/benchmark/router_eval.py --encoder fake
+    python SecureShield/Chatbot/benchmark/router_eval.py \\
+        --encoder huggingface:sentence-transformers/all-MiniLM-L6-v2 --encoder fake --held-out
+"""
+
+# Import necessary modules and classes
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+CHATBOT_DIR = os.path.dirname(BENCHMARK_DIR)
+SECURESHIELD_DIR = os.path.dirname(CHATBOT_DIR)
+sys.path[:0] = [SECURESHIELD_DIR, CHATBOT_DIR]
+
+from benchmark.run import summarize  # noqa: E402
+
+DATASET_PATH = os.path.join(CHATBOT_DIR, "router", "synthetic_intetions.json")
+
+# Label used for messages that should not match any route
+NO_ROUTE = "None"
+
+# Number of index hits retrieve_multiple_routes looks at
+TOP_K = 5
+
+DEFAULT_THRESHOLDS = [round(0.05 * step, 2) for step in range(2, 17)]
+
+
+def load_dataset(path: str = DATASET_PATH) -> Tuple[List[str], List[str]]:
+    """Return the messages and their intents; unroutable messages are labeled "None"."""
+    with open(path) as file:
+        entries = json.load(file)
+    return [entry["Message"] for entry in entries], [entry["Intention"] or NO_ROUTE for entry in entries]
+
+
+def build_encoder(spec: str):
+    """Build an encoder from "type[:name]", e.g. "huggingface:BAAI/bge-small-en" or "fake"."""
+    encoder_type, _, name = spec.partition(":")
+    if encoder_type == "fake":
+        from benchmark.fakes import FakeEncoder
+
+        return FakeEncoder()
+
+    from semantic_router.encoders import AutoEncoder
+
+    return AutoEncoder(type=encoder_type, name=name or None).model
+
+
+def build_layer(spec: str, batch_size: int):
+    """Build the layer.json routes for an encoder, embedding their utterances in batches."""
+    from semantic_router.layer import LayerConfig
+
+    from router.build import CACHE_PATH, EmbeddingCache, embed_utterances
+    from router.loader import FILE_PATH, assemble_route_layer
+
+    encoder = build_encoder(spec)
+    config = LayerConfig.from_file(FILE_PATH)
+    utterances = [utterance for route in config.routes for utterance in route.utterances]
+    route_names = [route.name for route in config.routes for _ in route.utterances]
+    cache = EmbeddingCache(CACHE_PATH)
+    try:
+        embeddings, _ = embed_utterances(utterances, encoder, encoder.type, encoder.name, cache, batch_size)
+    finally:
+        cache.close()
+    return assemble_route_layer(encoder, config.routes, embeddings, route_names, utterances)
+
+
+def encode_batched(encoder, texts: Sequence[str], batch_size: int) -> np.ndarray:
+    """Encode texts in batches of `batch_size`."""
+    vectors: List[List[float]] = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(encoder(list(texts[start:start + batch_size])))
+    return np.asarray(vectors, dtype=np.float64)
+
+
+def top_hits(layer, queries: np.ndarray, top_k: int = TOP_K) -> Tuple[np.ndarray, np.ndarray]:
+    """Score all queries against the route index at once.
+
+    Returns:
+        The scores and route names of the `top_k` hits of each query, best
+        first. Agreement with RouteLayer itself is checked separately, see
+        `disagreements_with_layer` in the report.
+    """
+    index = layer.index.index
+    similarity = (queries @ index.T) / np.outer(np.linalg.norm(queries, axis=1), np.linalg.norm(index, axis=1))
+    top_k = min(top_k, index.shape[0])
+    positions = np.argpartition(similarity, -top_k, axis=1)[:, -top_k:]
+    # argpartition leaves the top hits unordered
+    order = np.argsort(-np.take_along_axis(similarity, positions, axis=1), axis=1, kind="stable")
+    positions = np.take_along_axis(positions, order, axis=1)
+    return np.take_along_axis(similarity, positions, axis=1), layer.index.routes[positions]
+
+
+def predict(
+    scores: np.ndarray, routes: np.ndarray, thresholds: Dict[str, float], default_threshold: float
+) -> List[str]:
+    """Pick the best-scoring route of each query whose best hit passes its threshold."""
+    predictions = []
+    for row_scores, row_routes in zip(scores, routes):
+        best: Dict[str, float] = {}
+        for score, route in zip(row_scores, row_routes):
+            best[route] = max(best.get(route, -1.0), score)
+        predictions.append(next(
+            (str(route) for route, score in best.items() if score > thresholds.get(route, default_threshold)),
+            NO_ROUTE,
+        ))
+    return predictions
+
+
+def classification_report(labels: List[str], predictions: List[str]) -> Dict[str, object]:
+    """Return accuracy, macro F1, per-intent precision/recall and the confusion matrix."""
+    names = sorted(set(labels) | set(predictions))
+    confusion = {true: {predicted: 0 for predicted in names} for true in names}
+    for true, predicted in zip(labels, predictions):
+        confusion[true][predicted] += 1
+
+    per_intent = {}
+    for name in names:
+        true_positives = confusion[name][name]
+        predicted = sum(confusion[true][name] for true in names)
+        support = sum(confusion[name].values())
+        precision = true_positives / predicted if predicted else 0.0
+        recall = true_positives / support if support else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        per_intent[name] = {
+            "precision": round(precision, 3),
+            "recall": round(recall, 3),
+            "f1": round(f1, 3),
+            "support": support,
+        }
+
+    supported = [metrics["f1"] for metrics in per_intent.values() if metrics["support"]]
+    return {
+        "accuracy": round(sum(t == p for t, p in zip(labels, predictions)) / len(labels), 3),
+        "macro_f1": round(sum(supported) / len(supported), 3),
+        "per_intent": per_intent,
+        "confusion_matrix": confusion,
+    }
+
+
+def evaluate(
+    spec: str,
+    messages: List[str],
+    labels: List[str],
+    thresholds: Sequence[float],
+    batch_size: int,
+    latency_queries: int,
+) -> Dict[str, object]:
+    """Evaluate one encoder on the labeled messages."""
+    layer = build_layer(spec, batch_size)
+
+    start = time.perf_counter()
+    queries = encode_batched(layer.encoder, messages, batch_size)
+    encode_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    scores, routes = top_hits(layer, queries)
+    configured = {route.name: route.score_threshold for route in layer.routes}
+    predictions = predict(scores, routes, configured, layer.score_threshold)
+    score_seconds = time.perf_counter() - start
+
+    # Single calls through the layer, as made for every user message
+    latencies: List[float] = []
+    disagreements = 0
+    for message, prediction in zip(messages[:latency_queries], predictions):
+        start = time.perf_counter()
+        choices = layer.retrieve_multiple_routes(message)
+        latencies.append(time.perf_counter() - start)
+        disagreements += (choices[0].name if choices else NO_ROUTE) != prediction
+
+    sweep = []
+    for threshold in thresholds:
+        swept = predict(scores, routes, {}, threshold)
+        report = classification_report(labels, swept)
+        sweep.append({
+            "threshold": threshold,
+            "accuracy": report["accuracy"],
+            "macro_f1": report["macro_f1"],
+            "no_route_rate": round(swept.count(NO_ROUTE) / len(swept), 3),
+        })
+
+    return {
+        "encoder": f"{layer.encoder.type}:{layer.encoder.name}",
+        "configured_thresholds": configured,
+        **classification_report(labels, predictions),
+        "threshold_sweep": sweep,
+        "batched": {
+            "messages": len(messages),
+            "encode_seconds": round(encode_seconds, 4),
+            "score_seconds": round(score_seconds, 4),
+            "messages_per_second": round(len(messages) / max(encode_seconds + score_seconds, 1e-9), 1),
+        },
+        "single_query_latency": summarize(latencies),
+        "disagreements_with_layer": disagreements,
+    }
+
+
+def compare(results: List[Dict[str, object]]) -> List[Dict[str, object]]:
+    """One row per encoder with its headline accuracy and latency."""
+    rows = []
+    for result in results:
+        best = max(result["threshold_sweep"], key=lambda entry: (entry["macro_f1"], entry["accuracy"]))
+        rows.append({
+            "encoder": result["encoder"],
+            "accuracy": result["accuracy"],
+            "macro_f1": result["macro_f1"],
+            "best_threshold": best["threshold"],
+            "best_threshold_macro_f1": best["macro_f1"],
+            "p50_ms": result["single_query_latency"]["p50_ms"],
+            "p95_ms": result["single_query_latency"]["p95_ms"],
+            "batched_messages_per_second": result["batched"]["messages_per_second"],
+        })
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--encoder", action="append", help='Encoder as "type[:name]" (repeatable); "fake" runs offline'
+    )
+    parser.add_argument("--dataset", default=DATASET_PATH, help="Labeled messages (Intention, Message)")
+    parser.add_argument(
+        "--thresholds", default=",".join(map(str, DEFAULT_THRESHOLDS)), help="Comma-separated thresholds to sweep"
+    )
+    parser.add_argument("--batch-size", type=int, default=64, help="Messages per encoder call")
+    parser.add_argument("--latency-queries", type=int, default=200, help="Single calls timed per encoder")
+    parser.add_argument("--held-out", action="store_true", help="Skip messages that are route utterances")
+    args = parser.parse_args()
+
+    messages, labels = load_dataset(args.dataset)
+    if args.held_out:
+        from semantic_router.layer import LayerConfig
+
+        from router.loader import FILE_PATH
+
+        known = {utterance for route in LayerConfig.from_file(FILE_PATH).routes for utterance in route.utterances}
+        kept = [(message, label) for message, label in zip(messages, labels) if message not in known]
+        messages, labels = [message for message, _ in kept], [label for _, label in kept]
+    thresholds = [float(value) for value in args.thresholds.split(",") if value]
+
+    results = [
+        evaluate(spec, messages, labels, thresholds, args.batch_size, args.latency_queries)
+        for spec in args.encoder or ["huggingface:sentence-transformers/all-MiniLM-L6-v2"]
+    ]
+    print(json.dumps({"comparison": compare(results), "results": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
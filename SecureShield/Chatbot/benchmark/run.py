@@ -0,0 +1,196 @@
+"""Offline load test for MainChatbot.process_user_input.
+
+Runs N concurrent simulated sessions across all intents against a fake chat
+model, a fake embedding encoder and a seeded synthetic database, then reports
+latency percentiles, throughput and memory. No network access is needed.
+
+Usage:
+    python SecureShield/Chatbot/benchmark/run.py --sessions 8 --requests 25
+"""
+
+# Import necessary modules and classes
+import argparse
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+CHATBOT_DIR = os.path.dirname(BENCHMARK_DIR)
+SECURESHIELD_DIR = os.path.dirname(CHATBOT_DIR)
+sys.path[:0] = [SECURESHIELD_DIR, CHATBOT_DIR]
+
+# The metrics endpoint is not needed and would clash between parallel CI jobs
+os.environ.setdefault("SECURESHIELD_METRICS_PORT", "0")
+
+# Message templates per scenario; {id} and {status} are filled in per request
+SCENARIOS: Dict[str, List[str]] = {
+    "Update_Claim_Status": [
+        "Update claim {id} to {status}, please.",
+        "Please mark claim {id} as {status}.",
+    ],
+    "Get_Claim_Info": [
+        "What is the current status of claim {id}?",
+        "Can you check the details for claim {id}?",
+    ],
+    "Get_Policy_Info": [
+        "Show me the details of policy {id}.",
+        "Which policies does client {id} have?",
+    ],
+    "Claims_Analytics": [
+        "How many pending claims do we have per policy type?",
+        "What is the total amount claimed per claim type?",
+    ],
+    "Chitchat": [
+        "Hello, how are you doing today?",
+        "Thanks a lot, have a nice day!",
+    ],
+    "Rag": [
+        "What does the Gold tier of the HomeProtect policy cover?",
+        "Is dental care included in the HealthCare policy?",
+    ],
+}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Return the nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict:
+    """Seed the database, build the bots and drive the simulated sessions."""
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="secureshield-bench-"), "bench.db")
+    os.environ["SECURESHIELD_DB_PATH"] = db_path
+
+    from fakes import FakeEncoder, build_fake_registry, build_fake_retriever
+    from seed import create_synthetic_database
+
+    import model_registry
+    import scheduler
+    from Chatbot.bot import MainChatbot
+    from router.loader import load_intention_classifier
+
+    create_synthetic_database(db_path, claims=args.claims, seed=args.seed)
+    model_registry.set_registry(build_fake_registry(args.latency, args.tokens_per_second))
+    scheduler.set_scheduler(
+        scheduler.LLMScheduler(
+            requests_per_minute=args.rpm,
+            tokens_per_minute=args.tpm,
+            max_concurrency=args.max_concurrency,
+        )
+    )
+    logging.getLogger("secureshield.trace").setLevel(logging.WARNING)
+
+    router = load_intention_classifier(encoder=FakeEncoder())
+    retriever = build_fake_retriever()
+
+    tracemalloc.start()
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+
+    def session(number: int) -> None:
+        rng = random.Random(args.seed + number)
+        bot = MainChatbot(intention_classifier=router, rag_retriever=retriever)
+        bot.user_login(username=f"bench{number}", conversation_id=str(number))
+        scenarios = list(SCENARIOS)
+
+        for _ in range(args.requests):
+            scenario = rng.choice(scenarios)
+            message = rng.choice(SCENARIOS[scenario]).format(
+                id=rng.randint(1, args.claims),
+                status=rng.choice(["approved", "denied", "pending"]),
+            )
+            start = time.perf_counter()
+            try:
+                bot.process_user_input({"user_input": message})
+            except Exception as e:
+                with lock:
+                    errors[scenario] += 1
+                logging.getLogger(__name__).warning(f"{scenario} failed: {e!r}")
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[scenario].append(elapsed)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - started
+
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "sessions": args.sessions,
+        "requests_per_session": args.requests,
+        "model_latency_s": args.latency,
+        "tokens_per_second": args.tokens_per_second,
+        "wall_time_s": round(wall_time, 3),
+        "throughput_rps": round(len(all_latencies) / wall_time, 2) if wall_time else 0.0,
+        "overall": summarize(all_latencies),
+        "per_scenario": {name: summarize(values) for name, values in sorted(latencies.items())},
+        "errors": dict(errors),
+        "peak_traced_memory_mb": round(peak_memory / 2**20, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent simulated sessions")
+    parser.add_argument("--requests", type=int, default=25, help="Requests per session")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake model base latency in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Fake model token rate")
+    parser.add_argument("--claims", type=int, default=2000, help="Claims in the synthetic database")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--db", help="Path of the synthetic database (default: temporary file)")
+    parser.add_argument("--rpm", type=float, default=1e9, help="Scheduler requests per minute")
+    parser.add_argument("--tpm", type=float, default=1e12, help="Scheduler tokens per minute")
+    parser.add_argument("--max-concurrency", type=int, default=64, help="Scheduler concurrency limit")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--max-p95-ms", type=float, help="Fail if the overall p95 exceeds this value")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+
+    if report["errors"]:
+        return 1
+    if args.max_p95_ms is not None and report["overall"]["p95_ms"] > args.max_p95_ms:
+        print(f"p95 {report['overall']['p95_ms']}ms exceeds {args.max_p95_ms}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# Import necessary modules and classes
+import datetime
+import os
+import random
+
+from database import connect, create_schema, migrate
+
+CLAIM_TYPES = ["vehicle accident", "theft", "medical", "fire damage", "flood damage"]
+CLAIM_STATUSES = ["pending", "approved", "denied"]
+POLICY_TYPES = ["Health", "House", "Car"]
+POLICY_LEVELS = ["Bronze", "Silver", "Gold"]
+POLICY_PDFS = {
+    "Health": "Policies/HealthCare.pdf",
+    "House": "Policies/HomeProtect.pdf",
+    "Car": "Policies/AutoGuard.pdf",
+}
+
+
+def create_synthetic_database(
+    path: str,
+    clients: int = 200,
+    policies: int = 400,
+    claims: int = 2000,
+    employees: int = 20,
+    seed: int = 42,
+) -> str:
+    """Create a SecureShield database filled with reproducible synthetic data.
+
+    Args:
+        path: Database file to create. An existing file is replaced.
+        clients: Number of clients.
+        policies: Number of policies, spread over the clients.
+        claims: Number of claims, spread over the policies.
+        employees: Number of employees.
+        seed: Random seed; the same seed always produces the same rows.
+
+    Returns:
+        The path of the created database.
+    """
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+
+    con = connect(path)
+    create_schema(con)
+    cursor = con.cursor()
+
+    cursor.executemany(
+        "INSERT INTO Employees (first_name, last_name, email, role, password) VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                f"Employee{i}",
+                "Bench",
+                f"employee{i}@secureshield.example",
+                rng.choice(["Claims Adjuster", "Manager"]),
+                "P@ssw0rd",
+            )
+            for i in range(1, employees + 1)
+        ],
+    )
+    cursor.executemany(
+        "INSERT INTO Clients (name, age, gender, email, phone) VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                f"Client {i}",
+                rng.randint(18, 90),
+                rng.choice(["Female", "Male"]),
+                f"client{i}@example.com",
+                f"555-{i:04d}",
+            )
+            for i in range(1, clients + 1)
+        ],
+    )
+
+    start = datetime.date(2021, 1, 1)
+    policy_rows = []
+    for _ in range(policies):
+        policy_type = rng.choice(POLICY_TYPES)
+        begin = start + datetime.timedelta(days=rng.randint(0, 1000))
+        policy_rows.append(
+            (
+                rng.randint(1, clients),
+                policy_type,
+                rng.choice(POLICY_LEVELS),
+                begin.isoformat(),
+                (begin + datetime.timedelta(days=365)).isoformat(),
+                POLICY_PDFS[policy_type],
+            )
+        )
+    cursor.executemany(
+        "INSERT INTO Policies (user_id, policy_type, policy_level, start_date, end_date, pdf_path) VALUES (?, ?, ?, ?, ?, ?)",
+        policy_rows,
+    )
+
+    claim_rows = []
+    for _ in range(claims):
+        policy_id = rng.randint(1, policies)
+        status = rng.choice(CLAIM_STATUSES)
+        submitted = start + datetime.timedelta(days=rng.randint(0, 1300))
+        amount = round(rng.uniform(100, 20000), 2)
+        claim_rows.append(
+            (
+                policy_rows[policy_id - 1][0],
+                policy_id,
+                rng.choice(CLAIM_TYPES),
+                status,
+                submitted.isoformat(),
+                None if status == "pending" else (submitted + datetime.timedelta(days=rng.randint(5, 60))).isoformat(),
+                amount,
+                round(amount * rng.uniform(0.5, 1.0), 2) if status == "approved" else None,
+            )
+        )
+    cursor.executemany(
+        "INSERT INTO Claims (user_id, policy_id, claim_type, status, submission_date, resolution_date, amount_claimed, amount_approved) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        claim_rows,
+    )
+
+    con.commit()
+    migrate(con)
+    con.close()
+    return path
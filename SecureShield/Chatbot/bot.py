@@ -1,42 +1,82 @@
 # Import necessary classes and modules for chatbot functionality
+import logging
 import sys
+import time
 sys.path.append('SecureShield/secure_shield.db')
 # Connect to the SQLite database
 #con = sqlite3.connect("SecureShield/secure_shield.db")
 #cursor = con.cursor()
-from typing import Callable, Dict, Optional
+from typing import Callable, Dict, Iterator, List, Optional
 
 from .memory import MemoryManager
+from .jobs import enqueue
 
-from Chatbot.Chains.Prompt_Injection_Tolerance import IsPromptInjection
+from Chatbot.Chains.Prompt_Injection_Tolerance import IsPromptInjection, UnverifiedInput
 
 from Chatbot.Chains.Get_Claim_Info import GetClaimInfoChain
 from Chatbot.Chains.Get_Policy_Info import GetPolicyInfoChain
 from Chatbot.Chains.Update_Claim_Status import UpdateClaimStatusChain
+from Chatbot.Chains.Claims_Analytics import ClaimsAnalyticsChain
 from router.loader import load_intention_classifier
+from router.live import LiveRouter, record_correction
 from Chatbot.Chains.Chitchat import ChitChatResponseChain, ChitChatClassifierChain
-from rag import RagChain
+from rag import get_rag_chain
+from batch import BATCH_CHUNK_SIZE, BATCH_CONCURRENCY, BatchProcessor, BatchResult
+from claim_updates import has_pending_update, parse_confirmation, pop_pending_update
+from coalescing import DEFAULT_DEDUPE_WINDOW, coalesce, normalize_text
+from decomposition import SubRequest, decompose_request, execute_sub_requests
+from profiling import profile_request
+from tracing import span, start_metrics_server, start_trace
 
 from langchain_core.runnables.history import RunnableWithMessageHistory
 
+logger = logging.getLogger(__name__)
+
+
+# Map route names in router/layer.json to the intents handled by the bot
+ROUTE_INTENTS = {
+    "update_claim_status": "Update_Claim_Status",
+    "get_claim_info": "Get_Claim_Info",
+    "get_policy_info": "Get_Policy_Info",
+    "claims_analytics": "Claims_Analytics",
+    "chitchat": "Chitchat",
+}
+
+# Answer when the prompt-injection check could not run; the input is refused unchecked
+UNVERIFIED_INPUT_RESPONSE = (
+    "Your message could not be checked for safety right now, so it was not processed. "
+    "Please try again in a moment."
+)
 
 class MainChatbot:
     """A bot that handles customer service interactions by processing user inputs and
     routing them through configured reasoning and response chains.
     """
 
-    def __init__(self):
-        """Initialize the bot with session and language model configurations."""
+    def __init__(self, intention_classifier=None, rag_retriever=None, registry=None):
+        """Initialize the bot with session and language model configurations.
+
+        Args:
+            intention_classifier: RouteLayer to use instead of the one loaded
+                from `router/layer.json`, e.g. one with an offline encoder.
+            rag_retriever: Retriever to use for policy documents instead of
+                the Pinecone index.
+            registry: ModelRegistry serving the chains instead of the
+                process-wide one, e.g. one with fake models.
+        """
         # Initialize the memory manager to manage session history
         self.memory = MemoryManager()
+        self.rag_retriever = rag_retriever
+        self.registry = registry
 
         # Map intent names to their corresponding reasoning and response chains
         self.chain_map = {
-            "Update_Claim_Status": self.add_memory_to_runnable(UpdateClaimStatusChain()),
-            "Get_Claim_Info": self.add_memory_to_runnable(GetClaimInfoChain()),
-            "Get_Policy_Info": self.add_memory_to_runnable(GetPolicyInfoChain()),
-            "chitchat": self.add_memory_to_runnable(ChitChatResponseChain()),
-            "chitchat_class": ChitChatClassifierChain()
+            "Update_Claim_Status": self.add_memory_to_runnable(UpdateClaimStatusChain(registry=registry)),
+            "Get_Claim_Info": self.add_memory_to_runnable(GetClaimInfoChain(registry=registry)),
+            "Get_Policy_Info": self.add_memory_to_runnable(GetPolicyInfoChain(registry=registry)),
+            "Claims_Analytics": self.add_memory_to_runnable(ClaimsAnalyticsChain(registry=registry)),
+            "chitchat": self.add_memory_to_runnable(ChitChatResponseChain(registry=registry)),
+            "chitchat_class": ChitChatClassifierChain(registry=registry)
         }
         
 
@@ -45,11 +85,15 @@ class MainChatbot:
             "Update_Claim_Status": self.handle_update_claim_info,
             "Get_Claim_Info": self.handle_get_claim_info,
             "Get_Policy_Info": self.handle_get_policy_info,
+            "Claims_Analytics": self.handle_claims_analytics,
             "Chitchat": self.handle_chitchat_intent
         }
 
         # Load the intention classifier to determine user intents
-        self.intention_classifier = load_intention_classifier()
+        self.intention_classifier = intention_classifier or load_intention_classifier()
+
+        # Expose latency histograms for scraping (no-op if already running)
+        start_metrics_server()
 
     def user_login(self, username: str, conversation_id: str) -> None:
         """Log in a user by setting the user and conversation identifiers.
@@ -100,18 +144,19 @@ class MainChatbot:
         return self.chain_map[intent]
     
 
-    def get_user_intent(self, user_input: Dict):
+    def get_user_intent(self, user_input: Dict, vector: Optional[List[float]] = None):
         """Classify the user intent based on the input text.
 
         Args:
             user_input: The input text from the user.
+            vector: Embedding of the input, if already encoded.
 
         Returns:
             The classified intent of the user input.
         """
         # Retrieve possible routes for the user's input using the classifier
         intent_routes = self.intention_classifier.retrieve_multiple_routes(
-            user_input["customer_input"]
+            user_input["user_input"], vector
         )
 
         # Handle cases where no intent is identified
@@ -119,6 +164,7 @@ class MainChatbot:
             return None
         else:
             intention = intent_routes[0].name  # Use the first matched intent
+            intention = ROUTE_INTENTS.get(intention, intention)
 
         # Validate the retrieved intention and handle unexpected types
         if intention is None:
@@ -134,6 +180,42 @@ class MainChatbot:
             return None
         
 
+    def get_user_intents(self, texts: List[str]) -> List[Optional[str]]:
+        """Classify several texts with one encoder call.
+
+        Args:
+            texts: The texts to classify, e.g. the parts of a compound message.
+
+        Returns:
+            The classified intent of each text, None where no route matches.
+        """
+        try:
+            vectors = self.intention_classifier.encoder(texts)
+        except Exception as e:
+            logger.warning(f"Encoding {len(texts)} texts at once failed, routing one at a time: {e!r}")
+            return [self.get_user_intent({"user_input": text}) for text in texts]
+        return [self.get_user_intent({"user_input": text}, vector=vector) for text, vector in zip(texts, vectors)]
+
+    def correct_intent(self, user_input: Dict[str, str], intent: str) -> None:
+        """Teach the router the intent a misrouted input should have had.
+
+        Args:
+            user_input: The input text from the user.
+            intent: The intent handled by the bot, e.g. "Get_Claim_Info".
+
+        Raises:
+            ValueError: If no route maps to the intent.
+        """
+        route_names = [route for route, mapped in ROUTE_INTENTS.items() if mapped == intent]
+        if not route_names:
+            raise ValueError(f"No route maps to the intent '{intent}'.")
+
+        if isinstance(self.intention_classifier, LiveRouter):
+            # Added to the live route index right away
+            self.intention_classifier.learn(user_input["user_input"], route_names[0])
+        else:
+            record_correction(user_input["user_input"], route_names[0])
+
     def handle_update_claim_info(self, user_input: Dict[str, str]) -> str:
         """Handle the update profile info intent by processing user input and providing a response.
 
@@ -172,6 +254,44 @@ class MainChatbot:
 
         return response
 
+    def handle_get_policy_info(self, user_input: Dict[str, str]) -> str:
+        """Handle the get policy info intent by processing user input and providing a response.
+
+        Args:
+            user_input: The input text from the user.
+
+        Returns:
+            The content of the response after processing through the chains.
+        """
+        # Retrieve reasoning and response chains for the get policy info intent
+        chain = self.get_chain("Get_Policy_Info")
+        user_input['chat_history'] = self.memory.get_session_history(
+            self.username, self.conversation_id
+        )
+        # Generate a response using the output of the reasoning chain
+        response = chain.invoke(user_input, config=self.memory_config)
+
+        return response
+
+    def handle_claims_analytics(self, user_input: Dict[str, str]) -> str:
+        """Handle the claims analytics intent by processing user input and providing a response.
+
+        Args:
+            user_input: The input text from the user.
+
+        Returns:
+            The content of the response after processing through the chains.
+        """
+        # Retrieve reasoning and response chains for the claims analytics intent
+        chain = self.get_chain("Claims_Analytics")
+        user_input['chat_history'] = self.memory.get_session_history(
+            self.username, self.conversation_id
+        )
+        # Generate a response using the output of the reasoning chain
+        response = chain.invoke(user_input, config=self.memory_config)
+
+        return response
+
     def handle_rag(self, user_input: Dict[str, str]) -> str:
         """Handle the RAG intent by processing user input and providing a response.
 
@@ -181,8 +301,8 @@ class MainChatbot:
         Returns:
             The content of the response after processing through the chains.
         """
-        # Retrieve reasoning and response chains for the RAG intent
-        rag = RagChain(username=self.username)
+        # The Pinecone-backed chain is built once per process, usually by a background job
+        rag = get_rag_chain(self.rag_retriever, self.registry)
         
         # Generate a response using the output of the reasoning chain
         response = rag.run_chain(question=user_input['user_input'])
@@ -199,15 +319,19 @@ class MainChatbot:
             The content of the response after processing through the new chain.
         """
         # Retrieve reasoning and response chains for the chitchat intent
-        chain = self.get_chain("Chitchat")
+        chain = self.get_chain("chitchat")
 
         # Generate a response using the output of the reasoning chain
-        response = chain.invoke(user_input, config=self.memory_config)
+        response = chain.invoke(
+            {**user_input, "customer_input": user_input["user_input"]},
+            config=self.memory_config,
+        )
 
         return response
     
     def handle_unknown_intent(self, user_input: Dict[str, str]) -> str:
-        """Handle unknown intents by providing a chitchat response.
+        """Handle unknown intents with a chitchat response, or with the policy
+        documents when the message is about insurance.
 
         Args:
             user_input: The input text from the user.
@@ -215,60 +339,181 @@ class MainChatbot:
         Returns:
             The content of the response after processing through the new chain.
         """
-        possible_intention = [
-            "Product Information",
-            "Create Order",
-            "Order Status",
-            "Support Information",
-            "Chitchat",
-        ]
-
-        chitchat_reasoning_chain, _ = self.get_chain("chitchat")
-
-        input_message = {}
-
-        input_message["customer_input"] = user_input["customer_input"]
-        input_message["possible_intentions"] = possible_intention
-        input_message["chat_history"] = self.memory.get_session_history(
-            self.user_id, self.conversation_id
-        )
+        chitchat_classifier_chain = self.get_chain("chitchat_class")
+
+        input_message = {
+            "customer_input": user_input["user_input"],
+            "chat_history": self.memory.get_session_history(
+                self.username, self.conversation_id
+            ).messages,
+        }
 
-        reasoning_output1 = chitchat_reasoning_chain.invoke(input_message)
+        classification = chitchat_classifier_chain.invoke(input_message)
 
-        if reasoning_output1.chitchat:
-            print("Chitchat")
+        if classification.chitchat:
             return self.handle_chitchat_intent(user_input)
         else:
-            router_reasoning_chain2, _ = self.get_chain("router")
-            reasoning_output2 = router_reasoning_chain2.invoke(input_message)
-            new_intention = reasoning_output2.intent
-            print("New Intention:", new_intention)
-            new_handler = self.intent_handlers.get(new_intention)
-            return new_handler(user_input)
-        
+            return self.handle_rag(user_input)
+
+    def awaits_confirmation(self, user_input: Dict[str, str]) -> bool:
+        """Return whether the input answers the bulk update previewed in the previous turn.
+
+        A preview can only be confirmed in the next message: any other reply
+        discards it.
+        """
+        session = (str(self.username), str(self.conversation_id))
+        if not has_pending_update(session):
+            return False
+        if parse_confirmation(user_input["user_input"]) is None:
+            pop_pending_update(session)
+            return False
+        return True
+
+    def handle_request(self, intention: Optional[str], user_input: Dict[str, str]) -> str:
+        """Route a request to the handler of its intent.
+
+        Duplicate submissions of a request in the same session share one
+        execution. Identical questions from other sessions only share the
+        extraction stage of their chain (see coalescing.coalesce_read), so
+        every session answers from its own history and keeps its own pages.
+
+        Args:
+            intention: The classified intent.
+            user_input: The input text from the user.
+
+        Returns:
+            The content of the response after processing through the chains.
+        """
+        handler = self.intent_handlers.get(intention, self.handle_unknown_intent)
+        key = (self.username, self.conversation_id, intention, normalize_text(user_input["user_input"]))
+        with span(f"handler.{intention}") as handler_span:
+            response, coalesced = coalesce(key, lambda: handler(user_input), window=DEFAULT_DEDUPE_WINDOW)
+            handler_span.set("coalesced", coalesced)
+        return response
+
+    def handle_sub_requests(self, sub_requests: List[SubRequest]) -> str:
+        """Handle the parts of a compound message and merge their responses.
+
+        Args:
+            sub_requests: The typed parts of the message.
+
+        Returns:
+            The responses of all parts, in message order.
+        """
+        responses = execute_sub_requests(
+            sub_requests,
+            lambda sub_request: self.handle_request(sub_request.intent, {"user_input": sub_request.text}),
+        )
+        return "\n\n".join(responses)
+
+    def process_batch(
+        self,
+        requests,
+        checkpoint_path: Optional[str] = None,
+        max_concurrency: int = BATCH_CONCURRENCY,
+        chunk_size: int = BATCH_CHUNK_SIZE,
+    ) -> Iterator[BatchResult]:
+        """Process queued requests in bulk, e.g. a spreadsheet of claim questions.
+
+        Requests are grouped by intent and run through the chains' batch
+        interfaces without session history (see batch.py).
+
+        Args:
+            requests: A CSV path or an iterable of messages.
+            checkpoint_path: JSON lines file of results used to resume the batch.
+            max_concurrency: Maximum model calls in flight per stage.
+            chunk_size: Requests classified and grouped together.
+
+        Returns:
+            An iterator of the results, yielded as their intent group completes.
+        """
+        processor = BatchProcessor(self, max_concurrency=max_concurrency, chunk_size=chunk_size)
+        return processor.run(requests, checkpoint_path)
+
     def save_memory(self) -> None:
         """Save the current memory state of the bot."""
         self.memory.save_session_history(self.username, self.conversation_id)
 
-    def process_user_input(self, user_input: Dict[str, str]) -> str:
+    def save_memory_in_background(self) -> int:
+        """Queue saving the current memory state of the bot on a background worker.
+
+        Returns:
+            The id of the job, shared with an identical job still waiting.
+        """
+        return enqueue(
+            "save_history",
+            {"user_id": self.username, "conversation_id": self.conversation_id},
+            dedupe_key=f"save_history:{self.username}:{self.conversation_id}",
+            local=True,
+        )
+
+    def process_user_input(self, user_input: Dict[str, str], profile: Optional[bool] = None) -> str:
         """Process user input by routing through the appropriate intention pipeline.
 
         Args:
             user_input: The input text from the user.
+            profile: Whether to profile the request; by default the
+                SECURESHIELD_PROFILE settings decide (see profiling.py).
 
         Returns:
             The content of the response after processing through the chains.
         """
-        # Detect if there are dangers of prompt injection in the user input
-        prompt_injection_chain = IsPromptInjection()
-        result = prompt_injection_chain.invoke(user_input).is_prompt_injection
-
-        if not result:
-            # Classify the user's intent based on their input
-            intention = self.get_user_intent(user_input)
-
-            # Route the input based on the identified intention
-            handler = self.intent_handlers.get(intention, self.handle_unknown_intent)
-            return handler(user_input)
-        else:
-            return "It was detected prompt injection risks or malicious content in your input."
+        # Pick up the exchanges another worker added to this session
+        self.memory.sync_session_history(self.username, self.conversation_id)
+        # Messages added by this request are annotated with its intent and latency
+        history = self.memory.get_session_history(self.username, self.conversation_id)
+        first_message = len(history)
+        start = time.perf_counter()
+        intent = None
+        with start_trace(user=getattr(self, "username", None)) as trace, profile_request(
+            trace.request_id if trace is not None else None, profile
+        ) as profiler:
+            try:
+                # Detect if there are dangers of prompt injection in the user input
+                with span("prompt_injection"):
+                    # The verdict only depends on the text, so identical inputs share one check
+                    prompt_injection_chain = IsPromptInjection(registry=self.registry)
+                    verdict, _ = coalesce(
+                        ("prompt_injection", normalize_text(user_input["user_input"])),
+                        lambda: prompt_injection_chain.invoke(user_input),
+                    )
+                    result = verdict.is_prompt_injection
+
+                if not result and self.awaits_confirmation(user_input):
+                    # The reply to a previewed bulk update goes back to the update chain
+                    intent = "Update_Claim_Status"
+                    if trace is not None:
+                        trace.set("intent", intent)
+                    return self.handle_request(intent, user_input)
+
+                if not result:
+                    # Split compound messages and classify the intent of each part
+                    with span("intent"):
+                        sub_requests = decompose_request(user_input["user_input"], self.get_user_intents)
+
+                    if len(sub_requests) == 1:
+                        intent = sub_requests[0].intent
+                        if trace is not None:
+                            trace.set("intent", intent)
+                        return self.handle_request(intent, user_input)
+
+                    intent = "multi"
+                    if trace is not None:
+                        trace.set("intent", intent)
+                        trace.set("sub_intents", ",".join(str(sub.intent) for sub in sub_requests))
+                    return self.handle_sub_requests(sub_requests)
+                else:
+                    intent = "prompt_injection"
+                    if trace is not None:
+                        trace.set("intent", intent)
+                    if isinstance(verdict, UnverifiedInput):
+                        # The check failed closed; the input was not judged malicious
+                        if trace is not None:
+                            trace.set("unverified", True)
+                        return UNVERIFIED_INPUT_RESPONSE
+                    return "It was detected prompt injection risks or malicious content in your input."
+            finally:
+                history.annotate(first_message, intent, (time.perf_counter() - start) * 1000)
+                self.memory.publish_session_history(self.username, self.conversation_id)
+                if profiler is not None:
+                    profiler.intent = intent
@@ -0,0 +1,232 @@
+# Import necessary modules and classes
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+# Statuses a claim can be set to
+CLAIM_STATUSES = ("pending", "approved", "denied")
+
+# Largest number of claims a single message may update
+MAX_BULK_UPDATE = 1000
+
+# Seconds a previewed bulk update can be confirmed in
+CONFIRMATION_TTL = 300.0
+
+# Sessions whose previewed bulk update is kept at once
+MAX_PENDING_UPDATES = 1000
+
+# Replies accepted as the explicit confirmation or cancellation of a previewed update
+CONFIRM_PATTERN = re.compile(r"^(?:(?:yes|ok|okay|please)\s+)*(?:confirm(?:ed)?|apply(?: it)?|proceed|go ahead)(?:\s+please)?$")
+CANCEL_PATTERN = re.compile(r"^(?:(?:no|please)\s+)*(?:cancel|abort|discard(?: it)?|never mind|no)(?:\s+please)?$")
+
+
+class ClaimIdRange(BaseModel):
+    """Inclusive range of claim ids, e.g. claims 101 to 180."""
+
+    start: int
+    end: int
+
+
+class ClaimSelection(BaseModel):
+    """Claims targeted by a status update.
+
+    Explicit ids and ranges are combined with OR; the policy and current
+    status filters narrow the result with AND.
+    """
+
+    claim_ids: List[int] = Field(default_factory=list, description="Explicit claim ids")
+    ranges: List[ClaimIdRange] = Field(default_factory=list, description="Inclusive claim id ranges")
+    policy_id: Optional[int] = Field(default=None, description="Only claims of this policy")
+    current_status: Optional[str] = Field(default=None, description="Only claims currently in this status")
+
+    def is_empty(self) -> bool:
+        return not (self.claim_ids or self.ranges or self.policy_id is not None or self.current_status)
+
+    def where_clause(self) -> Tuple[str, List[Any]]:
+        """Build the SQL condition and parameters selecting the claims."""
+        selectors: List[str] = []
+        params: List[Any] = []
+        if self.claim_ids:
+            selectors.append("claim_id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(self.claim_ids))
+        for claim_range in self.ranges:
+            selectors.append("claim_id BETWEEN ? AND ?")
+            params.extend([min(claim_range.start, claim_range.end), max(claim_range.start, claim_range.end)])
+
+        conditions = [f"({' OR '.join(selectors)})"] if selectors else []
+        if self.policy_id is not None:
+            conditions.append("policy_id = ?")
+            params.append(self.policy_id)
+        if self.current_status:
+            conditions.append("status = ?")
+            params.append(self.current_status.lower())
+        return " AND ".join(conditions), params
+
+
+class UpdateResult(BaseModel):
+    """Outcome of a (possibly previewed) bulk status update."""
+
+    new_status: str
+    matched: int = Field(description="Number of claims selected")
+    counts_by_status: Dict[str, int] = Field(description="Selected claims per status before the update")
+    applied: bool = Field(description="Whether the update was written")
+    needs_confirmation: bool = Field(
+        default=False, description="Whether the update touches several claims and waits for a confirmation"
+    )
+
+    def describe(self) -> str:
+        """Summarize the result for the response prompt."""
+        if self.matched == 0:
+            return "not_found: no claims matched the request."
+        breakdown = ", ".join(f"{status}: {count}" for status, count in sorted(self.counts_by_status.items()))
+        if self.needs_confirmation:
+            return (
+                f"preview: {self.matched} claims would be set to '{self.new_status}' (currently {breakdown}). "
+                "Nothing was changed; the employee has to confirm the update first."
+            )
+        if not self.applied:
+            return f"preview: {self.matched} claims would be set to '{self.new_status}' (currently {breakdown})."
+        return f"success: {self.matched} claims set to '{self.new_status}' (previously {breakdown})."
+
+
+def count_by_status(con: sqlite3.Connection, selection: ClaimSelection) -> Dict[str, int]:
+    """Count the selected claims per current status."""
+    where, params = selection.where_clause()
+    rows = con.execute(f"SELECT status, COUNT(*) FROM Claims WHERE {where} GROUP BY status", params)
+    return {status: count for status, count in rows}
+
+
+def update_claim_statuses(
+    con: sqlite3.Connection,
+    selection: ClaimSelection,
+    new_status: str,
+    dry_run: bool = False,
+    confirmed_matched: Optional[int] = None,
+) -> UpdateResult:
+    """Preview or apply a status change to all selected claims in one transaction.
+
+    The selection is counted and updated with a single set-based UPDATE inside
+    one immediate transaction, so concurrent writers cannot change the rows
+    between the count and the write. If the connection is already in a
+    transaction (a batch of updates), the update runs in a savepoint of it
+    instead, so a failed update only rolls back its own changes.
+
+    An update selecting more than one claim is only written once confirmed:
+    without `confirmed_matched`, or if the selection no longer matches the
+    confirmed number of claims, it is previewed with `needs_confirmation` set.
+
+    Args:
+        con: Open database connection.
+        selection: Claims to update.
+        new_status: Status to set.
+        dry_run: Only count the selected claims without writing.
+        confirmed_matched: Number of claims of the preview the employee confirmed.
+
+    Returns:
+        The UpdateResult with per-status counts.
+
+    Raises:
+        ValueError: If the selection is empty, the status is unknown or the
+            selection exceeds MAX_BULK_UPDATE claims.
+    """
+    new_status = new_status.lower()
+    if new_status not in CLAIM_STATUSES:
+        raise ValueError(f"Unknown claim status '{new_status}'.")
+    if selection.is_empty():
+        raise ValueError("No claims were selected for the update.")
+
+    where, params = selection.where_clause()
+    nested = con.in_transaction
+    if nested:
+        con.execute("SAVEPOINT claim_update")
+    else:
+        con.isolation_level = None
+        con.execute("BEGIN IMMEDIATE")
+    try:
+        counts = count_by_status(con, selection)
+        matched = sum(counts.values())
+        if matched > MAX_BULK_UPDATE:
+            raise ValueError(
+                f"{matched} claims matched; at most {MAX_BULK_UPDATE} can be updated at once."
+            )
+
+        applied = False
+        needs_confirmation = matched > 1 and matched != confirmed_matched
+        if not dry_run and matched and not needs_confirmation:
+            con.execute(f"UPDATE Claims SET status = ? WHERE {where}", [new_status, *params])
+            applied = True
+        con.execute("RELEASE claim_update" if nested else "COMMIT")
+    except Exception:
+        if nested:
+            con.execute("ROLLBACK TO claim_update")
+            con.execute("RELEASE claim_update")
+        else:
+            con.execute("ROLLBACK")
+        raise
+
+    return UpdateResult(
+        new_status=new_status,
+        matched=matched,
+        counts_by_status=counts,
+        applied=applied,
+        needs_confirmation=needs_confirmation and not dry_run,
+    )
+
+
+class PendingUpdate(BaseModel):
+    """A previewed bulk update waiting for the employee's confirmation."""
+
+    selection: ClaimSelection
+    new_status: str
+    matched: int
+    expires_at: float
+
+
+_pending_updates: "OrderedDict[Tuple[str, str], PendingUpdate]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def parse_confirmation(text: str) -> Optional[bool]:
+    """Return True for an explicit confirmation, False for a cancellation and None otherwise."""
+    reply = " ".join(re.sub(r"[^a-z ]", " ", text.lower()).split())
+    if CONFIRM_PATTERN.match(reply):
+        return True
+    if CANCEL_PATTERN.match(reply):
+        return False
+    return None
+
+
+def remember_pending_update(session: Tuple[str, str], selection: ClaimSelection, result: UpdateResult) -> None:
+    """Keep a previewed update of a session until it is confirmed, cancelled or expires."""
+    with _lock:
+        _pending_updates[session] = PendingUpdate(
+            selection=ClaimSelection(**selection.model_dump(include=set(ClaimSelection.model_fields))),
+            new_status=result.new_status,
+            matched=result.matched,
+            expires_at=time.time() + CONFIRMATION_TTL,
+        )
+        _pending_updates.move_to_end(session)
+        while len(_pending_updates) > MAX_PENDING_UPDATES:
+            _pending_updates.popitem(last=False)
+
+
+def has_pending_update(session: Tuple[str, str]) -> bool:
+    """Return whether a session has a previewed update that can still be confirmed."""
+    with _lock:
+        pending = _pending_updates.get(session)
+        return pending is not None and pending.expires_at > time.time()
+
+
+def pop_pending_update(session: Tuple[str, str]) -> Optional[PendingUpdate]:
+    """Remove and return the previewed update of a session, unless it expired."""
+    with _lock:
+        pending = _pending_updates.pop(session, None)
+    if pending is None or pending.expires_at <= time.time():
+        return None
+    return pending
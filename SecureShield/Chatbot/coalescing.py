@@ -0,0 +1,141 @@
+# Import necessary modules and classes
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from tracing import metrics
+
+# Set SECURESHIELD_COALESCING=0 to run every request independently
+ENABLED = os.getenv("SECURESHIELD_COALESCING", "1") != "0"
+
+# Seconds a finished session-scoped result is reused for duplicate submissions
+DEFAULT_DEDUPE_WINDOW = float(os.getenv("SECURESHIELD_DEDUPE_WINDOW", "2.0"))
+
+# Finished results kept for the dedupe window, oldest dropped first
+MAX_RECENT = 4096
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", text.strip().lower()).rstrip(" .!?")
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "done_at", "window")
+
+    def __init__(self, window: float):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.done_at: Optional[float] = None
+        self.window = window
+
+
+class SingleFlight:
+    """Runs one execution per key and shares its result with concurrent callers.
+
+    Callers arriving while the leader runs wait for it and receive its result
+    (or exception). With a positive window, the result of a successful call is
+    also returned to callers arriving shortly after it finished, e.g. a
+    double-clicked submission.
+    """
+
+    def __init__(self, max_recent: int = MAX_RECENT):
+        self.max_recent = max_recent
+        self._calls: "OrderedDict[Hashable, _Call]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any], window: float = 0.0) -> Tuple[Any, bool]:
+        """Run `fn` once for all concurrent callers with the same key.
+
+        Args:
+            key: Identity of the request.
+            fn: The work to run if no identical request is in flight.
+            window: Seconds the finished result stays reusable.
+
+        Returns:
+            The result and whether it was shared from another caller.
+        """
+        now = time.monotonic()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.done_at is not None and (
+                call.error is not None or now - call.done_at >= call.window
+            ):
+                del self._calls[key]
+                call = None
+            leader = call is None
+            if leader:
+                call = _Call(window)
+                self._calls[key] = call
+                self._prune()
+
+        if not leader:
+            call.event.wait()
+            metrics.inc("secureshield_coalesced_total")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.done_at = time.monotonic()
+            call.event.set()
+            if call.error is not None or call.window <= 0:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+        return call.result, False
+
+    def _prune(self) -> None:
+        # Drop the oldest finished results; in-flight calls are never dropped
+        for key, call in list(self._calls.items()):
+            if len(self._calls) <= self.max_recent:
+                break
+            if call.done_at is not None:
+                del self._calls[key]
+
+
+_single_flight = SingleFlight()
+
+
+def coalesce(key: Hashable, fn: Callable[[], Any], window: float = 0.0) -> Tuple[Any, bool]:
+    """Run `fn` through the process-wide single-flight group (if enabled)."""
+    if not ENABLED:
+        return fn(), False
+    return _single_flight.do(key, fn, window)
+
+
+def coalesce_read(stage: str, user_input: Dict[str, Any], deterministic: Callable[[Dict], Any], fn: Callable[[], Any]) -> Any:
+    """Share a read stage across sessions when the message holds all its parameters.
+
+    Requests are keyed on the stage, the normalized input and the parameters
+    `deterministic` extracts from the message. Messages that depend on the
+    conversation, such as "next page", or whose parameters are not all in
+    the text run `fn` on their own.
+
+    Args:
+        stage: Name of the stage, e.g. 'claim_info.extract'.
+        user_input: The stage input, with the message in "user_input".
+        deterministic: Model-free extractor of the request parameters.
+        fn: The stage to run.
+
+    Returns:
+        The result of `fn`, possibly computed for another session.
+    """
+    try:
+        parameters = deterministic(user_input)
+    except ValueError:
+        parameters = None
+    if parameters is None or getattr(parameters, "query_type", None) == "next_page":
+        return fn()
+    key = (stage, normalize_text(user_input["user_input"]), parameters.model_dump_json())
+    result, _ = coalesce(key, fn)
+    return result
@@ -0,0 +1,147 @@
+# Import necessary modules and classes
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from ingestion import chunk_label
+
+# Set SECURESHIELD_RAG_COMPRESSION=0 to pass the retrieved chunks to the prompt unchanged
+ENABLED = os.getenv("SECURESHIELD_RAG_COMPRESSION", "1") != "0"
+
+# Estimated tokens of retrieved context allowed in the RAG prompt
+DEFAULT_TOKEN_BUDGET = int(os.getenv("SECURESHIELD_RAG_CONTEXT_TOKENS", "400"))
+
+# Sentences scoring below this fraction of the best sentence are dropped
+MIN_RELATIVE_SCORE = 0.25
+
+# Token overlap above which a sentence repeats one already kept
+DUPLICATE_OVERLAP = 0.85
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+(?=[A-Z$•])|\s*•\s*")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i if in is it its my of on or our "
+    "the their there this to up was we what when which who will with you your".split()
+)
+
+
+def _tokens(text: str) -> List[str]:
+    # Lowercase words without stopwords and with a plural "s" stripped
+    words = re.findall(r"[a-z0-9$]+", text.lower())
+    return [word[:-1] if len(word) > 3 and word.endswith("s") else word for word in words if word not in STOPWORDS]
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def split_sentences(document: Document) -> Tuple[str, List[str]]:
+    """Return the heading of a chunk and its sentences."""
+    label = chunk_label(document.metadata)
+    text = document.page_content
+    if label and text.startswith(label + ":"):
+        text = text[len(label) + 1:]
+    return label, [sentence.strip() for sentence in SENTENCE_PATTERN.split(text) if sentence.strip()]
+
+
+def score_sentences(question: str, sentences: Sequence[str]) -> List[float]:
+    """Score sentences against a question with BM25 over the candidate sentences."""
+    query = set(_tokens(question))
+    tokenized = [_tokens(sentence) for sentence in sentences]
+    if not query or not tokenized:
+        return [0.0] * len(sentences)
+
+    average_length = sum(len(tokens) for tokens in tokenized) / len(tokenized) or 1.0
+    document_frequency = Counter(token for tokens in tokenized for token in set(tokens) if token in query)
+    idf = {
+        token: math.log(1 + (len(tokenized) - count + 0.5) / (count + 0.5))
+        for token, count in document_frequency.items()
+    }
+
+    scores = []
+    for tokens in tokenized:
+        counts = Counter(tokens)
+        norm = K1 * (1 - B + B * len(tokens) / average_length)
+        scores.append(sum(idf[token] * counts[token] * (K1 + 1) / (counts[token] + norm) for token in idf if counts[token]))
+    return scores
+
+
+def compress_context(
+    question: str, documents: Sequence[Document], token_budget: int = DEFAULT_TOKEN_BUDGET
+) -> Tuple[str, Dict[str, int]]:
+    """Keep the sentences of the retrieved chunks most relevant to the question.
+
+    Sentences are scored with BM25 against the question, those far below the
+    best one and repeats of already kept sentences (overlapping chunks) are
+    dropped, and the rest are packed best first until the token budget is
+    used. The kept sentences are returned in document order, under the
+    heading of their chunk. If no sentence shares a word with the question,
+    sentences are packed in retrieval order instead.
+
+    Args:
+        question: The employee's question.
+        documents: The retrieved chunks, best first.
+        token_budget: Estimated tokens the context may use.
+
+    Returns:
+        The context for the prompt and the estimated tokens before and after.
+    """
+    labels: List[str] = []
+    candidates: List[Tuple[int, int, str]] = []  # (document, position, sentence)
+    for doc_index, document in enumerate(documents):
+        label, sentences = split_sentences(document)
+        labels.append(label)
+        candidates.extend((doc_index, position, sentence) for position, sentence in enumerate(sentences))
+
+    tokens_in = sum(_estimate_tokens(document.page_content) for document in documents)
+    # Headings are scored with their sentences, so "Gold plan" matches the Gold chunks
+    scores = score_sentences(question, [f"{labels[doc]} {sentence}" for doc, _, sentence in candidates])
+    best = max(scores, default=0.0)
+    if best > 0:
+        order = sorted(range(len(candidates)), key=lambda i: -scores[i])
+        order = [i for i in order if scores[i] >= MIN_RELATIVE_SCORE * best]
+    else:
+        order = list(range(len(candidates)))
+
+    kept: List[int] = []
+    kept_tokens: List[set] = []
+    kept_documents: set = set()
+    used = 0
+    for i in order:
+        sentence = candidates[i][2]
+        tokens = set(_tokens(sentence))
+        if any(len(tokens & other) >= DUPLICATE_OVERLAP * max(len(tokens), len(other), 1) for other in kept_tokens):
+            continue
+        # The first sentence of a chunk also brings in its heading
+        doc_index = candidates[i][0]
+        cost = _estimate_tokens(sentence)
+        if labels[doc_index] and doc_index not in kept_documents:
+            cost += _estimate_tokens(labels[doc_index])
+        if kept and used + cost > token_budget:
+            continue
+        kept.append(i)
+        kept_tokens.append(tokens)
+        kept_documents.add(doc_index)
+        used += cost
+
+    grouped: Dict[int, List[str]] = {}
+    for i in sorted(kept, key=lambda i: candidates[i][:2]):
+        grouped.setdefault(candidates[i][0], []).append(candidates[i][2])
+    context = "\n\n".join(
+        (f"{labels[doc_index]}: " if labels[doc_index] else "") + " ".join(sentences)
+        for doc_index, sentences in grouped.items()
+    )
+    return context, {
+        "sentences_in": len(candidates),
+        "sentences_kept": len(kept),
+        "tokens_in": tokens_in,
+        "tokens_out": _estimate_tokens(context) if context else 0,
+    }
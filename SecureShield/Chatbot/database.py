@@ -0,0 +1,95 @@
+# Import necessary modules and classes
+import os
+import sqlite3
+from typing import Optional
+
+# Default location of the SecureShield database, relative to the repository root
+DEFAULT_DB_PATH = "SecureShield/secure_shield.db"
+
+# Tables of the SecureShield database, as created in router/database.ipynb
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Employees (
+    employee_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    role CHECK(role IN ('Claims Adjuster', 'Manager')),
+    password TEXT NOT NULL,
+    conversation_id INTEGER DEFAULT 0,
+    password_hash TEXT,
+    password_salt TEXT
+);
+
+CREATE TABLE IF NOT EXISTS Clients (
+    client_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    age INTEGER NOT NULL,
+    gender TEXT NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    phone TEXT NOT NULL,
+    policy_id INTEGER,
+    FOREIGN KEY (policy_id) REFERENCES Policies(policy_id)
+);
+
+CREATE TABLE IF NOT EXISTS Claims (
+    claim_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    policy_id INTEGER NOT NULL,
+    claim_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    submission_date DATE NOT NULL,
+    resolution_date DATE,
+    amount_claimed REAL NOT NULL,
+    amount_approved REAL,
+    approved_by INTEGER,
+    FOREIGN KEY (user_id) REFERENCES Clients(client_id),
+    FOREIGN KEY (policy_id) REFERENCES Policies(policy_id),
+    FOREIGN KEY (approved_by) REFERENCES Employees(employee_id)
+);
+
+CREATE TABLE IF NOT EXISTS Policies (
+    policy_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    policy_type CHECK(policy_type IN ('Health', 'House', 'Car')),
+    policy_level CHECK(policy_level IN ('Bronze', 'Silver', 'Gold')),
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    pdf_path TEXT,
+    FOREIGN KEY (user_id) REFERENCES Clients(client_id)
+);
+"""
+
+
+def get_db_path() -> str:
+    """Return the database path, overridable with SECURESHIELD_DB_PATH."""
+    return os.getenv("SECURESHIELD_DB_PATH", DEFAULT_DB_PATH)
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    """Open a connection to the SecureShield database.
+
+    Args:
+        path: Database file to open. Defaults to `get_db_path()`.
+
+    Returns:
+        A new sqlite3 connection.
+    """
+    return sqlite3.connect(path or get_db_path())
+
+
+def create_schema(con: sqlite3.Connection) -> None:
+    """Create the SecureShield tables if they do not exist yet."""
+    con.executescript(SCHEMA)
+    con.commit()
+
+
+def migrate(con: sqlite3.Connection) -> None:
+    """Install the tables and triggers the chatbot derives from the SecureShield tables.
+
+    Run once at startup, before serving requests; safe to run repeatedly.
+    """
+    from analytics import install_claim_stats
+    from hot_tables import install_version_triggers
+
+    install_version_triggers(con)
+    install_claim_stats(con)
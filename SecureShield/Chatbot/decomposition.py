@@ -0,0 +1,110 @@
+# Import necessary modules and classes
+import contextvars
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+# Intents that modify the database; they run before any read of the same message
+WRITE_INTENTS = {"Update_Claim_Status"}
+
+# Conjunctions that may join two requests; captured so parts can be rejoined
+SPLIT_PATTERN = re.compile(r"(\s*;\s*|,?\s+and then\s+|,?\s+then\s+|,?\s+and also\s+|,?\s+also\s+|,?\s+and\s+)", re.IGNORECASE)
+
+# Threads running the read sub-requests of compound messages
+MAX_WORKERS = int(os.getenv("SECURESHIELD_DECOMPOSE_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="subrequest")
+
+
+class SubRequest(BaseModel):
+    """One typed part of a compound user message."""
+
+    text: str = Field(description="The part of the message making this request")
+    intent: Optional[str] = Field(description="The intent classified for the part")
+    write: bool = Field(default=False, description="Whether the request modifies the database")
+
+
+def decompose_request(text: str, classify: Callable[[List[str]], List[Optional[str]]]) -> List[SubRequest]:
+    """Split a message into sub-requests of different intents.
+
+    The message is cut at conjunctions and the whole message and every part
+    are classified together, with one encoder call. Parts without an intent,
+    or with the same intent as the part before them, are joined back to it,
+    so "update claims 4 and 5 to denied" stays one request while "update
+    claim 4 to approved and show me policy 12" becomes two. A message that
+    stays one request takes the intent of the whole message.
+
+    Args:
+        text: The user message.
+        classify: Returns the intents of several texts, None where no route matches.
+
+    Returns:
+        The sub-requests in message order; a single one for simple messages.
+    """
+    pieces = SPLIT_PATTERN.split(text)
+    if len(pieces) == 1:
+        intent = classify([text])[0]
+        return [SubRequest(text=text, intent=intent, write=intent in WRITE_INTENTS)]
+
+    # pieces alternates between parts and the separators joining them
+    part_texts = [piece.strip() for piece in pieces[::2]]
+    intents = classify([text] + [part for part in part_texts if part])
+    whole_intent = intents[0]
+    part_intents = iter(intents[1:])
+
+    parts: List[Dict] = []
+    for index, part in enumerate(part_texts):
+        separator = pieces[2 * index - 1] if index else ""
+        intent = next(part_intents) if part else None
+        if parts and (intent is None or intent == parts[-1]["intent"]):
+            parts[-1]["text"] += separator + part
+        elif parts and parts[-1]["intent"] is None:
+            parts[-1]["text"] += separator + part
+            parts[-1]["intent"] = intent
+        else:
+            parts.append({"text": part, "intent": intent})
+
+    if len(parts) <= 1:
+        return [SubRequest(text=text, intent=whole_intent, write=whole_intent in WRITE_INTENTS)]
+    return [SubRequest(**part, write=part["intent"] in WRITE_INTENTS) for part in parts]
+
+
+def execute_sub_requests(sub_requests: List[SubRequest], run: Callable[[SubRequest], str]) -> List[str]:
+    """Run sub-requests, writes first and independent reads concurrently.
+
+    Writes run one after the other in message order, so reads in the same
+    message see their effect. Reads are grouped by intent: groups run in
+    parallel, while requests of the same intent share a chain instance and
+    run one after the other.
+
+    Args:
+        sub_requests: The sub-requests of one message.
+        run: Executes a sub-request and returns its response.
+
+    Returns:
+        The responses in message order.
+    """
+    responses: List[Optional[str]] = [None] * len(sub_requests)
+    for index, sub_request in enumerate(sub_requests):
+        if sub_request.write:
+            responses[index] = run(sub_request)
+
+    groups: Dict[Optional[str], List[int]] = {}
+    for index, sub_request in enumerate(sub_requests):
+        if not sub_request.write:
+            groups.setdefault(sub_request.intent, []).append(index)
+
+    def run_group(indices: List[int]) -> None:
+        for index in indices:
+            responses[index] = run(sub_requests[index])
+
+    # Copy the context so the spans of each group join the request's trace
+    futures = [
+        _executor.submit(contextvars.copy_context().run, run_group, indices) for indices in groups.values()
+    ]
+    for future in futures:
+        future.result()
+    return responses
@@ -0,0 +1,184 @@
+# Import necessary modules and classes
+import bisect
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# Set SECURESHIELD_HOT_CACHE=0 to always read Policies and Clients from disk
+ENABLED = os.getenv("SECURESHIELD_HOT_CACHE", "1") != "0"
+
+# Change counters of the cached tables, bumped by triggers on every write
+VERSIONS_STATEMENTS = (
+    """
+    CREATE TABLE IF NOT EXISTS TableVersions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+) + tuple(
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {table.lower()}_version_{event.lower()} AFTER {event} ON {table}
+    BEGIN
+        INSERT INTO TableVersions (name, version) VALUES ('{table}', 1)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1;
+    END
+    """
+    for table in ("Policies", "Clients")
+    for event in ("INSERT", "UPDATE", "DELETE")
+)
+
+# Columns returned by each lookup, matching the SQL the chains used before
+LOOKUP_COLUMNS = {
+    "policy": None,  # all Policies columns
+    "policies_by_type": ["policy_id", "user_id", "policy_level"],
+    "policies_by_client": ["policy_id", "policy_type", "policy_level"],
+}
+
+
+class HotTables:
+    """Read-through in-memory copy of the small, read-mostly tables.
+
+    Holds Policies indexed by id, type and client, and the client name to id
+    map. Freshness is checked on every lookup: `PRAGMA data_version` on a
+    dedicated connection changes whenever any other connection commits, and
+    only then are the Policies/Clients change counters read. Writes to other
+    tables, such as claim status updates, therefore never trigger a reload,
+    while writes to the cached tables are visible on the next lookup.
+
+    The counters are installed by `install_version_triggers` when the database
+    is migrated; until then every commit to the database triggers a reload.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._data_version: Optional[int] = None
+        self._table_versions: Optional[Dict[str, int]] = None
+        self.reloads = 0
+
+        self.policy_columns: List[str] = []
+        self.policies: Dict[int, Tuple[Any, ...]] = {}
+        self.policies_by_type: Dict[str, List[Tuple[Any, ...]]] = {}
+        self.policies_by_client: Dict[int, List[Tuple[Any, ...]]] = {}
+        self.client_ids_by_name: Dict[str, int] = {}
+        self.client_ids: set = set()
+
+    def _refresh(self) -> None:
+        data_version = self._con.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        try:
+            table_versions = dict(self._con.execute("SELECT name, version FROM TableVersions"))
+        except sqlite3.OperationalError:
+            # Not migrated yet: any commit may have changed the cached tables
+            table_versions = None
+        if table_versions is not None and table_versions == self._table_versions:
+            return
+        self._load()
+        self._table_versions = table_versions
+
+    def _load(self) -> None:
+        cursor = self._con.execute("SELECT * FROM Policies ORDER BY policy_id")
+        columns = [description[0] for description in cursor.description]
+        index = {column: position for position, column in enumerate(columns)}
+        policies, by_type, by_client = {}, {}, {}
+        for row in cursor:
+            policies[row[index["policy_id"]]] = row
+            by_type.setdefault(row[index["policy_type"]], []).append(
+                (row[index["policy_id"]], row[index["user_id"]], row[index["policy_level"]])
+            )
+            by_client.setdefault(row[index["user_id"]], []).append(
+                (row[index["policy_id"]], row[index["policy_type"]], row[index["policy_level"]])
+            )
+
+        client_ids_by_name, client_ids = {}, set()
+        for client_id, name in self._con.execute("SELECT client_id, name FROM Clients ORDER BY client_id"):
+            client_ids_by_name.setdefault(name, client_id)
+            client_ids.add(client_id)
+
+        self.policy_columns = columns
+        self.policies = policies
+        self.policies_by_type = by_type
+        self.policies_by_client = by_client
+        self.client_ids_by_name = client_ids_by_name
+        self.client_ids = client_ids
+        self.reloads += 1
+
+    def resolve_client(self, value: Any) -> Optional[int]:
+        """Return the id of a client given by name or id, like `name = ? OR client_id = ?`."""
+        with self._lock:
+            self._refresh()
+            if str(value) in self.client_ids_by_name:
+                return self.client_ids_by_name[str(value)]
+            try:
+                client_id = int(value)
+            except (TypeError, ValueError):
+                return None
+            return client_id if client_id in self.client_ids else None
+
+    def lookup(self, name: str, value: Any) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+        """Return the columns and rows of a lookup, ordered by policy_id.
+
+        Args:
+            name: One of the keys of LOOKUP_COLUMNS.
+            value: Policy id, policy type or client (name or id).
+        """
+        if name == "policies_by_client":
+            client_id = self.resolve_client(value)
+        with self._lock:
+            self._refresh()
+            if name == "policy":
+                try:
+                    row = self.policies.get(int(value))
+                except (TypeError, ValueError):
+                    row = None
+                return self.policy_columns, [row] if row else []
+            if name == "policies_by_type":
+                return LOOKUP_COLUMNS[name], self.policies_by_type.get(value, [])
+            if name == "policies_by_client":
+                return LOOKUP_COLUMNS[name], self.policies_by_client.get(client_id, [])
+        raise ValueError(f"Unknown lookup '{name}'.")
+
+    def close(self) -> None:
+        self._con.close()
+
+
+def install_version_triggers(con: sqlite3.Connection) -> None:
+    """Create the change counters of the cached tables and their triggers if missing."""
+    with con:
+        for statement in VERSIONS_STATEMENTS:
+            con.execute(statement)
+
+
+def rows_after(rows: List[Tuple[Any, ...]], key_index: int, after: Optional[Any]) -> List[Tuple[Any, ...]]:
+    """Return the rows (sorted by the key column) whose key is greater than `after`."""
+    if after is None:
+        return rows
+    keys = [row[key_index] for row in rows]
+    return rows[bisect.bisect_right(keys, after):]
+
+
+_hot_tables: Dict[str, HotTables] = {}
+_registry_lock = threading.Lock()
+
+
+def get_hot_tables(path: str) -> Optional[HotTables]:
+    """Return the shared cache of a database file, or None if caching is off.
+
+    In-memory databases are never cached.
+    """
+    if not ENABLED or not path or path == ":memory:":
+        return None
+    path = os.path.abspath(path)
+    with _registry_lock:
+        if path not in _hot_tables:
+            _hot_tables[path] = HotTables(path)
+        return _hot_tables[path]
+
+
+def database_path(con: sqlite3.Connection) -> str:
+    """Return the file of the main database of a connection ('' if in memory)."""
+    return con.execute("PRAGMA database_list").fetchone()[2]
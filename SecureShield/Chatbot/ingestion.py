@@ -0,0 +1,230 @@
+"""Split the policy documents into tagged chunks and load them into Pinecone.
+
+Each chunk carries the metadata RagChain filters on:
+
+* product: AutoGuard, HealthCare or HomeProtect
+* policy_type: the matching `Policies.policy_type` (Car, Health or House)
+* tier: Bronze, Silver or Gold, or "all" for text that applies to every tier
+* section: the heading the chunk was found under, e.g. "C1. Collision Coverage"
+
+Coverage subsections (C1, C2, ...) are split per tier so a question about one
+plan only retrieves that plan's limits; other sections are kept whole.
+
+Usage:
+    python SecureShield/Chatbot/ingestion.py --dry-run
+    python SecureShield/Chatbot/ingestion.py --index documents
+"""
+
+# Import necessary modules and classes
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+POLICIES_DIR = os.path.join(os.path.dirname(os.path.dirname(BASE_DIR)), "Policies")
+
+INDEX_NAME = "documents"
+
+# Product of each policy type in the Policies table
+PRODUCTS: Dict[str, str] = {"Car": "AutoGuard", "Health": "HealthCare", "House": "HomeProtect"}
+
+TIERS = ("Bronze", "Silver", "Gold")
+
+# Tier of chunks that apply to every plan
+ALL_TIERS = "all"
+
+SECTION_PATTERN = re.compile(r"^([A-Z])(\d*)\.\s+(.+?)\s*$")
+TIER_PATTERN = re.compile(r"^•\s*(Bronze|Silver|Gold) Plan:\s*(.*)$")
+
+# Longest chunk kept whole; longer sections are cut at line boundaries
+MAX_CHUNK_CHARS = 1500
+
+
+def product_of(path: str) -> str:
+    """Return the product a policy document describes, from its file name."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name not in PRODUCTS.values():
+        raise ValueError(f"Unknown policy document '{path}'.")
+    return name
+
+
+def chunk_label(metadata: Dict) -> str:
+    """Return the heading prefixed to a chunk, e.g. "AutoGuard C1. Collision Coverage (Gold Plan)"."""
+    if "product" not in metadata or "section" not in metadata:
+        return ""
+    tier = metadata.get("tier", ALL_TIERS)
+    return f"{metadata['product']} {metadata['section']}" + (f" ({tier} Plan)" if tier != ALL_TIERS else "")
+
+
+def _chunk(product: str, section: str, tier: str, lines: List[str], source: str) -> List[Document]:
+    # The heading is repeated in every chunk so each one embeds with its context
+    label = chunk_label({"product": product, "section": section, "tier": tier})
+    policy_type = next(key for key, value in PRODUCTS.items() if value == product)
+    pieces: List[List[str]] = [[]]
+    for line in lines:
+        if pieces[-1] and sum(len(text) for text in pieces[-1]) + len(line) > MAX_CHUNK_CHARS:
+            pieces.append([])
+        pieces[-1].append(line)
+
+    return [
+        Document(
+            page_content=f"{label}: " + " ".join(piece),
+            metadata={
+                "product": product,
+                "policy_type": policy_type,
+                "tier": tier,
+                "section": section,
+                "source": source,
+            },
+        )
+        for piece in pieces
+        if piece
+    ]
+
+
+def split_policy_text(text: str, product: str, source: str = "") -> List[Document]:
+    """Split the text of a policy document into tagged chunks.
+
+    Args:
+        text: The extracted text of the document.
+        product: The product the document describes.
+        source: Path recorded in the chunk metadata.
+
+    Returns:
+        The chunks in document order.
+    """
+    documents: List[Document] = []
+    section = "Introduction"
+    split_tiers = False
+    tier = ALL_TIERS
+    lines: List[str] = []
+
+    def flush() -> None:
+        if lines:
+            documents.extend(_chunk(product, section, tier, lines, source))
+        lines.clear()
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        heading = SECTION_PATTERN.match(line)
+        if heading:
+            flush()
+            section, split_tiers, tier = line, bool(heading.group(2)), ALL_TIERS
+            continue
+        bullet = TIER_PATTERN.match(line) if split_tiers else None
+        if bullet:
+            flush()
+            tier = bullet.group(1)
+            line = bullet.group(2)
+            if not line:
+                continue
+        lines.append(line)
+    flush()
+    return documents
+
+
+def load_policy_document(path: str) -> List[Document]:
+    """Extract the text of a policy PDF and split it into tagged chunks."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    text = "\n".join(page.extract_text() or "" for page in reader.pages)
+    return split_policy_text(text, product_of(path), source=os.path.relpath(path, os.path.dirname(POLICIES_DIR)))
+
+
+def chunk_id(document: Document, position: int) -> str:
+    """Return a stable id, so re-ingesting a document overwrites its chunks."""
+    metadata = document.metadata
+    key = f"{metadata['product']}\0{metadata['section']}\0{metadata['tier']}\0{position}"
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def stored_chunk_ids(vector_store) -> List[str]:
+    """Return the ids of every chunk in a Pinecone or in-memory vector store."""
+    index = getattr(vector_store, "_index", None)
+    if index is not None:
+        # Pinecone lists the ids of a namespace page by page
+        namespace = getattr(vector_store, "_namespace", None) or ""
+        return [chunk for page in index.list(namespace=namespace) for chunk in page]
+    return list(vector_store.store)
+
+
+def ingest_policies(
+    paths: Optional[Sequence[str]] = None,
+    index_name: str = INDEX_NAME,
+    vector_store=None,
+    delete_stale: Optional[bool] = None,
+) -> Dict[str, int]:
+    """Load the policy documents into the vector store.
+
+    Args:
+        paths: Policy PDFs; defaults to every document in Policies/.
+        index_name: Pinecone index to upsert into.
+        vector_store: Vector store to use instead of the Pinecone index.
+        delete_stale: Whether to delete every chunk not written by this run,
+            i.e. the untagged chunks of the old index and the chunks of
+            sections that no longer exist. Defaults to True when all
+            documents are ingested.
+
+    Returns:
+        The number of chunks written per product.
+    """
+    if delete_stale is None:
+        delete_stale = paths is None
+    if paths is None:
+        paths = sorted(os.path.join(POLICIES_DIR, f"{product}.pdf") for product in PRODUCTS.values())
+    if vector_store is None:
+        from langchain_pinecone import PineconeVectorStore
+
+        from transport import get_embeddings, get_pinecone
+
+        vector_store = PineconeVectorStore(
+            index=get_pinecone().Index(index_name), embedding=get_embeddings("text-embedding-ada-002")
+        )
+
+    counts: Dict[str, int] = {}
+    written = set()
+    for path in paths:
+        documents = load_policy_document(path)
+        ids = [chunk_id(doc, i) for i, doc in enumerate(documents)]
+        vector_store.add_documents(documents, ids=ids)
+        written.update(ids)
+        counts[product_of(path)] = len(documents)
+
+    if delete_stale:
+        # Only after the new chunks are in, so searches never find the index empty
+        stale = [chunk for chunk in stored_chunk_ids(vector_store) if chunk not in written]
+        if stale:
+            vector_store.delete(ids=stale)
+        counts["deleted"] = len(stale)
+    return counts
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="Policy PDFs (default: all documents in Policies/)")
+    parser.add_argument("--index", default=INDEX_NAME, help="Pinecone index to load the chunks into")
+    parser.add_argument("--dry-run", action="store_true", help="Print the chunk metadata instead of uploading")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        paths = args.paths or sorted(os.path.join(POLICIES_DIR, f"{product}.pdf") for product in PRODUCTS.values())
+        for path in paths:
+            for document in load_policy_document(path):
+                print(json.dumps({**document.metadata, "chars": len(document.page_content)}))
+        return 0
+
+    print(json.dumps(ingest_policies(args.paths or None, args.index), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,489 @@
+# Import necessary modules and classes
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, MutableMapping, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Default location of the job queue, overridable with SECURESHIELD_JOBS_DB_PATH
+DEFAULT_JOBS_DB_PATH = "SecureShield/secure_shield_jobs.db"
+
+# Set SECURESHIELD_JOB_WORKERS=0 to only queue jobs in this process
+WORKERS = int(os.getenv("SECURESHIELD_JOB_WORKERS", "2"))
+
+# Seconds between polls of an idle worker; new jobs of this process wake it at once
+POLL_INTERVAL = float(os.getenv("SECURESHIELD_JOB_POLL", "1.0"))
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Delay before the first retry, doubled for every further attempt
+RETRY_DELAY = 5.0
+
+# Finished jobs kept in the queue for progress reports
+KEEP_FINISHED = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    dedupe_key TEXT,
+    owner TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    worker TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT NOT NULL DEFAULT '',
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON Jobs(status, run_after);
+CREATE INDEX IF NOT EXISTS jobs_dedupe ON Jobs(dedupe_key, status);
+"""
+
+# Identifies this process as the owner of local jobs and the worker of running ones
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+Handler = Callable[[Dict[str, Any], Callable[[float, str], None]], Any]
+
+_handlers: Dict[str, Handler] = {}
+# Kinds that need the memory of the process that queued them
+_local_kinds: Set[str] = set()
+
+
+def get_jobs_db_path() -> str:
+    """Return the job queue path, overridable with SECURESHIELD_JOBS_DB_PATH."""
+    return os.getenv("SECURESHIELD_JOBS_DB_PATH", DEFAULT_JOBS_DB_PATH)
+
+
+def register_job(kind: str, local: bool = False) -> Callable[[Handler], Handler]:
+    """Register the handler of a job kind.
+
+    Handlers are called with the job payload and a `progress(fraction,
+    message)` callback, and return a JSON-serializable result. An exception
+    fails the attempt; the job is retried until it runs out of attempts.
+    Jobs of a `local` kind are always queued as local jobs.
+    """
+
+    def decorator(handler: Handler) -> Handler:
+        _handlers[kind] = handler
+        if local:
+            _local_kinds.add(kind)
+        return handler
+
+    return decorator
+
+
+def _process_alive(process_id: str) -> bool:
+    # Processes of other hosts cannot be checked and are assumed alive
+    host, _, pid = process_id.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+def _row(cursor: sqlite3.Cursor, row: tuple) -> Dict[str, Any]:
+    job = {column[0]: value for column, value in zip(cursor.description, row)}
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+
+class JobQueue:
+    """SQLite-backed queue of background jobs.
+
+    Queued work survives a restart and is visible to every app process on the
+    host. Worker threads claim jobs oldest first, report their progress on
+    the row and retry failed jobs with exponential backoff up to
+    `max_attempts`. Shared jobs, such as policy ingestion, run in any
+    process; local jobs, such as saving a session's history, only run in the
+    process that queued them and are failed if it exits first. A job with a
+    `dedupe_key` is not queued again while an identical one is waiting, and
+    jobs with the same key never run at the same time.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or get_jobs_db_path()
+        self._wake = threading.Event()
+        con = self._connect()
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(SCHEMA)
+        finally:
+            con.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=30.0)
+        con.isolation_level = None
+        return con
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Optional[Dict[str, Any]] = None,
+        dedupe_key: Optional[str] = None,
+        local: bool = False,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> int:
+        """Queue a job, or return the waiting job with the same dedupe key.
+
+        Only waiting jobs are deduplicated: a running job may have started
+        before the state the new one is meant to pick up.
+
+        Args:
+            kind: Registered job kind.
+            payload: JSON-serializable arguments of the handler.
+            dedupe_key: Key of equivalent jobs, e.g. "save_history:alice:1".
+            local: Only run the job in this process; implied for local kinds.
+            max_attempts: Attempts before the job is marked failed.
+
+        Returns:
+            The job id.
+        """
+        local = local or kind in _local_kinds
+        now = time.time()
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            if dedupe_key is not None:
+                existing = con.execute(
+                    "SELECT job_id FROM Jobs WHERE dedupe_key = ? AND status = 'queued'", (dedupe_key,)
+                ).fetchone()
+                if existing:
+                    con.execute("COMMIT")
+                    return existing[0]
+            cursor = con.execute(
+                """
+                INSERT INTO Jobs (kind, payload, dedupe_key, owner, max_attempts, run_after, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (kind, json.dumps(payload or {}), dedupe_key, PROCESS_ID if local else None, max_attempts, now, now, now),
+            )
+            con.execute("COMMIT")
+        except BaseException:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            raise
+        finally:
+            con.close()
+        self._wake.set()
+        return cursor.lastrowid
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Return a job as a dict of its columns, or None if it does not exist."""
+        con = self._connect()
+        try:
+            cursor = con.execute("SELECT * FROM Jobs WHERE job_id = ?", (job_id,))
+            row = cursor.fetchone()
+            return _row(cursor, row) if row else None
+        finally:
+            con.close()
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Mark the oldest runnable job as running by this process and return it."""
+        now = time.time()
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            cursor = con.execute(
+                """
+                SELECT * FROM Jobs
+                WHERE status = 'queued' AND run_after <= ? AND (owner IS NULL OR owner = ?)
+                  AND (dedupe_key IS NULL OR dedupe_key NOT IN (
+                      SELECT dedupe_key FROM Jobs WHERE status = 'running' AND dedupe_key IS NOT NULL))
+                ORDER BY run_after, job_id
+                LIMIT 1
+                """,
+                (now, PROCESS_ID),
+            )
+            row = cursor.fetchone()
+            if row is None:
+                con.execute("COMMIT")
+                return None
+            job = _row(cursor, row)
+            con.execute(
+                """
+                UPDATE Jobs SET status = 'running', worker = ?, attempts = attempts + 1, updated_at = ?
+                WHERE job_id = ?
+                """,
+                (PROCESS_ID, now, job["job_id"]),
+            )
+            con.execute("COMMIT")
+        except BaseException:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            raise
+        finally:
+            con.close()
+        job["attempts"] += 1
+        return job
+
+    def report_progress(self, job_id: int, progress: float, message: str = "") -> None:
+        con = self._connect()
+        try:
+            con.execute(
+                "UPDATE Jobs SET progress = ?, message = ?, updated_at = ? WHERE job_id = ?",
+                (min(max(progress, 0.0), 1.0), message, time.time(), job_id),
+            )
+        finally:
+            con.close()
+
+    def finish(self, job_id: int, result: Any = None) -> None:
+        con = self._connect()
+        try:
+            con.execute(
+                """
+                UPDATE Jobs SET status = 'done', progress = 1, result = ?, error = NULL, updated_at = ?
+                WHERE job_id = ?
+                """,
+                (json.dumps(result), time.time(), job_id),
+            )
+        finally:
+            con.close()
+
+    def fail(self, job: Dict[str, Any], error: str, retry: bool = True) -> None:
+        """Requeue a failed attempt with backoff, or mark the job failed."""
+        now = time.time()
+        con = self._connect()
+        try:
+            if retry and job["attempts"] < job["max_attempts"]:
+                con.execute(
+                    "UPDATE Jobs SET status = 'queued', run_after = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                    (now + RETRY_DELAY * 2 ** (job["attempts"] - 1), error, now, job["job_id"]),
+                )
+            else:
+                con.execute(
+                    "UPDATE Jobs SET status = 'failed', error = ?, updated_at = ? WHERE job_id = ?",
+                    (error, now, job["job_id"]),
+                )
+        finally:
+            con.close()
+
+    def recover(self) -> int:
+        """Requeue or fail the jobs of processes that exited, and drop old finished jobs.
+
+        Returns:
+            The number of jobs recovered.
+        """
+        now = time.time()
+        recovered = 0
+        con = self._connect()
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            rows = con.execute(
+                "SELECT job_id, owner, worker, status FROM Jobs WHERE status IN ('queued', 'running')"
+                " AND (owner IS NOT NULL OR status = 'running')"
+            ).fetchall()
+            for job_id, owner, worker, status in rows:
+                if owner is not None and owner != PROCESS_ID and not _process_alive(owner):
+                    con.execute(
+                        "UPDATE Jobs SET status = 'failed', error = 'owner process exited', updated_at = ? WHERE job_id = ?",
+                        (now, job_id),
+                    )
+                    recovered += 1
+                elif status == "running" and worker != PROCESS_ID and not _process_alive(worker):
+                    # The attempt was lost with its worker; it still counts
+                    con.execute(
+                        """
+                        UPDATE Jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                            error = 'worker process exited', updated_at = ?
+                        WHERE job_id = ?
+                        """,
+                        (now, job_id),
+                    )
+                    recovered += 1
+            con.execute(
+                "DELETE FROM Jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (now - KEEP_FINISHED,)
+            )
+            con.execute("COMMIT")
+        except BaseException:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            raise
+        finally:
+            con.close()
+        if recovered:
+            self._wake.set()
+        return recovered
+
+    def run_next(self) -> bool:
+        """Run one job in the calling thread.
+
+        Returns:
+            Whether a job was run.
+        """
+        job = self.claim()
+        if job is None:
+            return False
+
+        handler = _handlers.get(job["kind"])
+        if handler is None:
+            self.fail(job, f"No handler registered for job kind '{job['kind']}'.", retry=False)
+            return True
+
+        from tracing import span
+
+        try:
+            with span(f"job.{job['kind']}", job_id=job["job_id"], attempt=job["attempts"]):
+                result = handler(
+                    job["payload"],
+                    lambda progress, message="": self.report_progress(job["job_id"], progress, message),
+                )
+        except Exception as e:
+            logger.warning(f"Job {job['job_id']} ({job['kind']}) failed on attempt {job['attempts']}: {e!r}")
+            self.fail(job, repr(e))
+        else:
+            self.finish(job["job_id"], result)
+        return True
+
+    def _work(self, stop: threading.Event) -> None:
+        while not stop.is_set():
+            try:
+                if self.run_next():
+                    continue
+            except sqlite3.Error as e:
+                logger.warning(f"Job queue unavailable: {e!r}")
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+
+    def start_workers(self, workers: int = WORKERS) -> List[threading.Thread]:
+        """Start `workers` daemon threads running the queued jobs.
+
+        Returns:
+            The worker threads.
+        """
+        self.recover()
+        self._stop = threading.Event()
+        threads = [
+            threading.Thread(target=self._work, args=(self._stop,), name=f"job-worker-{n}", daemon=True)
+            for n in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def stop_workers(self) -> None:
+        """Let the workers exit after their current job."""
+        stop = getattr(self, "_stop", None)
+        if stop is not None:
+            stop.set()
+            self._wake.set()
+
+
+_queue: Optional[JobQueue] = None
+_workers: List[threading.Thread] = []
+_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide job queue, creating it on first use."""
+    global _queue
+    with _lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
+
+
+def start_job_workers(workers: int = WORKERS) -> List[threading.Thread]:
+    """Start the worker pool of this process; later calls are no-ops."""
+    global _workers
+    queue = get_job_queue()
+    with _lock:
+        if not _workers and workers > 0:
+            _workers = queue.start_workers(workers)
+        return _workers
+
+
+def enqueue(kind: str, payload: Optional[Dict[str, Any]] = None, **kwargs) -> int:
+    """Queue a job on the process-wide queue (see JobQueue.enqueue)."""
+    return get_job_queue().enqueue(kind, payload, **kwargs)
+
+
+def track_jobs(state: MutableMapping, job_ids: Iterable[int] = ()) -> Dict[int, Dict[str, Any]]:
+    """Refresh the status of jobs in a session state, e.g. `st.session_state`.
+
+    Newly given ids are added to `state["jobs"]`; finished jobs stay until the
+    caller removes them.
+
+    Returns:
+        The status, progress and message of each tracked job.
+    """
+    queue = get_job_queue()
+    tracked = state.setdefault("jobs", {})
+    for job_id in job_ids:
+        tracked.setdefault(job_id, {})
+    for job_id in list(tracked):
+        job = queue.get(job_id)
+        if job is None:
+            del tracked[job_id]
+            continue
+        tracked[job_id] = {key: job[key] for key in ("kind", "status", "progress", "message", "error")}
+    return tracked
+
+
+# Jobs of the chatbot
+
+
+@register_job("save_history", local=True)
+def _save_history(payload: Dict[str, Any], progress: Callable[[float, str], None]) -> Dict[str, Any]:
+    try:
+        from .memory import all_memory_managers
+    except ImportError:
+        from memory import all_memory_managers
+
+    key = (payload["user_id"], payload["conversation_id"])
+    saved = 0
+    for manager in all_memory_managers():
+        if key in manager.store:
+            manager.save_session_history(*key)
+            saved += 1
+    return {"managers": saved}
+
+
+@register_job("build_rag_chain")
+def _build_rag_chain(payload: Dict[str, Any], progress: Callable[[float, str], None]) -> None:
+    from rag import get_rag_chain
+
+    get_rag_chain()
+
+
+@register_job("export_transcripts", local=True)
+def _export_transcripts(payload: Dict[str, Any], progress: Callable[[float, str], None]) -> Dict[str, Any]:
+    # Imported like bot.py imports memory, so the sessions of this process are exported
+    try:
+        from .transcripts import export_transcripts
+    except ImportError:
+        from transcripts import export_transcripts
+
+    summary = export_transcripts(payload["out_dir"], payload.get("format", "jsonl"))
+    return {"rows": summary["rows"], "files": len(summary["files"])}
+
+
+@register_job("ingest_policies")
+def _ingest_policies(payload: Dict[str, Any], progress: Callable[[float, str], None]) -> Dict[str, int]:
+    from ingestion import INDEX_NAME, ingest_policies
+
+    paths = payload.get("paths")
+    if not paths:
+        return ingest_policies(index_name=payload.get("index", INDEX_NAME))
+
+    counts: Dict[str, int] = {}
+    for number, path in enumerate(paths):
+        progress(number / len(paths), f"Ingesting {os.path.basename(path)}")
+        counts.update(ingest_policies([path], payload.get("index", INDEX_NAME)))
+    return counts
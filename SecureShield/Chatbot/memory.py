@@ -1,30 +1,288 @@
 # Import necessary modules and classes
 import json
-from typing import Dict, List, Tuple
+import logging
+import math
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import weakref
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
 from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_core.messages import BaseMessage
+from langchain_core.messages import BaseMessage, SystemMessage
 from langchain_core.messages.ai import AIMessage
 from langchain_core.messages.human import HumanMessage
 from langchain_core.runnables import ConfigurableFieldSpec
-from pydantic import BaseModel, Field
 
+from shared_cache import HISTORY_TTL, SharedCache, get_shared_cache
 
-class InMemoryHistory(BaseChatMessageHistory, BaseModel):
-    """In-memory implementation of chat message history.
+logger = logging.getLogger(__name__)
 
-    Stores a list of messages within the session.
+# Interned role tags, stored as one byte per message
+ROLES = ("human", "ai", "system")
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+MESSAGE_CLASSES = (HumanMessage, AIMessage, SystemMessage)
+
+# Flag set on the role byte when the content is JSON (multimodal content lists)
+JSON_CONTENT = 0x80
+
+# Version, message count, text length and intent-table length of serialized histories
+HEADER = struct.Struct("<IIQI")
+FORMAT_VERSION = 1
+
+# Segments a shared history may have before it is written whole again
+MAX_HISTORY_SEGMENTS = 32
+
+# Times a history is published when other processes keep publishing first
+PUBLISH_ATTEMPTS = 3
+
+# Interned intent names, stored as one byte per message; code 0 means unknown
+INTENTS: List[Optional[str]] = [None]
+INTENT_CODES: Dict[Optional[str], int] = {None: 0}
+_intents_lock = threading.Lock()
+
+
+def intent_code(intent: Optional[str]) -> int:
+    """Return the byte code of an intent name, interning new names."""
+    code = INTENT_CODES.get(intent)
+    if code is None:
+        with _intents_lock:
+            code = INTENT_CODES.get(intent)
+            if code is None:
+                if len(INTENTS) > 255:
+                    return 0
+                code = len(INTENTS)
+                INTENTS.append(intent)
+                INTENT_CODES[intent] = code
+    return code
+
+
+class InMemoryHistory(BaseChatMessageHistory):
+    """Compact in-memory implementation of chat message history.
+
+    Messages are kept as a role byte plus their UTF-8 text in one contiguous
+    buffer with an array of end offsets, instead of one pydantic message
+    object (and its metadata dicts) per turn. LangChain messages are only
+    materialized when `messages` is read, i.e. when a prompt is built.
+
+    Each message also records when it was added and, once the request that
+    produced it is annotated, its intent and the request latency.
+
+    The read sub-requests of a compound message add their exchanges from
+    several threads, so the buffers are only changed and read under a lock.
     """
 
-    messages: List[BaseMessage] = Field(default_factory=list)
+    __slots__ = ("_roles", "_text", "_ends", "_times", "_intents", "_latencies", "_lock")
+
+    # The message buffers, in serialization order
+    BUFFERS = ("_roles", "_text", "_ends", "_times", "_intents", "_latencies")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._roles = bytearray()
+        self._text = bytearray()
+        self._ends = array("Q")
+        self._times = array("d")
+        self._intents = bytearray()
+        self._latencies = array("f")
+
+    def __len__(self) -> int:
+        return len(self._roles)
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """Materialize the stored messages as LangChain messages."""
+        with self._lock:
+            roles, text, ends = bytes(self._roles), bytes(self._text), self._ends.tolist()
+        messages: List[BaseMessage] = []
+        start = 0
+        for role, end in zip(roles, ends):
+            content = text[start:end].decode()
+            if role & JSON_CONTENT:
+                content = json.loads(content)
+            messages.append(MESSAGE_CLASSES[role & ~JSON_CONTENT](content=content))
+            start = end
+        return messages
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """Append messages to the compact store.
+
+        Raises:
+            ValueError: If a message is not a human, AI or system message.
+        """
+        encoded = []
+        for message in messages:
+            if message.type not in ROLE_CODES:
+                raise ValueError(f"Unsupported message type '{message.type}'.")
+            role = ROLE_CODES[message.type]
+            content = message.content
+            if not isinstance(content, str):
+                content = json.dumps(content)
+                role |= JSON_CONTENT
+            encoded.append((role, content.encode()))
+
+        # One exchange is appended at once, so concurrent exchanges never interleave
+        with self._lock:
+            for role, content in encoded:
+                self._text += content
+                self._roles.append(role)
+                self._ends.append(len(self._text))
+                self._times.append(time.time())
+                self._intents.append(0)
+                self._latencies.append(math.nan)
+
+    def annotate(self, start: int, intent: Optional[str], latency_ms: float) -> None:
+        """Record the intent and latency of the request that added messages `start:`."""
+        code = intent_code(intent)
+        with self._lock:
+            for index in range(start, len(self._roles)):
+                self._intents[index] = code
+                self._latencies[index] = latency_ms
+
+    def iter_records(self, start: int = 0) -> Iterator[Tuple[int, str, str, float, Optional[str], Optional[float]]]:
+        """Yield the stored messages from `start` one at a time.
+
+        Yields:
+            (index, role, content, timestamp, intent, latency_ms) tuples.
+        """
+        # Buffers are only appended to, and clear() swaps in new ones, so the
+        # messages counted under the lock stay intact while they are yielded
+        with self._lock:
+            count = len(self._latencies)
+            roles, text, ends, times, intents, latencies = (
+                self._roles, self._text, self._ends, self._times, self._intents, self._latencies
+            )
+        offset = ends[start - 1] if start else 0
+        for index in range(start, count):
+            end = ends[index]
+            latency = latencies[index]
+            yield (
+                index,
+                ROLES[roles[index] & ~JSON_CONTENT],
+                text[offset:end].decode(),
+                times[index],
+                INTENTS[intents[index]],
+                None if math.isnan(latency) else round(latency, 1),
+            )
+            offset = end
+
+    def to_bytes(self, start: int = 0, stop: Optional[int] = None) -> bytes:
+        """Serialize the history, e.g. to share it with other processes.
+
+        The buffers are copied as they are. Intent codes are only valid in
+        this process, so the intent names are written along with them.
+
+        Args:
+            start: Index of the first message to write.
+            stop: Index after the last message to write; defaults to all messages.
+        """
+        with self._lock:
+            count = len(self._latencies) if stop is None else min(stop, len(self._latencies))
+            start = min(start, count)
+            text_start = self._ends[start - 1] if start else 0
+            text_end = self._ends[count - 1] if count else 0
+            ends = self._ends[start:count]
+            if text_start:
+                ends = array("Q", (end - text_start for end in ends))
+            intents = json.dumps(INTENTS[: max(self._intents[start:count], default=0) + 1]).encode()
+            return b"".join((
+                HEADER.pack(FORMAT_VERSION, count - start, text_end - text_start, len(intents)),
+                intents,
+                self._roles[start:count],
+                ends.tobytes(),
+                self._times[start:count].tobytes(),
+                self._intents[start:count],
+                self._latencies[start:count].tobytes(),
+                self._text[text_start:text_end],
+            ))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "InMemoryHistory":
+        """Rebuild a history serialized with `to_bytes`.
+
+        Raises:
+            ValueError: If the data has another format version.
+        """
+        version, count, text_length, intents_length = HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported history format version {version}.")
+        view = memoryview(data)
+        offset = HEADER.size
+        names = json.loads(bytes(view[offset:offset + intents_length]))
+        offset += intents_length
 
-    def add_messages(self, messages: List[BaseMessage]):
-        """Add a list of messages to the in-memory store."""
-        self.messages.extend(messages)
+        history = cls()
+        history._roles = bytearray(view[offset:offset + count])
+        offset += count
+        for buffer in (history._ends, history._times):
+            size = count * buffer.itemsize
+            buffer.frombytes(view[offset:offset + size])
+            offset += size
+        codes = [intent_code(name) for name in names]
+        history._intents = bytearray(codes[code] for code in view[offset:offset + count])
+        offset += count
+        history._latencies.frombytes(view[offset:offset + count * history._latencies.itemsize])
+        offset += count * history._latencies.itemsize
+        history._text = bytearray(view[offset:offset + text_length])
+        return history
+
+    def replace(self, other: "InMemoryHistory") -> None:
+        """Take over the messages of another history, keeping this object in place."""
+        with other._lock:
+            buffers = [getattr(other, name) for name in self.BUFFERS]
+        with self._lock:
+            for name, buffer in zip(self.BUFFERS, buffers):
+                setattr(self, name, buffer)
+
+    def extend(self, other: "InMemoryHistory") -> None:
+        """Append the messages of another history."""
+        with other._lock:
+            roles, text, ends, times, intents, latencies = (
+                bytes(other._roles), bytes(other._text), other._ends.tolist(),
+                other._times.tolist(), bytes(other._intents), other._latencies.tolist(),
+            )
+        with self._lock:
+            offset = len(self._text)
+            self._text += text
+            self._roles += roles
+            self._ends.extend(end + offset for end in ends)
+            self._times.extend(times)
+            self._intents += intents
+            self._latencies.extend(latencies)
 
     def clear(self) -> None:
         """Clear all messages from the in-memory store."""
-        self.messages = []
+        with self._lock:
+            self._roles = bytearray()
+            self._text = bytearray()
+            self._ends = array("Q")
+            self._times = array("d")
+            self._intents = bytearray()
+            self._latencies = array("f")
+
+    def nbytes(self) -> int:
+        """Return the memory held by this history, in bytes."""
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self._roles)
+            + sys.getsizeof(self._text)
+            + sys.getsizeof(self._ends)
+            + sys.getsizeof(self._times)
+            + sys.getsizeof(self._intents)
+            + sys.getsizeof(self._latencies)
+        )
+
+
+# Every live MemoryManager, so exports can reach all conversations of the process
+_managers: "weakref.WeakSet[MemoryManager]" = weakref.WeakSet()
+
+
+def all_memory_managers() -> List["MemoryManager"]:
+    """Return the memory managers alive in this process."""
+    return list(_managers)
 
 
 class MemoryManager:
@@ -32,11 +290,26 @@ class MemoryManager:
 
     Stores session-specific configurations and provides access to
     session histories.
+
+    With a shared cache (see shared_cache.py), histories are published after
+    each request and loaded by whichever process serves the session next, so
+    a session keeps its history when it lands on another worker.
     """
 
-    def __init__(self):
-        """Initialize session manager."""
+    def __init__(self, shared_cache: Optional[SharedCache] = None):
+        """Initialize session manager.
+
+        Args:
+            shared_cache: Cache to share histories through; defaults to the
+                configured shared cache, if any.
+        """
         self.store: Dict[Tuple[str, str], InMemoryHistory] = {}
+        self.saved: Dict[Tuple[str, str], int] = {}
+        self.shared_cache = shared_cache if shared_cache is not None else get_shared_cache()
+        # Version of each history last published or loaded by this manager,
+        # and the number of messages it holds
+        self.versions: Dict[Tuple[str, str], int] = {}
+        self.shared_counts: Dict[Tuple[str, str], int] = {}
         self.history_factory_config = [
             ConfigurableFieldSpec(
                 id="user_id",
@@ -55,6 +328,7 @@ class MemoryManager:
                 is_shared=True,
             ),
         ]
+        _managers.add(self)
 
     def get_session_history(
         self, user_id: str, conversation_id: str
@@ -71,6 +345,7 @@ class MemoryManager:
         if (user_id, conversation_id) not in self.store:
             # Initialize new in-memory history if not already stored
             self.store[(user_id, conversation_id)] = InMemoryHistory()
+            self.sync_session_history(user_id, conversation_id)
 
         return self.store[(user_id, conversation_id)]
 
@@ -82,8 +357,20 @@ class MemoryManager:
         """
         return self.history_factory_config
 
+    def memory_usage(self) -> Dict[Tuple[str, str], int]:
+        """Return the bytes held by each session history.
+
+        Returns:
+            A dict mapping (user_id, conversation_id) to bytes.
+        """
+        return {session: history.nbytes() for session, history in list(self.store.items())}
+
+    def total_memory_usage(self) -> int:
+        """Return the bytes held by all session histories."""
+        return sum(self.memory_usage().values())
+
     def save_session_history(self, user_id: str, conversation_id: str) -> None:
-        """Save the session history as a txt file.
+        """Append the messages not saved yet to the session's txt file.
 
         Args:
             user_id: Identifier for the user.
@@ -93,13 +380,161 @@ class MemoryManager:
         session_history = self.get_session_history(
             user_id=user_id, conversation_id=conversation_id
         )
+        # Start over if the history was cleared since the last save
+        start = self.saved.get((user_id, conversation_id), 0)
+        mode = "a" if 0 < start <= len(session_history) else "w"
+        if mode == "w":
+            start = 0
 
-        # Iterate over messages in the session history
+        # Iterate over the new messages in the session history
         # and save them to a text file
-        with open(f"{user_id}_{conversation_id}_history.txt", "w") as file:
-            for message in session_history.messages:
-                # Check if is HumanMessage or AIMessage
-                if isinstance(message, HumanMessage):
-                    file.write(f"User: {message.content}\n")
-                elif isinstance(message, AIMessage):
-                    file.write(f"Bot: {message.content}\n")
+        with open(f"{user_id}_{conversation_id}_history.txt", mode) as file:
+            for index, role, content, *_ in session_history.iter_records(start):
+                # Check if is a human or AI message
+                if role == "human":
+                    file.write(f"User: {content}\n")
+                elif role == "ai":
+                    file.write(f"Bot: {content}\n")
+                start = index + 1
+        self.saved[(user_id, conversation_id)] = start
+
+    def _shared_key(self, user_id: str, conversation_id: str) -> str:
+        return f"history:{user_id}:{conversation_id}"
+
+    def _load_segments(self, key: str, first: int, last: int) -> Optional[List[InMemoryHistory]]:
+        """Read the published segments `first` to `last` of a history, or None if one is gone."""
+        segments = []
+        for version in range(first, last + 1):
+            data = self.shared_cache.get(f"{key}:{version}")
+            if data is None:
+                logger.warning(f"Segment {version} of the shared history {key} is missing")
+                return None
+            segments.append(InMemoryHistory.from_bytes(data))
+        return segments
+
+    def _load_shared(self, key: str, head: Dict) -> Optional[InMemoryHistory]:
+        """Rebuild a published history from the segments listed by its head entry."""
+        segments = self._load_segments(key, head["base"], head["version"])
+        if segments is None:
+            return None
+        shared = InMemoryHistory()
+        for segment in segments:
+            shared.extend(segment)
+        return shared
+
+    def sync_session_history(self, user_id: str, conversation_id: str) -> bool:
+        """Bring the session history up to date with the shared copy if that one is newer.
+
+        Only the segments published since the local copy was last synced are
+        read, unless the local copy has unpublished messages or the shared
+        copy was compacted since. Unpublished messages are kept after the
+        shared ones, so the next publish still appends them.
+
+        Returns:
+            Whether the history was updated.
+        """
+        if self.shared_cache is None:
+            return False
+        session = (user_id, conversation_id)
+        key = self._shared_key(user_id, conversation_id)
+        version = self.versions.get(session, 0)
+        try:
+            head = self.shared_cache.get(key)
+            if not isinstance(head, dict) or head["version"] <= version:
+                return False
+            history = self.store.setdefault(session, InMemoryHistory())
+            if version >= head["base"] and len(history) == self.shared_counts.get(session, 0):
+                segments = self._load_segments(key, version + 1, head["version"])
+                if segments is None:
+                    return False
+                for segment in segments:
+                    history.extend(segment)
+            else:
+                start, count = self.shared_counts.get(session, 0), len(history)
+                if start > count:
+                    # Cleared since the last publish, so every message is unpublished
+                    start = 0
+                pending = history.to_bytes(start, count)
+                shared = self._load_shared(key, head)
+                if shared is None:
+                    return False
+                shared.extend(InMemoryHistory.from_bytes(pending))
+                # Swap the buffers in place, so references to the history stay valid
+                history.replace(shared)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Shared history of {user_id}/{conversation_id} not loaded: {e!r}")
+            return False
+        self.versions[session] = head["version"]
+        self.shared_counts[session] = head["count"]
+        return True
+
+    def publish_session_history(self, user_id: str, conversation_id: str) -> None:
+        """Append the messages not published yet to the shared copy of the session history.
+
+        The new messages are written as one segment, and the head entry of
+        the history only moves to it if no other process published since this
+        one last did (compare and set). On a conflict, the other process's
+        messages are loaded, this one's new messages are put after them and
+        the publish is retried. Every MAX_HISTORY_SEGMENTS segments the whole
+        history is written again, so loading it stays cheap.
+        """
+        if self.shared_cache is None:
+            return
+        session = (user_id, conversation_id)
+        key = self._shared_key(user_id, conversation_id)
+        history = self.get_session_history(user_id, conversation_id)
+
+        start, count = self.shared_counts.get(session, 0), len(history)
+        if start > count:
+            # Cleared since the last publish, so the whole history is written
+            start = 0
+        elif start == count:
+            return
+        # Kept aside, so a conflict never publishes them twice
+        pending = history.to_bytes(start, count)
+
+        for _ in range(PUBLISH_ATTEMPTS):
+            version = self.versions.get(session, 0)
+            start, count = self.shared_counts.get(session, 0), len(history)
+            if start > count:
+                start = 0
+            try:
+                with self.shared_cache.transaction() as cache:
+                    head = cache.get(key)
+                    head = head if isinstance(head, dict) else None
+                    conflict = (head["version"] if head else 0) != version
+                    if not conflict:
+                        base = head["base"] if head else 1
+                        if start == 0 or version + 1 - base >= MAX_HISTORY_SEGMENTS:
+                            # Written whole; the segments it replaces are dropped
+                            for segment in range(base, version + 1):
+                                cache.delete(f"{key}:{segment}")
+                            start, base = 0, version + 1
+                        else:
+                            cache.touch([f"{key}:{segment}" for segment in range(base, version + 1)], HISTORY_TTL)
+                        cache.set(f"{key}:{version + 1}", history.to_bytes(start, count), HISTORY_TTL)
+                        cache.set(key, {"version": version + 1, "base": base, "count": count}, HISTORY_TTL)
+                if not conflict:
+                    self.versions[session] = version + 1
+                    self.shared_counts[session] = count
+                    return
+
+                # Another process published first: put this one's new messages after its own
+                head = self.shared_cache.get(key)
+                shared = self._load_shared(key, head) if isinstance(head, dict) else None
+                if shared is None:
+                    if isinstance(head, dict) and self.shared_cache.get(key) != head:
+                        # Compacted while it was read; the next attempt reads it again
+                        continue
+                    # Nothing usable is shared, so the next attempt writes the whole history
+                    self.versions[session] = head["version"] if isinstance(head, dict) else 0
+                    self.shared_counts[session] = 0
+                    continue
+                shared.extend(InMemoryHistory.from_bytes(pending))
+                history.replace(shared)
+                self.versions[session] = head["version"]
+                self.shared_counts[session] = head["count"]
+            except (sqlite3.Error, ValueError) as e:
+                logger.warning(f"History of {user_id}/{conversation_id} not shared: {e!r}")
+                return
+        logger.warning(f"History of {user_id}/{conversation_id} not shared: other processes kept updating it")
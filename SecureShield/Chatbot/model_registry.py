@@ -0,0 +1,248 @@
+# Import necessary modules and classes
+import json
+import os
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel, Field
+
+from scheduler import Priority, ScheduledRunnable
+from shared_cache import LLM_CACHE_TTL, CachedRunnable, get_shared_cache
+from tracing import TracedRunnable
+from transport import ResilientRunnable, get_circuit_breaker, get_http_client
+
+load_dotenv()
+
+# Environment variable pointing to a JSON file that overrides tiers and stages
+CONFIG_ENV_VAR = "SECURESHIELD_MODEL_CONFIG"
+
+# Model used by each tier, ordered from the most capable to the fastest
+DEFAULT_TIERS: Dict[str, str] = {
+    "standard": "gpt-4",
+    "fast": "gpt-4o-mini",
+}
+
+# Tier used when a stage runs out of its latency budget on its own tier
+DEFAULT_FALLBACK_TIERS: Dict[str, Optional[str]] = {
+    "standard": "fast",
+    "fast": None,
+}
+
+
+class StageConfig(BaseModel):
+    """Model tier and latency budget declared by a single chain stage."""
+
+    tier: str = Field(description="Name of the tier that serves this stage")
+    latency_budget: float = Field(
+        description="Maximum time in seconds the stage may spend on model calls"
+    )
+    temperature: float = Field(default=0.0, description="Sampling temperature")
+    priority: Priority = Field(
+        default=Priority.LOOKUP, description="Scheduler priority class of the stage"
+    )
+    hedge_after: Optional[float] = Field(
+        default=None,
+        description="Seconds after which a read-only stage sends a duplicate request",
+    )
+
+
+# Stages declared by the chains, keyed as '<chain>.<stage>'
+DEFAULT_STAGES: Dict[str, StageConfig] = {
+    "prompt_injection.classify": StageConfig(
+        tier="fast", latency_budget=4.0, hedge_after=1.5
+    ),
+    "claim_info.extract": StageConfig(
+        tier="standard", latency_budget=8.0, hedge_after=3.0
+    ),
+    "claim_info.response": StageConfig(tier="standard", latency_budget=10.0),
+    "policy_info.extract": StageConfig(
+        tier="standard", latency_budget=8.0, hedge_after=3.0
+    ),
+    "policy_info.response": StageConfig(tier="standard", latency_budget=10.0),
+    "update_claim.extract": StageConfig(
+        tier="standard", latency_budget=8.0, priority=Priority.CLAIM_UPDATE
+    ),
+    "update_claim.response": StageConfig(
+        tier="standard", latency_budget=10.0, priority=Priority.CLAIM_UPDATE
+    ),
+    "analytics.extract": StageConfig(
+        tier="standard", latency_budget=8.0, hedge_after=3.0
+    ),
+    "analytics.response": StageConfig(tier="standard", latency_budget=10.0),
+    "chitchat.classify": StageConfig(
+        tier="fast", latency_budget=4.0, priority=Priority.CHITCHAT
+    ),
+    "chitchat.response": StageConfig(
+        tier="fast", latency_budget=6.0, priority=Priority.CHITCHAT
+    ),
+    "rag.response": StageConfig(
+        tier="fast", latency_budget=8.0, temperature=0.2, priority=Priority.RAG
+    ),
+}
+
+
+class ModelRegistry:
+    """Central registry that maps chain stages to models.
+
+    Each stage declares a tier and a latency budget. The registry picks the
+    model for the tier, enforces the budget as a request timeout and falls back
+    to the next faster tier when the primary model does not answer in time.
+    """
+
+    def __init__(
+        self,
+        tiers: Optional[Dict[str, str]] = None,
+        fallback_tiers: Optional[Dict[str, Optional[str]]] = None,
+        stages: Optional[Dict[str, StageConfig]] = None,
+    ):
+        """Initialize the registry with tier and stage configurations.
+
+        Args:
+            tiers: Mapping from tier name to model name.
+            fallback_tiers: Mapping from tier name to the next faster tier.
+            stages: Mapping from stage name to its StageConfig.
+        """
+        self.tiers = dict(tiers or DEFAULT_TIERS)
+        self.fallback_tiers = dict(fallback_tiers or DEFAULT_FALLBACK_TIERS)
+        self.stages = dict(stages or DEFAULT_STAGES)
+        self.llm_factory: Callable[..., Runnable] = self._create_chat_model
+
+    @classmethod
+    def from_env(cls) -> "ModelRegistry":
+        """Build a registry, applying overrides from the JSON config file if set.
+
+        The file may contain the keys 'tiers', 'fallback_tiers' and 'stages'.
+        Stage entries only need the fields they override.
+
+        Returns:
+            A configured ModelRegistry.
+        """
+        registry = cls()
+        config_path = os.getenv(CONFIG_ENV_VAR)
+        if not config_path:
+            return registry
+
+        with open(config_path, "r") as file:
+            overrides = json.load(file)
+
+        registry.tiers.update(overrides.get("tiers", {}))
+        registry.fallback_tiers.update(overrides.get("fallback_tiers", {}))
+        for stage, values in overrides.get("stages", {}).items():
+            base = registry.stages.get(stage)
+            merged = {**base.model_dump(), **values} if base else values
+            registry.stages[stage] = StageConfig(**merged)
+
+        return registry
+
+    def get_stage(self, stage: str) -> StageConfig:
+        """Retrieve the configuration declared for a stage.
+
+        Args:
+            stage: Name of the stage, e.g. 'claim_info.extract'.
+
+        Returns:
+            The StageConfig for the stage.
+
+        Raises:
+            KeyError: If the stage is not declared.
+        """
+        if stage not in self.stages:
+            raise KeyError(f"Stage not declared in the model registry: {stage}")
+        return self.stages[stage]
+
+    def _create_chat_model(
+        self, stage: str, tier: str, timeout: float, temperature: float
+    ) -> Runnable:
+        """Create the chat model that serves a tier for a stage."""
+        return ChatOpenAI(
+            model=self.tiers[tier],
+            temperature=temperature,
+            timeout=timeout,
+            max_retries=0,
+            http_client=get_http_client(),
+        )
+
+    def _build(self, stage: str, tier: str, timeout: float) -> Runnable:
+        """Create the model for a tier, route its calls through the scheduler,
+        protect them with retries, hedging and the tier's circuit breaker and
+        record each call as a tracing span.
+
+        Deterministic stages are served from the shared cache when
+        SECURESHIELD_LLM_CACHE_TTL is set."""
+        config = self.get_stage(stage)
+        llm = self.llm_factory(stage, tier, timeout, config.temperature)
+        resilient = ResilientRunnable(
+            ScheduledRunnable(llm, config.priority),
+            breaker=get_circuit_breaker(self.tiers[tier]),
+            timeout=timeout,
+            hedge_after=config.hedge_after,
+        )
+        cache = get_shared_cache() if LLM_CACHE_TTL > 0 and config.temperature == 0 else None
+        if cache is not None:
+            resilient = CachedRunnable(resilient, cache, f"{stage}:{self.tiers[tier]}", LLM_CACHE_TTL)
+        return TracedRunnable(resilient, stage, tier)
+
+    def get_llm(self, stage: str) -> Runnable:
+        """Build the model runnable for a stage.
+
+        The primary tier gets two thirds of the latency budget and the fallback
+        tier the remaining third, so the stage as a whole stays within budget.
+        Stages without a faster tier get the full budget.
+
+        Args:
+            stage: Name of the stage, e.g. 'claim_info.extract'.
+
+        Returns:
+            A runnable chat model with timeout and tier fallback configured.
+        """
+        config = self.get_stage(stage)
+        fallback_tier = self.fallback_tiers.get(config.tier)
+
+        if fallback_tier is None:
+            return self._build(stage, config.tier, config.latency_budget)
+
+        primary = self._build(stage, config.tier, config.latency_budget * 2 / 3)
+        fallback = self._build(stage, fallback_tier, config.latency_budget / 3)
+        return primary.with_fallbacks([fallback])
+
+
+def with_deterministic_fallback(
+    runnable: Runnable, fallback: Callable[[Dict], object]
+) -> Runnable:
+    """Attach a deterministic, model-free path to a runnable.
+
+    Used by the chains so that a stage that exceeds its budget on every tier
+    still produces an answer instead of an error.
+
+    Args:
+        runnable: The model-backed runnable of the stage.
+        fallback: Function computing the stage output from the stage input.
+
+    Returns:
+        A runnable that calls the fallback when the model-backed runnable fails.
+    """
+    return runnable.with_fallbacks([RunnableLambda(fallback)])
+
+
+_registry: Optional[ModelRegistry] = None
+
+
+def get_registry() -> ModelRegistry:
+    """Return the process-wide model registry, creating it on first use."""
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry.from_env()
+    return _registry
+
+
+def set_registry(registry: ModelRegistry) -> None:
+    """Replace the process-wide model registry (e.g. for offline runs)."""
+    global _registry
+    _registry = registry
+
+
+def get_llm(stage: str, registry: Optional[ModelRegistry] = None) -> Runnable:
+    """Build the model runnable for a stage using `registry`, or the process-wide one."""
+    return (registry or get_registry()).get_llm(stage)
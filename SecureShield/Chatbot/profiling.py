@@ -0,0 +1,342 @@
+"""Opt-in sampling profiler for individual chat requests.
+
+A request is profiled when the caller asks for it (the Streamlit page does so
+for requests carrying the `X-SecureShield-Profile: 1` header), when
+SECURESHIELD_PROFILE=1, or at random with probability
+SECURESHIELD_PROFILE_RATE. While at least one profiled request is running, a
+daemon thread samples the Python stacks of all threads every
+SECURESHIELD_PROFILE_INTERVAL seconds with `sys._current_frames()`; nothing
+is sampled otherwise, and unprofiled requests pay no overhead.
+
+Each profile records the request thread and the threads working alongside
+it (hedged model calls, coalesced requests, LangChain executors). Threads
+blocked in a wait and threads running other requests are skipped; helper
+threads busy for concurrent requests cannot be told apart and are included. Samples are wall-clock, so time the request
+thread spends waiting on a model shows up under the call that waits.
+
+Profiles are written to SECURESHIELD_PROFILE_DIR as speedscope files
+(https://www.speedscope.app), with one profile per thread, or as folded
+stacks for flamegraph.pl. File names carry the intent and the request ID.
+Only the SECURESHIELD_PROFILE_TOP slowest profiles are kept on disk, and they
+are listed in `slowest.json` in the same folder.
+
+This module only imports the standard library at import time.
+"""
+
+# Import necessary modules and classes
+import heapq
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Profile every request; for local debugging
+PROFILE_ALL = os.getenv("SECURESHIELD_PROFILE", "0") == "1"
+
+# Fraction of requests profiled at random
+SAMPLE_RATE = float(os.getenv("SECURESHIELD_PROFILE_RATE", "0"))
+
+# Seconds between stack samples
+INTERVAL = float(os.getenv("SECURESHIELD_PROFILE_INTERVAL", "0.005"))
+
+PROFILE_DIR = os.getenv("SECURESHIELD_PROFILE_DIR", "profiles")
+
+# "speedscope" or "folded"
+PROFILE_FORMAT = os.getenv("SECURESHIELD_PROFILE_FORMAT", "speedscope")
+
+# Number of slowest profiles kept on disk
+TOP_N = int(os.getenv("SECURESHIELD_PROFILE_TOP", "20"))
+
+# Requests are no longer sampled after this many seconds
+MAX_SECONDS = 300.0
+
+# Name of the header that asks for a profile of the request
+PROFILE_HEADER = "X-SecureShield-Profile"
+
+# Leaf functions of threads blocked without doing work
+IDLE_FUNCTIONS = frozenset({
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("socketserver.py", "serve_forever"),
+    ("thread.py", "_worker"),
+})
+
+FrameKey = Tuple[str, str, int]
+
+# Threads currently running a request, profiled or not
+_request_threads: set = set()
+
+
+def should_profile(requested: Optional[bool] = None) -> bool:
+    """Decide whether to profile a request.
+
+    Args:
+        requested: True or False to override the environment, e.g. from a header.
+    """
+    if requested is not None:
+        return requested
+    return PROFILE_ALL or (SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE)
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FUNCTIONS
+
+
+class Profile:
+    """Stack samples of one request, aggregated per thread."""
+
+    def __init__(self, request_id: str, thread_id: int):
+        self.request_id = request_id
+        self.thread_id = thread_id
+        self.intent: Optional[str] = None
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.frames: Dict[FrameKey, int] = {}
+        self.samples: Dict[str, Counter] = {}
+        self.sample_count = 0
+
+    def _stack(self, frame) -> Tuple[int, ...]:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            key = (code.co_name, code.co_filename, code.co_firstlineno)
+            index = self.frames.get(key)
+            if index is None:
+                index = self.frames[key] = len(self.frames)
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def add_samples(self, frames: Dict[int, object], names: Dict[int, str], weight: float) -> None:
+        """Add one sample of the request thread and of the busy threads around it."""
+        request_frame = frames.get(self.thread_id)
+        if request_frame is None:
+            return
+        self.sample_count += 1
+        for thread_id, frame in frames.items():
+            if thread_id != self.thread_id and (thread_id in _request_threads or _is_idle(frame)):
+                continue
+            name = "request" if thread_id == self.thread_id else names.get(thread_id, str(thread_id))
+            self.samples.setdefault(name, Counter())[self._stack(frame)] += weight
+
+    def _frame_list(self) -> List[FrameKey]:
+        frames: List[FrameKey] = [("", "", 0)] * len(self.frames)
+        for key, index in self.frames.items():
+            frames[index] = key
+        return frames
+
+    def to_speedscope(self) -> Dict:
+        """Return the profile in the speedscope file format, one profile per thread."""
+        profiles = []
+        for name, stacks in sorted(self.samples.items(), key=lambda item: item[0] != "request"):
+            profiles.append({
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(stacks.values()) * 1000, 3),
+                "samples": [list(stack) for stack in stacks],
+                "weights": [round(weight * 1000, 3) for weight in stacks.values()],
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.intent} {self.request_id}",
+            "exporter": "secureshield",
+            "activeProfileIndex": 0,
+            "shared": {
+                "frames": [
+                    {"name": name, "file": file, "line": line} for name, file, line in self._frame_list()
+                ]
+            },
+            "profiles": profiles,
+        }
+
+    def to_folded(self) -> str:
+        """Return the profile as folded stacks (microseconds), rooted at the thread name."""
+        frames = self._frame_list()
+        lines = []
+        for name, stacks in self.samples.items():
+            for stack, weight in stacks.items():
+                path = ";".join(
+                    [name] + [f"{frames[i][0]} ({os.path.basename(frames[i][1])}:{frames[i][2]})" for i in stack]
+                )
+                lines.append(f"{path} {round(weight * 1e6)}")
+        return "\n".join(lines) + "\n"
+
+
+class Sampler:
+    """Samples the stacks of the active profiles from a daemon thread."""
+
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self._active: Dict[int, Profile] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, profile: Profile) -> None:
+        with self._lock:
+            self._active[id(profile)] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def remove(self, profile: Profile) -> None:
+        with self._lock:
+            self._active.pop(id(profile), None)
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        last = time.perf_counter()
+        while True:
+            # Profiles are only removed between samples, so they are complete once removed
+            with self._lock:
+                active = list(self._active.values())
+                if active:
+                    now = time.perf_counter()
+                    frames = sys._current_frames()
+                    frames.pop(own_id, None)
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    for profile in active:
+                        if now - profile.start < MAX_SECONDS:
+                            profile.add_samples(frames, names, now - last)
+                    del frames
+                    last = now
+                else:
+                    self._wake.clear()
+            if not active:
+                self._wake.wait()
+                last = time.perf_counter()
+                continue
+            time.sleep(self.interval)
+
+
+class ProfileStore:
+    """Writes profiles and keeps the slowest `top_n` of them on disk."""
+
+    def __init__(self, directory: str = PROFILE_DIR, top_n: int = TOP_N, fmt: str = PROFILE_FORMAT):
+        self.directory = directory
+        self.top_n = top_n
+        self.fmt = fmt
+        self._slowest: List[Tuple[float, str, Dict]] = []  # min-heap of (duration, request_id, entry)
+        self._lock = threading.Lock()
+
+    def save(self, profile: Profile) -> Optional[str]:
+        """Write a profile if it is among the slowest, and drop the one it displaces.
+
+        Returns:
+            The path of the file, or None if the profile was not kept.
+        """
+        with self._lock:
+            if len(self._slowest) >= self.top_n and profile.duration <= self._slowest[0][0]:
+                return None
+
+            os.makedirs(self.directory, exist_ok=True)
+            intent = re.sub(r"[^A-Za-z0-9_-]+", "_", str(profile.intent))
+            extension = "folded" if self.fmt == "folded" else "speedscope.json"
+            path = os.path.join(
+                self.directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{intent}-{profile.request_id}.{extension}"
+            )
+            with open(path, "w") as file:
+                if self.fmt == "folded":
+                    file.write(profile.to_folded())
+                else:
+                    json.dump(profile.to_speedscope(), file)
+
+            entry = {
+                "request_id": profile.request_id,
+                "intent": profile.intent,
+                "duration_ms": round(profile.duration * 1000, 3),
+                "samples": profile.sample_count,
+                "path": path,
+            }
+            if len(self._slowest) >= self.top_n:
+                _, _, dropped = heapq.heapreplace(self._slowest, (profile.duration, profile.request_id, entry))
+                try:
+                    os.remove(dropped["path"])
+                except FileNotFoundError:
+                    pass
+            else:
+                heapq.heappush(self._slowest, (profile.duration, profile.request_id, entry))
+
+            with open(os.path.join(self.directory, "slowest.json.tmp"), "w") as file:
+                json.dump(self.slowest(), file, indent=2)
+            os.replace(os.path.join(self.directory, "slowest.json.tmp"), os.path.join(self.directory, "slowest.json"))
+            return path
+
+    def slowest(self) -> List[Dict]:
+        """Return the kept profiles, slowest first."""
+        return [entry for _, _, entry in sorted(self._slowest, key=lambda item: -item[0])]
+
+
+_sampler = Sampler()
+_store: Optional[ProfileStore] = None
+_store_lock = threading.Lock()
+
+
+def get_profile_store() -> ProfileStore:
+    """Return the process-wide profile store, creating it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ProfileStore()
+        return _store
+
+
+def slowest_profiles() -> List[Dict]:
+    """Return the slowest profiled requests of this process, slowest first."""
+    return get_profile_store().slowest()
+
+
+@contextmanager
+def profile_request(request_id: Optional[str] = None, requested: Optional[bool] = None) -> Iterator[Optional[Profile]]:
+    """Profile the request run inside the block if `should_profile` says so.
+
+    Set `intent` on the yielded profile to tag the file with it.
+
+    Args:
+        request_id: ID of the request, e.g. its trace ID.
+        requested: Override of the environment settings.
+
+    Yields:
+        The profile, or None if the request is not profiled.
+    """
+    thread_id = threading.get_ident()
+    if not should_profile(requested):
+        _request_threads.add(thread_id)
+        try:
+            yield None
+        finally:
+            _request_threads.discard(thread_id)
+        return
+
+    profile = Profile(request_id or uuid.uuid4().hex, thread_id)
+    _request_threads.add(thread_id)
+    _sampler.add(profile)
+    try:
+        yield profile
+    finally:
+        _sampler.remove(profile)
+        _request_threads.discard(thread_id)
+        profile.duration = time.perf_counter() - profile.start
+        try:
+            path = get_profile_store().save(profile)
+            if path:
+                logger.info(f"Profile of request {profile.request_id} written to {path}")
+        except OSError as e:
+            logger.warning(f"Profile of request {profile.request_id} not written: {e!r}")
@@ -1,39 +1,129 @@
 # Standard Library Imports
 import os
-from typing import List
-
-# Third-Party Libraries
-from pinecone import Index, Pinecone
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
 
 # LangChain Libraries
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.chat_models import ChatOpenAI
-from langchain_pinecone import PineconeVectorStore
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from langchain_core.vectorstores import VectorStoreRetriever
 
 from Chains.Base import PromptTemplate, generate_prompt_templates
-import sqlite3
+from context_compression import ENABLED as COMPRESSION_ENABLED, compress_context
+from database import connect, get_db_path
+from hot_tables import get_hot_tables
+from ingestion import ALL_TIERS, PRODUCTS, TIERS
+from model_registry import get_llm
+from tracing import metrics, span
+from transport import get_embeddings, get_pinecone
+
+# Words pointing at a product, besides its name and policy type
+PRODUCT_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "AutoGuard": ("autoguard", "car", "cars", "vehicle", "auto", "driver", "collision", "roadside", "towing", "rental car"),
+    "HealthCare": (
+        "healthcare", "health", "medical", "doctor", "hospital", "prescription", "drug", "dental",
+        "emergency care", "inpatient", "preventive",
+    ),
+    "HomeProtect": ("homeprotect", "house", "home", "dwelling", "belongings", "burglary", "fire", "flood"),
+}
+
+POLICY_ID_PATTERN = re.compile(r"\bpolicy\s*(?:id|number|#)?\s*(\d+)", re.IGNORECASE)
+CLIENT_ID_PATTERN = re.compile(r"\bclient\s*(?:id|number|#)?\s*(\d+)", re.IGNORECASE)
+
+
+def _policies_referenced(question: str) -> List[Tuple[str, str]]:
+    """Return (policy_type, policy_level) of the policies or client a question names."""
+    policy = POLICY_ID_PATTERN.search(question)
+    client = CLIENT_ID_PATTERN.search(question)
+    if not policy and not client:
+        return []
+
+    hot_tables = get_hot_tables(get_db_path())
+    if hot_tables is not None:
+        if policy:
+            columns, rows = hot_tables.lookup("policy", policy.group(1))
+            type_index, level_index = columns.index("policy_type"), columns.index("policy_level")
+            return [(row[type_index], row[level_index]) for row in rows]
+        _, rows = hot_tables.lookup("policies_by_client", client.group(1))
+        return [(policy_type, policy_level) for _, policy_type, policy_level in rows]
+
+    con = connect()
+    try:
+        if policy:
+            return con.execute(
+                "SELECT policy_type, policy_level FROM Policies WHERE policy_id = ?", (policy.group(1),)
+            ).fetchall()
+        return con.execute(
+            "SELECT policy_type, policy_level FROM Policies WHERE user_id = ?", (client.group(1),)
+        ).fetchall()
+    finally:
+        con.close()
+
+
+def format_docs(documents) -> str:
+    return "\n\n".join(doc.page_content for doc in documents)
+
+
+def infer_partition(question: str) -> Tuple[List[str], Optional[str]]:
+    """Infer the products and tier a policy question is about.
+
+    Products and tiers named in the question win; otherwise they are taken
+    from the policy or client the question refers to.
+
+    Args:
+        question: The employee's question.
+
+    Returns:
+        The products to search (empty to search all of them) and the tier, if
+        a single one applies.
+    """
+    words = " ".join(re.findall(r"[a-z]+", question.lower()))
+    products = [
+        product
+        for policy_type, product in PRODUCTS.items()
+        if re.search(rf"\b({'|'.join([policy_type.lower(), *PRODUCT_KEYWORDS[product]])})\b", words)
+    ]
+    tiers = [tier for tier in TIERS if re.search(rf"\b{tier.lower()}\b", words)]
+
+    if not products or not tiers:
+        try:
+            referenced = _policies_referenced(question)
+        except Exception:
+            # The question is still answered, just from all products
+            referenced = []
+        products = products or sorted({PRODUCTS[policy_type] for policy_type, _ in referenced})
+        tiers = tiers or sorted({level for _, level in referenced})
+
+    return sorted(products), tiers[0] if len(tiers) == 1 else None
+
+
+def partition_filter(products: List[str], tier: Optional[str]) -> Optional[Dict]:
+    """Return the metadata filter restricting a search to products and a tier."""
+    conditions = {}
+    if products:
+        conditions["product"] = {"$in": products}
+    if tier:
+        conditions["tier"] = {"$in": [tier, ALL_TIERS]}
+    return conditions or None
 
 class RagChain:
 
-    def __init__(self, username):
-        
-        def format_docs(documents):
-            return "\n\n".join(doc.page_content for doc in documents)
+    def __init__(self, username, retriever=None, registry=None):
         
-        pc = Pinecone()
-        index: Index = pc.Index("documents")
-        vector_store = PineconeVectorStore(index=index, embedding=OpenAIEmbeddings(model="text-embedding-ada-002"))
-        retriever = vector_store.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={"k": 2, "score_threshold": 0.5})
-        
-        self.llm = ChatOpenAI(model='gpt-4o-mini', temperature=0.2)
+        if retriever is None:
+            # Pinecone is only imported when the policy documents are first searched
+            from langchain_pinecone import PineconeVectorStore
 
-        con = sqlite3.connect("secure_shield.db")
-        cursor = con.cursor()
+            pc = get_pinecone()
+            index = pc.Index("documents")
+            vector_store = PineconeVectorStore(index=index, embedding=get_embeddings("text-embedding-ada-002"))
+            retriever = vector_store.as_retriever(
+                search_type="similarity_score_threshold",
+                search_kwargs={"k": 2, "score_threshold": 0.5})
         
+        self.llm = get_llm("rag.response", registry)
+
         self.prompt_template = PromptTemplate(
             system_template="""
             You are the SecureShield chatbot, a platform with the objective of interact 
@@ -55,10 +145,11 @@ class RagChain:
             human_template="Employee Query: {employee_input}",)
 
 
-        self.custom_rag_prompt = generate_prompt_templates(self.template, memory=False)
+        self.custom_rag_prompt = generate_prompt_templates(self.prompt_template, memory=False)
 
+        self.retriever = retriever
         self.rag_chain = (
-            {"context": retriever | format_docs, 
+            {"context": RunnableLambda(self.build_context), 
             "employee_input": RunnablePassthrough()
             }
             | self.custom_rag_prompt
@@ -66,5 +157,59 @@ class RagChain:
             | StrOutputParser()
         )
 
+    def retrieve(self, question: str):
+        """Search the policy chunks of the products the question is about.
+
+        When the filtered search finds nothing, e.g. on an index loaded
+        before chunks were tagged with their product and tier, all chunks
+        are searched instead.
+        """
+        products, tier = infer_partition(question)
+        metadata_filter = partition_filter(products, tier)
+        with span("rag.retrieve", products=",".join(products) or "all", tier=tier or "all") as current:
+            if metadata_filter is None or not isinstance(self.retriever, VectorStoreRetriever):
+                return self.retriever.invoke(question)
+
+            retriever = self.retriever.model_copy(
+                update={"search_kwargs": {**self.retriever.search_kwargs, "filter": metadata_filter}}
+            )
+            documents = retriever.invoke(question)
+            if not documents:
+                current.set("unfiltered_retry", True)
+                metrics.inc("secureshield_rag_unfiltered_retries_total")
+                documents = self.retriever.invoke(question)
+            return documents
+
+    def build_context(self, question: str) -> str:
+        """Retrieve the chunks for a question and compress them to the context budget."""
+        documents = self.retrieve(question)
+        if not COMPRESSION_ENABLED:
+            return format_docs(documents)
+
+        with span("rag.compress") as current:
+            context, stats = compress_context(question, documents)
+            for key, value in stats.items():
+                current.set(key, value)
+            current.set("compression_ratio", round(stats["tokens_out"] / max(stats["tokens_in"], 1), 3))
+        metrics.inc("secureshield_rag_context_tokens_total", stats["tokens_in"], kind="retrieved")
+        metrics.inc("secureshield_rag_context_tokens_total", stats["tokens_out"], kind="kept")
+        return context
+
     def run_chain(self, question) -> str:
-        return self.rag_chain.invoke(question)
+        with span("rag.chain"):
+            return self.rag_chain.invoke(question)
+
+
+_default_chain: Optional[RagChain] = None
+_chain_lock = threading.Lock()
+
+
+def get_rag_chain(retriever=None, registry=None) -> RagChain:
+    """Return a RagChain, building the Pinecone-backed one once per process."""
+    global _default_chain
+    if retriever is not None or registry is not None:
+        return RagChain(username=None, retriever=retriever, registry=registry)
+    with _chain_lock:
+        if _default_chain is None:
+            _default_chain = RagChain(username=None)
+        return _default_chain
@@ -0,0 +1,171 @@
+# Import necessary modules and classes
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from hot_tables import database_path, get_hot_tables, rows_after
+
+# Bounds for the number of rows the user may ask for in one page
+DEFAULT_PAGE_SIZE = 5
+MAX_PAGE_SIZE = 50
+
+# Approximate token budget of a rendered table inside a prompt
+DEFAULT_TOKEN_BUDGET = 600
+
+# Number of sessions whose last query is remembered for "next page" follow-ups
+MAX_REMEMBERED_SESSIONS = 1024
+
+
+class PagedQuery(BaseModel):
+    """A query whose results are served in pages ordered by a unique key column."""
+
+    sql: str = Field(description="SELECT statement producing the result set")
+    params: Tuple[Any, ...] = Field(default=(), description="Parameters of the statement")
+    key_column: str = Field(description="Unique column used for keyset pagination")
+    title: str = Field(description="Description of the result set shown to the model")
+    cache_lookup: Optional[str] = Field(
+        default=None, description="HotTables lookup serving the rows from memory; the SQL is used when caching is off"
+    )
+
+
+class ResultPage(BaseModel):
+    """One page of a result set, rendered as a compact table."""
+
+    title: str
+    columns: List[str]
+    rows: List[Tuple[Any, ...]]
+    has_more: bool
+    last_key: Optional[Any] = None
+
+    def render(self) -> str:
+        """Render the page as a pipe-separated table with a header row."""
+        if not self.rows:
+            more = "more " if self.last_key is not None else ""
+            return f"{self.title}: no {more}results."
+        lines = [f"{self.title}:", " | ".join(self.columns)]
+        lines.extend(" | ".join("" if value is None else str(value) for value in row) for row in self.rows)
+        if self.has_more:
+            lines.append(f"(showing {len(self.rows)} rows; more results are available on the next page)")
+        return "\n".join(lines)
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def fetch_page(
+    con: sqlite3.Connection,
+    query: PagedQuery,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    after: Optional[Any] = None,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+) -> ResultPage:
+    """Fetch one page of a query, streaming rows until the page or budget is full.
+
+    Rows are read one at a time from the cursor and never materialized as a
+    whole; queries with a `cache_lookup` are served from the in-memory hot
+    tables instead. Pagination is keyset-based: the next page starts after the key of
+    the last row returned, so deep pages cost the same as the first.
+
+    Args:
+        con: Open database connection.
+        query: The query to page through.
+        page_size: Number of rows requested, clamped to [1, MAX_PAGE_SIZE].
+        after: Key of the last row of the previous page, or None for the first page.
+        token_budget: Approximate maximum tokens of the rendered table.
+
+    Returns:
+        The requested ResultPage.
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    key = query.key_column
+    hot_tables = get_hot_tables(database_path(con)) if query.cache_lookup else None
+    if hot_tables is not None:
+        # The first parameter of a cached query is the looked-up value
+        columns, cached_rows = hot_tables.lookup(query.cache_lookup, query.params[0])
+        rows_iter = iter(rows_after(cached_rows, columns.index(key), after))
+        cursor = None
+    else:
+        if after is None:
+            sql = f"SELECT * FROM ({query.sql}) ORDER BY {key} LIMIT ?"
+            params = (*query.params, page_size + 1)
+        else:
+            sql = f"SELECT * FROM ({query.sql}) WHERE {key} > ? ORDER BY {key} LIMIT ?"
+            params = (*query.params, after, page_size + 1)
+        cursor = con.execute(sql, params)
+        columns = [description[0] for description in cursor.description]
+        rows_iter = cursor
+    key_index = columns.index(key)
+
+    rows: List[Tuple[Any, ...]] = []
+    used_tokens = _estimate_tokens(query.title + " | ".join(columns))
+    has_more = False
+    for row in rows_iter:
+        if len(rows) == page_size:
+            has_more = True
+            break
+        row_tokens = _estimate_tokens(" | ".join(map(str, row)))
+        if rows and used_tokens + row_tokens > token_budget:
+            has_more = True
+            break
+        rows.append(row)
+        used_tokens += row_tokens
+    if cursor is not None:
+        cursor.close()
+
+    return ResultPage(
+        title=query.title,
+        columns=columns,
+        rows=rows,
+        has_more=has_more,
+        last_key=rows[-1][key_index] if rows else after,
+    )
+
+
+class _PageRequest(BaseModel):
+    query: PagedQuery
+    page_size: int
+    last_key: Optional[Any] = None
+
+
+_last_requests: "OrderedDict[Tuple[str, str], _PageRequest]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def session_key(config: Optional[dict]) -> Tuple[str, str]:
+    """Return the (user_id, conversation_id) pair of a runnable config."""
+    configurable = (config or {}).get("configurable", {})
+    return (str(configurable.get("user_id", "")), str(configurable.get("conversation_id", "")))
+
+
+def fetch_first_page(
+    con: sqlite3.Connection, query: PagedQuery, page_size: int, session: Tuple[str, str]
+) -> ResultPage:
+    """Fetch the first page of a query and remember it for "next page" follow-ups."""
+    page = fetch_page(con, query, page_size)
+    with _lock:
+        _last_requests[session] = _PageRequest(query=query, page_size=page_size, last_key=page.last_key)
+        _last_requests.move_to_end(session)
+        while len(_last_requests) > MAX_REMEMBERED_SESSIONS:
+            _last_requests.popitem(last=False)
+    return page
+
+
+def fetch_next_page(con: sqlite3.Connection, session: Tuple[str, str]) -> Optional[ResultPage]:
+    """Fetch the page following the last one served to a session.
+
+    Returns:
+        The next ResultPage, or None if the session has no previous query.
+    """
+    with _lock:
+        request = _last_requests.get(session)
+    if request is None:
+        return None
+
+    page = fetch_page(con, request.query, request.page_size, after=request.last_key)
+    with _lock:
+        request.last_key = page.last_key
+    return page
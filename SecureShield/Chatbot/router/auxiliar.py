@@ -1,47 +1,55 @@
 import json
 import os
+import sys
 
 # Define the base directory for file operations
 BASE_DIR = os.path.dirname(__file__)
 
+try:
+    from file_lock import file_lock
+except ImportError:
+    # Imported from the router folder, e.g. by generate_intentions.ipynb
+    sys.path.append(os.path.dirname(os.path.abspath(BASE_DIR)))
+    from file_lock import file_lock
 
-def add_message(new_item, file_name):
-    """Add a single message to a JSON file, assigning it a unique ID.
-
-    Args:
-        new_item: The message to add, provided as a dictionary.
-        file_name: The name of the JSON file to store the messages.
-    """
-    try:
-        file_path = os.path.join(BASE_DIR, file_name)
 
-        # Check if the file exists
-        if not os.path.exists(file_path):
-            # Assign an initial ID when creating a new file
-            new_item["Id"] = 1
-            data = [new_item]
+def _append_messages(new_items, file_path):
+    """Append messages to a JSON file, numbering them after the existing ones.
 
-            # Write the data to a new file
-            with open(file_path, "w") as file:
-                json.dump(data, file, indent=4)
-        else:
+    The file is read and rewritten under a lock shared by all processes, and
+    replaced in one step, so concurrent writers never lose each other's
+    messages and readers never see a partly written file.
+    """
+    with file_lock(file_path + ".lock"):
+        data = []
+        if os.path.exists(file_path):
             # Load existing messages from the file
             with open(file_path, "r") as file:
                 data = json.load(file)
 
-            # Determine the next ID based on existing data
-            if data:
-                max_id = max(item.get("Id", 0) for item in data)
-                new_item["Id"] = max_id + 1
-            else:
-                new_item["Id"] = 1  # Start from ID 1 if the file is empty
+        # Assign unique IDs after the largest existing one, starting from 1
+        max_id = max((item.get("Id", 0) for item in data), default=0)
+        for new_item in new_items:
+            max_id += 1
+            new_item["Id"] = max_id
+        data.extend(new_items)
 
-            # Add the new message to the list
-            data.append(new_item)
+        # Save the updated list next to the file, then swap it in
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(data, file, indent=4)
+        os.replace(temp_path, file_path)
 
-            # Save the updated list back to the file
-            with open(file_path, "w") as file:
-                json.dump(data, file, indent=4)
+
+def add_message(new_item, file_name):
+    """Add a single message to a JSON file, assigning it a unique ID.
+
+    Args:
+        new_item: The message to add, provided as a dictionary.
+        file_name: The name of the JSON file to store the messages.
+    """
+    try:
+        _append_messages([new_item], os.path.join(BASE_DIR, file_name))
 
     except json.JSONDecodeError as e:
         print(f"Error decoding JSON from file {file_name}: {e}")
@@ -61,40 +69,9 @@ def add_messages(new_items, file_name):
         new_items: A list of dictionaries representing the messages to add.
         file_name: The name of the JSON file to store the messages.
     """
+    file_path = os.path.join(BASE_DIR, file_name)
     try:
-        file_path = os.path.join(BASE_DIR, file_name)
-
-        # Check if the file exists
-        if not os.path.exists(file_path):
-            # Assign sequential IDs starting from 1 for a new file
-            for i, item in enumerate(new_items, 1):
-                item["Id"] = i
-
-            # Write all new items to a new file
-            with open(file_path, "w") as file:
-                json.dump(new_items, file, indent=4)
-        else:
-            # Load existing messages from the file
-            with open(file_path, "r") as file:
-                data = json.load(file)
-
-            # Determine the starting ID for the new items
-            if data:
-                max_id = max(item.get("Id", 0) for item in data)
-            else:
-                max_id = 0  # Start from ID 1 if the file is empty
-
-            # Assign unique IDs to each new item
-            for new_item in new_items:
-                max_id += 1
-                new_item["Id"] = max_id
-
-            # Add the new items to the existing data
-            data.extend(new_items)
-
-            # Save the updated data back to the file
-            with open(file_path, "w") as file:
-                json.dump(data, file, indent=4)
+        _append_messages(new_items, file_path)
 
     except json.JSONDecodeError as e:
         print(f"Error decoding JSON from file {file_path}: {e}")
@@ -0,0 +1,256 @@
+"""Build router/layer.json and its embedding sidecar from the route sources.
+
+Each file in router/routes/ defines one route (name, order, description,
+score_threshold and utterances). Routes are written in their `order`, which
+sets the order of the route index and so breaks ties between routes. Utterances are embedded in large batches
+through a content-addressed cache keyed on the encoder and the utterance text,
+so only new or changed utterances are sent to the encoder. The embeddings of
+all utterances are written to layer.embeddings.npz next to layer.json, which
+lets the loader build the RouteLayer without re-encoding them. The loader
+writes the sidecar itself when it is missing or stale.
+
+Usage:
+    python SecureShield/Chatbot/router/build.py
+    python SecureShield/Chatbot/router/build.py --batch-size 512 --rebuild
+"""
+
+# Import necessary modules and classes
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROUTES_DIR = os.path.join(BASE_DIR, "routes")
+LAYER_PATH = os.path.join(BASE_DIR, "layer.json")
+SIDECAR_PATH = os.path.join(BASE_DIR, "layer.embeddings.npz")
+CACHE_PATH = os.path.join(BASE_DIR, "embedding_cache.db")
+
+DEFAULT_ENCODER_TYPE = "huggingface"
+DEFAULT_ENCODER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_BATCH_SIZE = 256
+
+
+def load_route_sources(routes_dir: str = ROUTES_DIR) -> List[Dict]:
+    """Read the route definitions, sorted by their `order`; routes without one come last, by name.
+
+    Raises:
+        ValueError: If two files define the same route.
+    """
+    routes: Dict[str, Dict] = {}
+    for path in sorted(glob.glob(os.path.join(routes_dir, "*.json"))):
+        with open(path) as file:
+            route = json.load(file)
+        if route["name"] in routes:
+            raise ValueError(f"Route '{route['name']}' is defined twice ({path}).")
+        # Keep the first occurrence of each utterance
+        route["utterances"] = list(dict.fromkeys(route["utterances"]))
+        routes[route["name"]] = route
+    return sorted(routes.values(), key=lambda route: (route.get("order", float("inf")), route["name"]))
+
+
+def utterance_key(encoder_type: str, encoder_name: str, utterance: str) -> str:
+    """Return the content address of an utterance embedding."""
+    return hashlib.sha256(f"{encoder_type}\0{encoder_name}\0{utterance}".encode()).hexdigest()
+
+
+def layer_digest(config: Dict) -> str:
+    """Return a digest of the encoder and the utterances of each route.
+
+    Stored in the sidecar so the loader can tell whether it matches layer.json.
+    """
+    content = [config["encoder_type"], config["encoder_name"]]
+    content += [[route["name"], route["utterances"]] for route in config["routes"]]
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed store of utterance embeddings in a SQLite file."""
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.con = sqlite3.connect(path)
+        self.con.execute("CREATE TABLE IF NOT EXISTS Embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        # Stay below SQLite's limit on bound parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.con.execute(
+                f"SELECT key, vector FROM Embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+        return found
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]) -> None:
+        with self.con:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO Embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items],
+            )
+
+    def close(self) -> None:
+        self.con.close()
+
+
+def embed_utterances(
+    utterances: List[str],
+    encoder,
+    encoder_type: str,
+    encoder_name: str,
+    cache: EmbeddingCache,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Tuple[np.ndarray, int]:
+    """Embed utterances, encoding only those missing from the cache.
+
+    Returns:
+        The float32 embedding matrix in utterance order, and the number of
+        utterances that had to be encoded.
+    """
+    keys = [utterance_key(encoder_type, encoder_name, utterance) for utterance in utterances]
+    cached = cache.get_many(list(set(keys)))
+    missing = list(dict.fromkeys(u for u, key in zip(utterances, keys) if key not in cached))
+
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        vectors = encoder(batch)
+        items = [(utterance_key(encoder_type, encoder_name, u), np.asarray(v, dtype=np.float32)) for u, v in zip(batch, vectors)]
+        cache.put_many(items)
+        cached.update(items)
+
+    return np.stack([cached[key] for key in keys]).astype(np.float32), len(missing)
+
+
+def build_layer(
+    encoder=None,
+    encoder_type: str = DEFAULT_ENCODER_TYPE,
+    encoder_name: str = DEFAULT_ENCODER_NAME,
+    routes_dir: str = ROUTES_DIR,
+    layer_path: str = LAYER_PATH,
+    sidecar_path: str = SIDECAR_PATH,
+    cache_path: str = CACHE_PATH,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Dict:
+    """Write layer.json and its embedding sidecar from the route sources.
+
+    Args:
+        encoder: Encoder to embed with; defaults to the one named by
+            encoder_type and encoder_name.
+        encoder_type: semantic_router encoder type recorded in layer.json.
+        encoder_name: Encoder model recorded in layer.json.
+        routes_dir: Directory of the route source files.
+        layer_path: Output layer configuration.
+        sidecar_path: Output embedding sidecar.
+        cache_path: Embedding cache file.
+        batch_size: Utterances per encoder call.
+
+    Returns:
+        A summary with the number of routes, utterances and encoded utterances.
+    """
+    start = time.perf_counter()
+    routes = load_route_sources(routes_dir)
+    config = {
+        "encoder_type": encoder_type,
+        "encoder_name": encoder_name,
+        "routes": [
+            {
+                "name": route["name"],
+                "utterances": route["utterances"],
+                "description": route.get("description"),
+                "function_schemas": route.get("function_schemas"),
+                "llm": None,
+                "score_threshold": route.get("score_threshold"),
+                "metadata": route.get("metadata", {}),
+            }
+            for route in routes
+        ],
+    }
+
+    if encoder is None:
+        from semantic_router.encoders import AutoEncoder
+
+        encoder = AutoEncoder(type=encoder_type, name=encoder_name).model
+
+    _, encoded = write_sidecar(config, encoder, sidecar_path, cache_path, batch_size)
+    with open(layer_path, "w") as file:
+        json.dump(config, file, indent=4)
+
+    utterances = sum(len(route["utterances"]) for route in routes)
+    return {
+        "routes": len(routes),
+        "utterances": utterances,
+        "encoded": encoded,
+        "cached": utterances - encoded,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def write_sidecar(
+    config: Dict,
+    encoder,
+    sidecar_path: str = SIDECAR_PATH,
+    cache_path: str = CACHE_PATH,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Tuple[Dict[str, np.ndarray], int]:
+    """Embed the utterances of a layer configuration and write its sidecar.
+
+    The file is replaced atomically, so workers writing it at the same time
+    never leave a partial one.
+
+    Returns:
+        The sidecar arrays, as returned by load_sidecar, and the number of
+        utterances that had to be encoded.
+    """
+    routes = config["routes"]
+    utterances = [utterance for route in routes for utterance in route["utterances"]]
+    route_names = [route["name"] for route in routes for _ in route["utterances"]]
+    cache = EmbeddingCache(cache_path)
+    try:
+        embeddings, encoded = embed_utterances(
+            utterances, encoder, config["encoder_type"], config["encoder_name"], cache, batch_size
+        )
+    finally:
+        cache.close()
+
+    arrays = {"embeddings": embeddings, "routes": np.array(route_names), "utterances": np.array(utterances)}
+    temporary_path = f"{sidecar_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as file:
+        np.savez(file, digest=np.array(layer_digest(config)), **arrays)
+    os.replace(temporary_path, sidecar_path)
+    return arrays, encoded
+
+
+def load_sidecar(config: Dict, sidecar_path: str = SIDECAR_PATH) -> Optional[Dict[str, np.ndarray]]:
+    """Return the sidecar arrays if they were built for this layer configuration."""
+    if not os.path.exists(sidecar_path):
+        return None
+    with np.load(sidecar_path) as sidecar:
+        if str(sidecar["digest"]) != layer_digest(config):
+            return None
+        return {name: sidecar[name] for name in ("embeddings", "routes", "utterances")}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--encoder-type", default=DEFAULT_ENCODER_TYPE, help="semantic_router encoder type")
+    parser.add_argument("--encoder-name", default=DEFAULT_ENCODER_NAME, help="Encoder model name")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Utterances per encoder call")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the embedding cache and re-encode everything")
+    args = parser.parse_args()
+
+    if args.rebuild and os.path.exists(CACHE_PATH):
+        os.remove(CACHE_PATH)
+    summary = build_layer(encoder_type=args.encoder_type, encoder_name=args.encoder_name, batch_size=args.batch_size)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+# Import necessary modules and classes
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from semantic_router import RouteLayer
+from semantic_router.encoders import BaseEncoder
+from semantic_router.layer import LayerConfig
+
+from router.auxiliar import BASE_DIR, add_message
+from router.loader import FILE_PATH, build_route_layer
+
+logger = logging.getLogger(__name__)
+
+# Corrections logged for the live router, relative to the router folder
+CORRECTIONS_FILE = "corrections.json"
+
+# Seconds between two checks of the router sources
+POLL_INTERVAL = float(os.getenv("SECURESHIELD_ROUTER_POLL", "2.0"))
+
+
+def record_correction(utterance: str, intent: str, file_name: str = CORRECTIONS_FILE) -> None:
+    """Log the intent an utterance should have been routed to.
+
+    The correction is appended with `auxiliar.add_message`, in the same format
+    as synthetic_intetions.json. Running LiveRouters add it to their route
+    index on their next check.
+
+    Args:
+        utterance: The misrouted user message.
+        intent: The route name it belongs to.
+        file_name: The corrections file in the router folder.
+    """
+    add_message({"Intention": intent, "Message": utterance}, file_name)
+
+
+def with_utterances(layer: RouteLayer, pairs: Sequence[Tuple[str, str]], embeddings: np.ndarray) -> RouteLayer:
+    """Return a copy of a layer with utterances added to its routes and index.
+
+    The original layer is left untouched, so it can keep serving requests.
+
+    Args:
+        layer: The layer to extend.
+        pairs: (utterance, route name) pairs to add.
+        embeddings: The embedding of each utterance, in the same order.
+
+    Returns:
+        The extended RouteLayer, sharing the encoder of the original.
+    """
+    added: Dict[str, List[str]] = {}
+    for utterance, route_name in pairs:
+        added.setdefault(route_name, []).append(utterance)
+
+    new_layer = RouteLayer(encoder=layer.encoder, top_k=layer.top_k, aggregation=layer.aggregation)
+    new_layer.score_threshold = layer.score_threshold
+    new_layer.routes = [
+        route.copy(update={"utterances": route.utterances + added.get(route.name, [])}) for route in layer.routes
+    ]
+    index = layer.index
+    new_layer.index.add(
+        embeddings=np.concatenate([index.index, embeddings]) if index.index is not None else embeddings,
+        routes=list(index.routes if index.routes is not None else []) + [route for _, route in pairs],
+        utterances=list(index.utterances if index.utterances is not None else []) + [u for u, _ in pairs],
+    )
+    return new_layer
+
+
+class LiveRouter:
+    """A RouteLayer that reloads its sources and learns corrections without downtime.
+
+    The sources are checked at most every SECURESHIELD_ROUTER_POLL seconds. A
+    changed layer.json (or embedding sidecar) rebuilds the layer on a
+    background thread; new entries in the corrections file are encoded and
+    added to a copy of the current route index. Either way the new layer is
+    swapped in with a single reference assignment, so requests already
+    classifying keep the layer they started with.
+
+    Exposes the classification methods of RouteLayer; other attributes are
+    read from the current layer. An encoder passed in (e.g. an offline one for
+    benchmarks) is used instead of the one named in the file.
+    """
+
+    def __init__(
+        self,
+        file_path: str = FILE_PATH,
+        corrections_path: str = os.path.join(BASE_DIR, CORRECTIONS_FILE),
+        poll_interval: float = POLL_INTERVAL,
+        encoder: Optional[BaseEncoder] = None,
+    ):
+        self.file_path = file_path
+        self.sidecar_path = os.path.splitext(file_path)[0] + ".embeddings.npz"
+        self.corrections_path = corrections_path
+        self.poll_interval = poll_interval
+        self.reloads = 0
+        self.learned = 0
+        self._custom_encoder = encoder is not None
+
+        self._lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._checked_at = time.monotonic()
+        self._sources = self._source_stamp()
+        self._corrections = self._corrections_stamp()
+        self._layer, self._applied_id = self._apply_corrections(build_route_layer(file_path, encoder), 0)
+
+    @property
+    def layer(self) -> RouteLayer:
+        """The layer currently serving requests."""
+        return self._layer
+
+    def __call__(self, text: str):
+        self._maybe_refresh()
+        return self._layer(text)
+
+    def retrieve_multiple_routes(self, text: Optional[str] = None, vector: Optional[List[float]] = None):
+        self._maybe_refresh()
+        return self._layer.retrieve_multiple_routes(text, vector)
+
+    def __getattr__(self, name: str):
+        return getattr(self._layer, name)
+
+    def learn(self, utterance: str, intent: str) -> None:
+        """Add a corrected utterance to the live route index and log it.
+
+        Raises:
+            ValueError: If the intent is not a route of the layer.
+        """
+        if intent not in self._layer.list_route_names():
+            raise ValueError(f"Unknown route '{intent}'.")
+        record_correction(utterance, intent, self.corrections_path)
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Check the sources now and apply any change before returning."""
+        with self._lock:
+            self._refresh()
+
+    def _maybe_refresh(self) -> None:
+        # Requests never wait for a refresh; it runs on a background thread
+        now = time.monotonic()
+        if now - self._checked_at < self.poll_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.poll_interval:
+                return
+            self._checked_at = now
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            if self._source_stamp() == self._sources and self._corrections_stamp() == self._corrections:
+                return
+            self._refresh_thread = threading.Thread(target=self.refresh, name="router-refresh", daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh(self) -> None:
+        sources = self._source_stamp()
+        corrections = self._corrections_stamp()
+        try:
+            if sources != self._sources:
+                self._layer, self._applied_id = self._apply_corrections(self._rebuild(), 0)
+                self.reloads += 1
+                logger.info(f"Reloaded the intent router from {self.file_path}")
+            elif corrections != self._corrections:
+                self._layer, self._applied_id = self._apply_corrections(self._layer, self._applied_id)
+        except Exception as e:
+            # Keep serving the current layer; the change is retried on the next check
+            logger.warning(f"Refreshing the intent router failed: {e!r}")
+            return
+        self._sources = sources
+        self._corrections = corrections
+
+    def _rebuild(self) -> RouteLayer:
+        # Reuse the loaded encoder unless the layer now names another one
+        config = LayerConfig.from_file(self.file_path)
+        encoder = self._layer.encoder
+        same_encoder = self._custom_encoder or config.encoder_name == encoder.name
+        return build_route_layer(self.file_path, encoder=encoder if same_encoder else None)
+
+    def _apply_corrections(self, layer: RouteLayer, after_id: int) -> Tuple[RouteLayer, int]:
+        # Returns the layer with the corrections logged after `after_id`, and the last id applied
+        if not os.path.exists(self.corrections_path):
+            return layer, after_id
+        with open(self.corrections_path) as file:
+            entries = [entry for entry in json.load(file) if entry.get("Id", 0) > after_id]
+        if not entries:
+            return layer, after_id
+
+        route_names = set(layer.list_route_names())
+        known = set()
+        if layer.index.routes is not None:
+            known = {(utterance, route) for route, utterance in zip(layer.index.routes, layer.index.utterances)}
+        pairs: List[Tuple[str, str]] = []
+        for entry in entries:
+            pair = (entry["Message"], entry["Intention"])
+            if pair[1] not in route_names:
+                logger.warning(f"Skipping correction {entry.get('Id')}: unknown route '{pair[1]}'")
+            elif pair not in known:
+                known.add(pair)
+                pairs.append(pair)
+        last_id = max(entry.get("Id", 0) for entry in entries)
+        if not pairs:
+            return layer, last_id
+
+        embeddings = np.array(layer.encoder([utterance for utterance, _ in pairs]))
+        self.learned += len(pairs)
+        return with_utterances(layer, pairs, embeddings), last_id
+
+    def _source_stamp(self) -> Tuple:
+        return tuple(_stamp(path) for path in (self.file_path, self.sidecar_path))
+
+    def _corrections_stamp(self) -> Tuple:
+        return _stamp(self.corrections_path)
+
+
+def _stamp(path: str) -> Tuple:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return ()
+    return (stat.st_mtime_ns, stat.st_size)
@@ -1,18 +1,41 @@
+import json
+import logging
 import os
+import sqlite3
+import threading
+from typing import List, Optional
 
-from semantic_router import RouteLayer
+from semantic_router import Route, RouteLayer
+from semantic_router.encoders import AutoEncoder, BaseEncoder
+from semantic_router.layer import LayerConfig
+
+from router.build import load_sidecar, write_sidecar
+
+logger = logging.getLogger(__name__)
 
 FILENAME = "layer.json"
 BASE_DIR = os.path.dirname(__file__)
 FILE_PATH = os.path.join(BASE_DIR, FILENAME)
 
+# Set SECURESHIELD_ROUTER_RELOAD=0 to load the default layer once, without watching its sources
+LIVE_RELOAD = os.getenv("SECURESHIELD_ROUTER_RELOAD", "1") != "0"
+
+# The layer built from FILE_PATH is shared, so its encoder is loaded only once
+_default_layer = None
+_lock = threading.Lock()
 
-def load_intention_classifier() -> RouteLayer:
+
+def load_intention_classifier(encoder: Optional[BaseEncoder] = None):
     """
     Load json a file in the `router` folder.
 
+    Args:
+        encoder: Encoder to use instead of the one named in the file,
+            e.g. an offline encoder for benchmarks.
+
     Returns:
-        RouteLayer object to classify user intentions.
+        RouteLayer object to classify user intentions; the default one is a
+        LiveRouter that follows changes to the file and logged corrections.
 
     Raises:
         ValueError: If the file type is not supported.
@@ -21,6 +44,77 @@ def load_intention_classifier() -> RouteLayer:
     if not os.path.exists(FILE_PATH):
         raise FileNotFoundError(f"File not found: {FILE_PATH}")
 
-    rl = RouteLayer.from_json(FILE_PATH)
+    if encoder is not None:
+        return RouteLayer(encoder=encoder, routes=LayerConfig.from_file(FILE_PATH).routes)
+
+    global _default_layer
+    with _lock:
+        if _default_layer is None:
+            if LIVE_RELOAD:
+                from router.live import LiveRouter
+
+                _default_layer = LiveRouter(FILE_PATH)
+            else:
+                _default_layer = build_route_layer(FILE_PATH)
+
+    return _default_layer
+
+
+def build_route_layer(file_path: str = FILE_PATH, encoder: Optional[BaseEncoder] = None) -> RouteLayer:
+    """Build the RouteLayer of a layer file with the encoder it names.
+
+    If the embedding sidecar written by `router/build.py` matches the file,
+    the utterance embeddings are loaded from it instead of being re-encoded.
+    Otherwise it is written now, from the embedding cache where possible, so
+    later loads and the other workers skip encoding.
 
-    return rl
+    Args:
+        file_path: The layer configuration to load.
+        encoder: An already loaded instance of the encoder named in the file.
+
+    Returns:
+        RouteLayer object to classify user intentions.
+    """
+    config = LayerConfig.from_file(file_path)
+    if encoder is None:
+        encoder = AutoEncoder(type=config.encoder_type, name=config.encoder_name).model
+    with open(file_path) as file:
+        raw_config = json.load(file)
+    sidecar_path = os.path.splitext(file_path)[0] + ".embeddings.npz"
+    sidecar = load_sidecar(raw_config, sidecar_path)
+    if sidecar is None:
+        try:
+            cache_path = os.path.join(os.path.dirname(file_path), "embedding_cache.db")
+            sidecar, _ = write_sidecar(raw_config, encoder, sidecar_path, cache_path)
+        except (OSError, sqlite3.Error) as e:
+            # E.g. a read-only deployment: the layer encodes its utterances itself
+            logger.warning(f"Router embedding sidecar not written: {e!r}")
+            return RouteLayer(encoder=encoder, routes=config.routes)
+
+    return assemble_route_layer(
+        encoder, config.routes, sidecar["embeddings"], sidecar["routes"].tolist(), sidecar["utterances"].tolist()
+    )
+
+
+def assemble_route_layer(
+    encoder: BaseEncoder, routes: List[Route], embeddings, route_names: List[str], utterances: List[str]
+) -> RouteLayer:
+    """Build a RouteLayer from precomputed utterance embeddings.
+
+    Args:
+        encoder: Encoder the embeddings were computed with.
+        routes: The routes of the layer.
+        embeddings: One embedding per utterance.
+        route_names: The route of each utterance.
+        utterances: The utterances, in the order of the embeddings.
+
+    Returns:
+        RouteLayer object to classify user intentions.
+    """
+    layer = RouteLayer(encoder=encoder)
+    for route in routes:
+        if route.score_threshold is None:
+            route.score_threshold = layer.score_threshold
+    layer.routes = routes
+    layer.index.add(embeddings=embeddings, routes=route_names, utterances=utterances)
+    return layer
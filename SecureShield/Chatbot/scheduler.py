@@ -0,0 +1,416 @@
+# Import necessary modules and classes
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from langchain_core.runnables import Runnable
+
+import tracing
+
+
+class Priority(IntEnum):
+    """Priority classes for LLM requests. Lower values are served first."""
+
+    CLAIM_UPDATE = 0
+    LOOKUP = 1
+    RAG = 2
+    CHITCHAT = 3
+
+
+# Maximum number of requests that may wait in each priority queue
+DEFAULT_MAX_QUEUE: Dict[Priority, int] = {
+    Priority.CLAIM_UPDATE: 256,
+    Priority.LOOKUP: 128,
+    Priority.RAG: 64,
+    Priority.CHITCHAT: 32,
+}
+
+# Maximum time in seconds a request may wait before it is shed
+DEFAULT_MAX_WAIT: Dict[Priority, float] = {
+    Priority.CLAIM_UPDATE: 30.0,
+    Priority.LOOKUP: 15.0,
+    Priority.RAG: 10.0,
+    Priority.CHITCHAT: 5.0,
+}
+
+# Number of recent wait times kept per priority for percentile reporting
+WAIT_SAMPLE_SIZE = 1024
+
+# Completion tokens assumed for a request before its real usage is known
+DEFAULT_COMPLETION_TOKENS = 256
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a request is shed because its queue is full or it waited too long."""
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate."""
+
+    def __init__(self, capacity_per_minute: float):
+        """Initialize a full bucket.
+
+        Args:
+            capacity_per_minute: Bucket size and refill rate per minute.
+        """
+        self.capacity = float(capacity_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Return how long to wait until `amount` tokens are available."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        """Remove tokens from the bucket. The balance may go negative."""
+        self._refill()
+        self.tokens -= amount
+
+
+class CallCancelled(Exception):
+    """Raised when a queued request is withdrawn because its caller gave up on it."""
+
+
+class CancelToken:
+    """Lets a caller give up on a model call, e.g. the slower of two hedged requests.
+
+    A cancelled call that is still queued leaves the queue. One in flight
+    keeps its scheduler slot until the provider answers, since its request
+    still holds a connection and counts against the provider's limits.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Run `callback` when the token is cancelled, or now if it already is."""
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+
+# Token of the model call running in the current context, if it can be cancelled
+current_cancel_token: ContextVar[Optional[CancelToken]] = ContextVar("current_cancel_token", default=None)
+
+# Monotonic time by which the model call running in the current context must answer
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+
+class Ticket:
+    """A request waiting for, or holding, a scheduler slot."""
+
+    __slots__ = ("priority", "tokens", "enqueued_at", "started_at", "released")
+
+    def __init__(self, priority: Priority, tokens: int):
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.released = False
+
+
+class LLMScheduler:
+    """Process-wide scheduler that every chain's LLM call goes through.
+
+    Requests are admitted in strict priority order, subject to a concurrency
+    limit and to token-bucket limits on requests and tokens per minute.
+    Queues are bounded; requests that find their queue full or wait longer
+    than their class allows are shed with SchedulerOverloaded.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 500,
+        tokens_per_minute: float = 80000,
+        max_concurrency: int = 16,
+        max_queue: Optional[Dict[Priority, int]] = None,
+        max_wait: Optional[Dict[Priority, float]] = None,
+    ):
+        """Initialize the scheduler limits.
+
+        Args:
+            requests_per_minute: Request rate limit of the provider account.
+            tokens_per_minute: Token rate limit of the provider account.
+            max_concurrency: Maximum number of requests in flight.
+            max_queue: Maximum queue length per priority.
+            max_wait: Maximum queueing time in seconds per priority.
+        """
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_queue = dict(max_queue or DEFAULT_MAX_QUEUE)
+        self.max_wait = dict(max_wait or DEFAULT_MAX_WAIT)
+
+        self._condition = threading.Condition()
+        self._heap: List = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._queued: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self._shed: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self._completed: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self._wait_times: Dict[Priority, Deque[float]] = {
+            priority: deque(maxlen=WAIT_SAMPLE_SIZE) for priority in Priority
+        }
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        """Build a scheduler using limits from environment variables, if set."""
+        return cls(
+            requests_per_minute=float(os.getenv("SECURESHIELD_LLM_RPM", 500)),
+            tokens_per_minute=float(os.getenv("SECURESHIELD_LLM_TPM", 80000)),
+            max_concurrency=int(os.getenv("SECURESHIELD_LLM_MAX_CONCURRENCY", 16)),
+        )
+
+    def _remove(self, ticket: Ticket) -> None:
+        self._heap = [entry for entry in self._heap if entry[2] is not ticket]
+        heapq.heapify(self._heap)
+        self._queued[ticket.priority] -= 1
+
+    def _notify(self) -> None:
+        with self._condition:
+            self._condition.notify_all()
+
+    def acquire(
+        self,
+        priority: Priority,
+        tokens: int,
+        cancel_token: Optional[CancelToken] = None,
+        deadline: Optional[float] = None,
+    ) -> Ticket:
+        """Block until the request may be sent to the provider.
+
+        A request is shed once it waited `max_wait` for its priority or once
+        the caller's deadline passed, whichever comes first.
+
+        Args:
+            priority: Priority class of the request.
+            tokens: Estimated number of tokens the request will use.
+            cancel_token: Token withdrawing the request from the queue when cancelled.
+            deadline: Monotonic time after which the caller no longer needs an answer.
+
+        Returns:
+            A Ticket that must be passed to `release` once the call finishes.
+
+        Raises:
+            SchedulerOverloaded: If the request is shed.
+            CallCancelled: If the request was cancelled while it was queued.
+        """
+        if cancel_token is not None:
+            cancel_token.on_cancel(self._notify)
+        with self._condition:
+            if self._queued[priority] >= self.max_queue[priority]:
+                self._shed[priority] += 1
+                raise SchedulerOverloaded(f"Queue for {priority.name} is full.")
+
+            ticket = Ticket(priority, tokens)
+            heapq.heappush(self._heap, (priority, next(self._sequence), ticket))
+            self._queued[priority] += 1
+            max_wait_at = ticket.enqueued_at + self.max_wait[priority]
+            shed_at = max_wait_at if deadline is None else min(max_wait_at, deadline)
+
+            while True:
+                if cancel_token is not None and cancel_token.cancelled:
+                    self._remove(ticket)
+                    self._condition.notify_all()
+                    raise CallCancelled(f"{priority.name} request was cancelled while queued.")
+
+                now = time.monotonic()
+                if now >= shed_at:
+                    self._remove(ticket)
+                    self._shed[priority] += 1
+                    self._condition.notify_all()
+                    if shed_at < max_wait_at:
+                        raise SchedulerOverloaded(f"{priority.name} request was still queued at its deadline.")
+                    raise SchedulerOverloaded(
+                        f"{priority.name} request waited longer than {self.max_wait[priority]}s."
+                    )
+
+                timeout = shed_at - now
+                if self._heap[0][2] is ticket and self._in_flight < self.max_concurrency:
+                    wait = max(
+                        self.request_bucket.wait_time(1),
+                        self.token_bucket.wait_time(tokens),
+                    )
+                    if wait <= 0:
+                        break
+                    timeout = min(timeout, wait)
+
+                self._condition.wait(timeout=timeout)
+
+            heapq.heappop(self._heap)
+            self._queued[priority] -= 1
+            self._in_flight += 1
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(tokens)
+            ticket.started_at = time.monotonic()
+            self._wait_times[priority].append(ticket.started_at - ticket.enqueued_at)
+
+            # Let the next request in line check its own admission
+            self._condition.notify_all()
+            return ticket
+
+    def is_saturated(self) -> bool:
+        """Whether every slot is taken or requests are already waiting for one."""
+        with self._condition:
+            return self._in_flight >= self.max_concurrency or any(self._queued.values())
+
+    def release(self, ticket: Ticket, actual_tokens: Optional[int] = None) -> None:
+        """Free the slot held by a request and correct its token estimate.
+
+        Releasing a ticket again only corrects its token estimate.
+
+        Args:
+            ticket: The ticket returned by `acquire`.
+            actual_tokens: Tokens reported by the provider, if available.
+        """
+        with self._condition:
+            if not ticket.released:
+                ticket.released = True
+                self._in_flight -= 1
+                self._completed[ticket.priority] += 1
+            if actual_tokens is not None:
+                self.token_bucket.consume(actual_tokens - ticket.tokens)
+            self._condition.notify_all()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Report queue depth, in-flight requests, shed counts and wait times.
+
+        Returns:
+            A dictionary with overall values and per-priority statistics.
+        """
+        with self._condition:
+            per_priority = {}
+            for priority in Priority:
+                waits = sorted(self._wait_times[priority])
+                per_priority[priority.name] = {
+                    "queue_depth": self._queued[priority],
+                    "completed": self._completed[priority],
+                    "shed": self._shed[priority],
+                    "wait_p50": _percentile(waits, 0.50),
+                    "wait_p95": _percentile(waits, 0.95),
+                    "wait_max": waits[-1] if waits else 0.0,
+                }
+            return {"in_flight": self._in_flight, "priorities": per_priority}
+
+    def prometheus_lines(self) -> List[str]:
+        """Render the scheduler metrics in the Prometheus exposition format."""
+        snapshot = self.metrics()
+        lines = [
+            "# TYPE secureshield_scheduler_in_flight gauge",
+            f"secureshield_scheduler_in_flight {snapshot['in_flight']}",
+        ]
+        for name, values in snapshot["priorities"].items():
+            for key, value in values.items():
+                lines.append(f'secureshield_scheduler_{key}{{priority="{name}"}} {value}')
+        return lines
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def estimate_tokens(value: Any) -> int:
+    """Roughly estimate prompt plus completion tokens for a model input.
+
+    Uses the common approximation of four characters per token.
+    """
+    text = value.to_string() if hasattr(value, "to_string") else str(value)
+    return len(text) // 4 + DEFAULT_COMPLETION_TOKENS
+
+
+def _usage_tokens(result: Any) -> Optional[int]:
+    usage = getattr(result, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens")
+    return None
+
+
+class ScheduledRunnable(Runnable):
+    """Wraps a chat model so that its calls go through the LLM scheduler."""
+
+    def __init__(self, runnable: Runnable, priority: Priority, scheduler: Optional[LLMScheduler] = None):
+        """Initialize the wrapper.
+
+        Args:
+            runnable: The chat model to wrap.
+            priority: Priority class of the stage that owns the model.
+            scheduler: Scheduler to use. Defaults to the process-wide scheduler.
+        """
+        super().__init__()
+        self.runnable = runnable
+        self.priority = priority
+        self.scheduler = scheduler
+
+    def invoke(self, input, config=None, **kwargs):
+        scheduler = self.scheduler or get_scheduler()
+        cancel_token = current_cancel_token.get()
+        ticket = scheduler.acquire(self.priority, estimate_tokens(input), cancel_token, current_deadline.get())
+        tracing.current_span().set(
+            "queue_wait_ms", round((ticket.started_at - ticket.enqueued_at) * 1000, 3)
+        )
+        # The slot is held until the provider answers, even if the caller gave up
+        result = None
+        try:
+            result = self.runnable.invoke(input, config, **kwargs)
+            return result
+        finally:
+            scheduler.release(ticket, _usage_tokens(result))
+
+    def is_saturated(self) -> bool:
+        """Whether a further call would have to wait for a scheduler slot."""
+        return (self.scheduler or get_scheduler()).is_saturated()
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Return the process-wide scheduler, creating it on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler.from_env()
+            tracing.metrics.register_collector(lambda: get_scheduler().prometheus_lines())
+        return _scheduler
+
+
+def set_scheduler(scheduler: LLMScheduler) -> None:
+    """Replace the process-wide scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
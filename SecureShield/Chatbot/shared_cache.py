@@ -0,0 +1,323 @@
+# Import necessary modules and classes
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.load import dumpd
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.runnables import Runnable
+
+from tracing import metrics, record_cache
+
+logger = logging.getLogger(__name__)
+
+# Set to a file path to share histories and model results between processes
+CACHE_PATH = os.getenv("SECURESHIELD_SHARED_CACHE_PATH", "")
+
+# Size limit of the stored values
+MAX_BYTES = int(float(os.getenv("SECURESHIELD_SHARED_CACHE_MB", "256")) * 1024 * 1024)
+
+# Seconds a published session history is kept after its last update
+HISTORY_TTL = float(os.getenv("SECURESHIELD_HISTORY_TTL", str(24 * 60 * 60)))
+
+# Seconds a temperature-0 model result is reused; 0 disables the model cache
+LLM_CACHE_TTL = float(os.getenv("SECURESHIELD_LLM_CACHE_TTL", "0"))
+
+# Eviction frees space down to this fraction of the limit, so it runs rarely
+EVICT_TO = 0.9
+
+# Values from this size on are compressed
+COMPRESS_MIN_BYTES = 1024
+
+# Reads refresh the recency of an entry at most this often, to spare writes
+ACCESS_RESOLUTION = 10.0
+
+# Value encodings
+RAW, JSON = "raw", "json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    encoding TEXT NOT NULL,
+    compressed INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_expiry ON Cache(expires_at);
+CREATE INDEX IF NOT EXISTS cache_access ON Cache(accessed_at);
+CREATE TABLE IF NOT EXISTS CacheStats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total_bytes INTEGER NOT NULL,
+    entries INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO CacheStats VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_stats_insert AFTER INSERT ON Cache BEGIN
+    UPDATE CacheStats SET total_bytes = total_bytes + NEW.size, entries = entries + 1 WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_stats_delete AFTER DELETE ON Cache BEGIN
+    UPDATE CacheStats SET total_bytes = total_bytes - OLD.size, entries = entries - 1 WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_stats_update AFTER UPDATE OF size ON Cache BEGIN
+    UPDATE CacheStats SET total_bytes = total_bytes - OLD.size + NEW.size WHERE id = 0;
+END;
+"""
+
+
+def _encode(value: Any):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        data, encoding = bytes(value), RAW
+    else:
+        data, encoding = json.dumps(value, separators=(",", ":")).encode(), JSON
+    compressed = len(data) >= COMPRESS_MIN_BYTES
+    if compressed:
+        data = zlib.compress(data, 6)
+    return data, encoding, compressed
+
+
+def _decode(data: bytes, encoding: str, compressed: int) -> Any:
+    if compressed:
+        data = zlib.decompress(data)
+    return data if encoding == RAW else json.loads(data)
+
+
+def _namespace(key: str) -> str:
+    return key.split(":", 1)[0]
+
+
+class SharedCache:
+    """Key-value cache with TTLs and a size limit, shared through a SQLite file.
+
+    The file is in WAL mode, so every app process on the host reads what any
+    other one wrote and reads never block writers. Values are bytes or
+    JSON-serializable objects, compressed from COMPRESS_MIN_BYTES on.
+    Expired entries are never returned and are evicted first when the cache
+    is over its limit, then the least recently read ones. Triggers keep the
+    total size in CacheStats, so the limit is checked without a table scan.
+    """
+
+    def __init__(self, path: str, max_bytes: int = MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        con = self._connection()
+        con.execute("PRAGMA journal_mode=WAL")
+        con.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, kept open
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=10.0)
+            con.isolation_level = None
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the value of a key, or `default` if it is missing or expired."""
+        now = time.time()
+        con = self._connection()
+        row = con.execute(
+            "SELECT value, encoding, compressed, accessed_at FROM Cache WHERE key = ? AND expires_at > ?",
+            (key, now),
+        ).fetchone()
+        metrics.inc("secureshield_shared_cache_requests_total", namespace=_namespace(key), result="hit" if row else "miss")
+        if row is None:
+            return default
+        value, encoding, compressed, accessed_at = row
+        if now - accessed_at > ACCESS_RESOLUTION:
+            con.execute("UPDATE Cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return _decode(value, encoding, compressed)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """Store a value for `ttl` seconds, replacing any previous value."""
+        now = time.time()
+        data, encoding, compressed = _encode(value)
+        con = self._connection()
+        con.execute(
+            """
+            INSERT INTO Cache (key, value, encoding, compressed, size, expires_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                value = excluded.value, encoding = excluded.encoding, compressed = excluded.compressed,
+                size = excluded.size, expires_at = excluded.expires_at, accessed_at = excluded.accessed_at
+            """,
+            (key, data, encoding, int(compressed), len(data), now + ttl, now),
+        )
+        if not con.in_transaction:
+            self._evict_if_full(con)
+
+    def add(self, key: str, value: Any, ttl: float) -> bool:
+        """Store a value only if the key is missing or expired.
+
+        Returns:
+            Whether the value was stored.
+        """
+        now = time.time()
+        data, encoding, compressed = _encode(value)
+        con = self._connection()
+        cursor = con.execute(
+            """
+            INSERT INTO Cache (key, value, encoding, compressed, size, expires_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                value = excluded.value, encoding = excluded.encoding, compressed = excluded.compressed,
+                size = excluded.size, expires_at = excluded.expires_at, accessed_at = excluded.accessed_at
+            WHERE Cache.expires_at <= ?
+            """,
+            (key, data, encoding, int(compressed), len(data), now + ttl, now, now),
+        )
+        stored = cursor.rowcount > 0
+        if stored and not con.in_transaction:
+            self._evict_if_full(con)
+        return stored
+
+    def get_or_set(self, key: str, factory: Callable[[], Any], ttl: float) -> Any:
+        """Return the cached value, computing and storing it on a miss.
+
+        When several processes miss at once, all of them return the value
+        stored first.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        value = factory()
+        if self.add(key, value, ttl):
+            return value
+        stored = self.get(key, missing)
+        return value if stored is missing else stored
+
+    def touch(self, keys: List[str], ttl: float) -> None:
+        """Extend the TTL of entries and mark them as just read."""
+        if not keys:
+            return
+        now = time.time()
+        placeholders = ",".join("?" * len(keys))
+        self._connection().execute(
+            f"UPDATE Cache SET expires_at = ?, accessed_at = ? WHERE key IN ({placeholders}) AND expires_at > ?",
+            (now + ttl, now, *keys, now),
+        )
+
+    @contextmanager
+    def transaction(self) -> Iterator["SharedCache"]:
+        """Run the cache calls in the block atomically.
+
+        The block holds the write lock of the cache file, so no other process
+        writes between its reads and its writes, e.g. to compare and set.
+        """
+        con = self._connection()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            yield self
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        self._evict_if_full(con)
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM Cache WHERE key = ?", (key,))
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of entries and the bytes they use."""
+        total_bytes, entries = self._connection().execute(
+            "SELECT total_bytes, entries FROM CacheStats WHERE id = 0"
+        ).fetchone()
+        return {"entries": entries, "total_bytes": total_bytes, "max_bytes": self.max_bytes}
+
+    def _evict_if_full(self, con: sqlite3.Connection) -> None:
+        total = con.execute("SELECT total_bytes FROM CacheStats WHERE id = 0").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        now = time.time()
+        target = int(self.max_bytes * EVICT_TO)
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.execute("DELETE FROM Cache WHERE expires_at <= ?", (now,))
+            total = con.execute("SELECT total_bytes FROM CacheStats WHERE id = 0").fetchone()[0]
+            if total > target:
+                # Least recently read first, until enough space is freed
+                con.execute(
+                    """
+                    DELETE FROM Cache WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, SUM(size) OVER (ORDER BY accessed_at, key) - size AS freed_before
+                            FROM Cache
+                        ) WHERE freed_before < ?
+                    )
+                    """,
+                    (total - target,),
+                )
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        metrics.inc("secureshield_shared_cache_evictions_total")
+
+
+_cache: Optional[SharedCache] = None
+_lock = threading.Lock()
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """Return the process-wide shared cache, or None if it is not configured."""
+    global _cache
+    if not CACHE_PATH:
+        return None
+    with _lock:
+        if _cache is None:
+            _cache = SharedCache(CACHE_PATH)
+        return _cache
+
+
+class CachedRunnable(Runnable):
+    """Serves repeated calls of a deterministic chat model from the shared cache.
+
+    Wraps the model outside the scheduler, so hits neither wait for nor use
+    rate-limit capacity. Hits and misses are counted on the current span.
+    """
+
+    def __init__(self, runnable: Runnable, cache: SharedCache, namespace: str, ttl: float):
+        """Initialize the wrapper.
+
+        Args:
+            runnable: The chat model to wrap.
+            cache: Cache to store the results in.
+            namespace: Key prefix, which should identify the model and its settings.
+            ttl: Seconds a result is reused.
+        """
+        super().__init__()
+        self.runnable = runnable
+        self.cache = cache
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def invoke(self, input, config=None, **kwargs):
+        prompt = json.dumps(dumpd(input), sort_keys=True) if not isinstance(input, str) else input
+        key = f"llm:{self.namespace}:{hashlib.sha256(prompt.encode()).hexdigest()}"
+        try:
+            cached = self.cache.get(key)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache unavailable: {e!r}")
+            return self.runnable.invoke(input, config, **kwargs)
+
+        record_cache(cached is not None)
+        if cached is not None:
+            # No tokens were spent on a hit
+            return messages_from_dict([cached])[0].model_copy(update={"usage_metadata": None})
+        result = self.runnable.invoke(input, config, **kwargs)
+        try:
+            self.cache.set(key, message_to_dict(result), self.ttl)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache unavailable: {e!r}")
+        return result
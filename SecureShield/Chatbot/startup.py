@@ -0,0 +1,262 @@
+"""Cold-start helpers for the Streamlit app.
+
+The chatbot engine (langchain, langchain_openai, semantic_router, the chains)
+is imported lazily on first use. `preload_in_background` imports it on a
+daemon thread once the first page has been served, and `warm_up` additionally
+builds the router, opens pooled connections, touches the hot SQLite tables and
+runs a dry request through each chain against fake models before marking the
+engine ready on the /ready endpoint. This module only imports the standard
+library at import time.
+
+Usage:
+    python SecureShield/Chatbot/startup.py --report SecureShield.Chatbot.bot --top 25
+    python SecureShield/Chatbot/startup.py --warm-up
+"""
+
+# Import necessary modules and classes
+import argparse
+import importlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Module of the chatbot engine, as imported by the Streamlit pages
+BOT_MODULE = "SecureShield.Chatbot.bot"
+
+# Modules preloaded after the UI is served, heaviest dependencies first
+PRELOAD_MODULES: Tuple[str, ...] = (
+    "langchain_core.runnables",
+    "langchain_openai",
+    "langchain_community",
+    "semantic_router",
+    BOT_MODULE,
+)
+
+# One dry request per read-only chain; the claim update chain is only built
+WARMUP_REQUESTS: Dict[str, str] = {
+    "Get_Claim_Info": "What is the current status of claim 1?",
+    "Get_Policy_Info": "Show me the details of policy 1.",
+    "Claims_Analytics": "How many claims do we have per status?",
+    "Chitchat": "Hello, how are you doing today?",
+}
+
+_preload_thread: Optional[threading.Thread] = None
+_preload_times: Dict[str, float] = {}
+_preload_errors: Dict[str, str] = {}
+_lock = threading.Lock()
+
+
+def _preload(modules: Sequence[str]) -> None:
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            _preload_errors[name] = repr(e)
+            logger.warning(f"Preloading {name} failed: {e!r}")
+            continue
+        _preload_times[name] = time.perf_counter() - start
+
+
+def preload_in_background(modules: Sequence[str] = PRELOAD_MODULES) -> threading.Thread:
+    """Import the heavy modules on a daemon thread; later calls are no-ops.
+
+    Returns:
+        The preloading thread.
+    """
+    global _preload_thread
+    with _lock:
+        if _preload_thread is None:
+            _preload_thread = threading.Thread(
+                target=_preload, args=(tuple(modules),), name="secureshield-preload", daemon=True
+            )
+            _preload_thread.start()
+        return _preload_thread
+
+
+def preload_status() -> Dict[str, object]:
+    """Return whether preloading finished, with per-module times and errors."""
+    return {
+        "started": _preload_thread is not None,
+        "done": _preload_thread is not None and not _preload_thread.is_alive(),
+        "seconds": dict(_preload_times),
+        "errors": dict(_preload_errors),
+    }
+
+
+_warmup_thread: Optional[threading.Thread] = None
+_warmup_report: Dict[str, object] = {}
+
+
+def _timed(step: str, fn) -> bool:
+    start = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        _warmup_report[step] = {"seconds": round(time.perf_counter() - start, 3), "error": repr(e)}
+        logger.warning(f"Warm-up step {step} failed: {e!r}")
+        return False
+    _warmup_report[step] = {"seconds": round(time.perf_counter() - start, 3)}
+    return True
+
+
+def _warm_router() -> None:
+    from router.loader import load_intention_classifier
+
+    load_intention_classifier()("hello")
+
+
+def _warm_connections() -> None:
+    from transport import get_http_client, get_pinecone
+
+    client = get_http_client()
+    if os.getenv("OPENAI_API_KEY"):
+        # Any response will do; the point is the TLS handshake and a pooled connection
+        client.get(os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1") + "/models", timeout=5.0)
+    if os.getenv("PINECONE_API_KEY"):
+        get_pinecone().Index("documents").describe_index_stats()
+
+
+def _migrate_database() -> None:
+    from database import connect, migrate
+
+    con = connect()
+    try:
+        migrate(con)
+    finally:
+        con.close()
+
+
+def _warm_database() -> None:
+    from database import connect, get_db_path
+    from hot_tables import get_hot_tables
+
+    con = connect()
+    try:
+        # Read every page of the claims table into the OS and SQLite caches
+        con.execute("SELECT SUM(amount_claimed), COUNT(status) FROM Claims").fetchone()
+    finally:
+        con.close()
+    hot_tables = get_hot_tables(get_db_path())
+    if hot_tables is not None:
+        hot_tables.lookup("policy", 1)
+
+
+def _warm_chains(bot_module, classifier) -> None:
+    from benchmark.fakes import build_fake_registry, build_fake_retriever
+    from rag import RagChain
+
+    # The throwaway chains get their own fake models; the process-wide registry is untouched
+    registry = build_fake_registry(latency=0.0, tokens_per_second=1e9)
+    retriever = build_fake_retriever()
+    bot = bot_module.MainChatbot(intention_classifier=classifier, rag_retriever=retriever, registry=registry)
+    prompt_injection_chain = bot_module.IsPromptInjection(registry=registry)
+    rag = RagChain(username="warmup", retriever=retriever, registry=registry)
+    bot.user_login(username="warmup", conversation_id="warmup")
+
+    for intent, message in WARMUP_REQUESTS.items():
+        user_input = {"user_input": message}
+        prompt_injection_chain.invoke(user_input)
+        bot.get_user_intent(user_input)
+        bot.intent_handlers[intent](user_input)
+    rag.run_chain(question="What does the HomeProtect policy cover?")
+
+
+def warm_up() -> bool:
+    """Warm up the engine and mark it ready if the router and chains work.
+
+    The database is migrated first. Connection failures (e.g. no network)
+    are reported but do not block readiness.
+
+    Returns:
+        Whether the engine was marked ready.
+    """
+    _preload(PRELOAD_MODULES)
+    from router.loader import load_intention_classifier
+    from tracing import set_ready, start_metrics_server
+
+    start_metrics_server()
+    bot_module = importlib.import_module(BOT_MODULE)
+    migrated = _timed("migration", _migrate_database)
+    router_ok = _timed("router", _warm_router)
+    _timed("connections", _warm_connections)
+    _timed("database", _warm_database)
+    classifier = load_intention_classifier() if router_ok else None
+    chains_ok = router_ok and _timed("chains", lambda: _warm_chains(bot_module, classifier))
+
+    ready = migrated and router_ok and chains_ok
+    set_ready(ready)
+    return ready
+
+
+def warm_up_in_background() -> threading.Thread:
+    """Run `warm_up` on a daemon thread; later calls are no-ops.
+
+    Returns:
+        The warm-up thread.
+    """
+    global _warmup_thread
+    with _lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=warm_up, name="secureshield-warmup", daemon=True)
+            _warmup_thread.start()
+        return _warmup_thread
+
+
+def warm_up_report() -> Dict[str, object]:
+    """Return the duration and error of each warm-up step run so far."""
+    return dict(_warmup_report)
+
+
+def import_time_report(module: str, top: int = 20) -> List[Tuple[str, float, float]]:
+    """Measure the imports of a module in a fresh interpreter with `-X importtime`.
+
+    Returns:
+        (module, cumulative ms, self ms) for the `top` slowest imports.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((name.rstrip(), int(cumulative_us) / 1000, int(self_us) / 1000))
+    entries.sort(key=lambda entry: entry[1], reverse=True)
+    return entries[:top]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--report", default="SecureShield.Chatbot.bot", help="Module whose import to measure")
+    parser.add_argument("--top", type=int, default=20, help="Number of slowest imports to show")
+    parser.add_argument("--warm-up", action="store_true", help="Run the warm-up and print its report instead")
+    args = parser.parse_args()
+
+    if args.warm_up:
+        ready = warm_up()
+        print(json.dumps({"ready": ready, "preload": preload_status(), "steps": warm_up_report()}, indent=2))
+        return 0 if ready else 1
+
+    entries = import_time_report(args.report, args.top)
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, cumulative_ms, self_ms in entries:
+        print(f"{cumulative_ms:14.1f} {self_ms:9.1f}  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
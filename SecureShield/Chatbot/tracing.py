@@ -0,0 +1,378 @@
+# Import necessary modules and classes
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.runnables import Runnable
+
+# Tracing is on by default; set SECURESHIELD_TRACING=0 to turn it off
+ENABLED = os.getenv("SECURESHIELD_TRACING", "1") != "0"
+
+# Port of the Prometheus-style metrics endpoint; set to 0 to disable it
+METRICS_PORT = int(os.getenv("SECURESHIELD_METRICS_PORT", 9464))
+
+# Interface of the metrics endpoint; local only unless set, e.g. to 0.0.0.0
+METRICS_HOST = os.getenv("SECURESHIELD_METRICS_HOST", "127.0.0.1")
+
+# Workers on one host take consecutive ports from METRICS_PORT, so each one
+# reports its own /metrics and /ready
+METRICS_PORTS = int(os.getenv("SECURESHIELD_METRICS_PORTS", 16))
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger("secureshield.trace")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class Span:
+    """Timing and counters of one stage of a request."""
+
+    __slots__ = ("name", "parent", "start", "duration", "attributes")
+
+    def __init__(self, name: str, parent: Optional[str]):
+        self.name = name
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.attributes: Dict[str, Any] = {}
+
+    def set(self, key: str, value: Any) -> None:
+        """Set an attribute on the span."""
+        self.attributes[key] = value
+
+    def add(self, key: str, amount: float = 1) -> None:
+        """Increment a numeric attribute on the span."""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "duration_ms": round(self.duration * 1000, 3),
+            **self.attributes,
+        }
+
+
+class Trace:
+    """All spans recorded while processing one user request."""
+
+    def __init__(self, request_id: str, attributes: Dict[str, Any]):
+        self.request_id = request_id
+        self.attributes = dict(attributes)
+        self.spans: List[Span] = []
+        self.start = time.perf_counter()
+        self.duration = 0.0
+
+    def set(self, key: str, value: Any) -> None:
+        """Set an attribute on the request, e.g. its intent."""
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "duration_ms": round(self.duration * 1000, 3),
+            **self.attributes,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+class _NullSpan:
+    """Span stand-in used when there is no active trace."""
+
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def add(self, key: str, amount: float = 1) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus exposition format."""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """Thread-safe store of histograms and counters rendered for Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Record a value in the histogram `name` with the given labels."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        """Increment the counter `name` with the given labels."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def register_collector(self, collector: Callable[[], List[str]]) -> None:
+        """Add a function returning extra exposition lines on each scrape."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in self._histograms.items():
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(key, le=str(bound))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(key)} {histogram.total}")
+                    lines.append(f"{name}_count{_labels(key)} {histogram.count}")
+            for name, series in self._counters.items():
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_labels(key)} {value}")
+            collectors = list(self._collectors)
+        for collector in collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key: LabelKey, **extra: str) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+metrics = MetricsRegistry()
+
+
+@contextmanager
+def start_trace(**attributes: Any) -> Iterator[Optional[Trace]]:
+    """Trace one user request. Spans opened inside are attached to it.
+
+    On exit the trace is logged as one JSON line and its latencies are added
+    to the request and stage histograms.
+    """
+    if not ENABLED:
+        yield None
+        return
+
+    trace = Trace(uuid.uuid4().hex, attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        trace.duration = time.perf_counter() - trace.start
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        _finish_trace(trace)
+
+
+def _finish_trace(trace: Trace) -> None:
+    intent = str(trace.attributes.get("intent"))
+    metrics.observe("secureshield_request_seconds", trace.duration, intent=intent)
+    for span in trace.spans:
+        metrics.observe(
+            "secureshield_stage_seconds", span.duration, intent=intent, stage=span.name
+        )
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if kind in span.attributes:
+                metrics.inc(
+                    "secureshield_llm_tokens_total",
+                    span.attributes[kind],
+                    stage=span.name,
+                    kind=kind,
+                )
+        for kind in ("cache_hits", "cache_misses"):
+            if kind in span.attributes:
+                metrics.inc(f"secureshield_{kind}_total", span.attributes[kind], stage=span.name)
+    logger.info(json.dumps(trace.to_dict(), default=str))
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """Time a stage of the current request.
+
+    Does nothing (and yields a no-op span) when no trace is active.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield _NULL_SPAN
+        return
+
+    parent = _current_span.get()
+    current = Span(name, parent.name if parent else None)
+    current.attributes.update(attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.set("error", type(e).__name__)
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _current_span.reset(token)
+        trace.spans.append(current)
+
+
+def current_span() -> Any:
+    """Return the innermost open span, or a no-op span."""
+    return _current_span.get() or _NULL_SPAN
+
+
+def current_trace() -> Optional[Trace]:
+    """Return the active trace, if any."""
+    return _current_trace.get()
+
+
+def record_cache(hit: bool) -> None:
+    """Count a cache hit or miss on the innermost open span."""
+    current_span().add("cache_hits" if hit else "cache_misses")
+
+
+class TracedRunnable(Runnable):
+    """Wraps a chat model so that each call is a span with its token usage."""
+
+    def __init__(self, runnable: Runnable, stage: str, tier: str):
+        """Initialize the wrapper.
+
+        Args:
+            runnable: The chat model to wrap.
+            stage: Name of the registry stage the model serves.
+            tier: Name of the tier the model belongs to.
+        """
+        super().__init__()
+        self.runnable = runnable
+        self.stage = stage
+        self.tier = tier
+
+    def invoke(self, input, config=None, **kwargs):
+        with span(f"llm.{self.stage}", tier=self.tier) as llm_span:
+            result = self.runnable.invoke(input, config, **kwargs)
+            usage = getattr(result, "usage_metadata", None)
+            if usage:
+                llm_span.set("prompt_tokens", usage.get("input_tokens", 0))
+                llm_span.set("completion_tokens", usage.get("output_tokens", 0))
+            return result
+
+
+_ready = threading.Event()
+
+
+def set_ready(ready: bool = True) -> None:
+    """Mark the engine as ready (or not) to serve traffic; reported on /ready."""
+    if ready:
+        _ready.set()
+    else:
+        _ready.clear()
+
+
+def is_ready() -> bool:
+    """Return whether the engine finished warming up."""
+    return _ready.is_set()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/ready":
+            # Load balancer readiness probe
+            ready = is_ready()
+            body = b"ready\n" if ready else b"warming up\n"
+            self.send_response(200 if ready else 503)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(
+    port: int = METRICS_PORT, host: str = METRICS_HOST, ports: int = METRICS_PORTS
+) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics and /ready of this worker from a background thread. Safe to call repeatedly.
+
+    Args:
+        port: First port to try. 0 disables the endpoint.
+        host: Interface to listen on.
+        ports: Number of consecutive ports to try, one per worker on the host.
+
+    Returns:
+        The running server, or None if it is disabled or every port is taken.
+    """
+    global _server
+    with _server_lock:
+        if _server is not None or not ENABLED or port == 0:
+            return _server
+        for candidate in range(port, port + max(ports, 1)):
+            try:
+                _server = ThreadingHTTPServer((host, candidate), _MetricsHandler)
+            except OSError as e:
+                error = e
+                continue
+            break
+        else:
+            logging.getLogger(__name__).warning(f"Metrics endpoint not started: {error}")
+            return None
+        logging.getLogger(__name__).info(f"Metrics endpoint of worker {os.getpid()} on {host}:{candidate}")
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server
@@ -0,0 +1,288 @@
+# Import necessary modules and classes
+import datetime
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("jsonl", "parquet")
+
+COLUMNS = ("user_id", "conversation_id", "message_index", "role", "content", "timestamp", "intent", "latency_ms")
+
+CHECKPOINT_FILE = "_checkpoint.json"
+
+# Held by the process exporting to a folder, so workers export one at a time
+LOCK_FILE = "_export.lock"
+
+# Rows buffered per partition before they are written out
+DEFAULT_CHUNK_SIZE = 1000
+
+# Rows per output file before a new part is started
+DEFAULT_ROWS_PER_FILE = 100_000
+
+# Set SECURESHIELD_EXPORT_DIR to export the transcripts periodically from the app
+EXPORT_DIR = os.getenv("SECURESHIELD_EXPORT_DIR", "")
+EXPORT_FORMAT = os.getenv("SECURESHIELD_EXPORT_FORMAT", "jsonl")
+EXPORT_INTERVAL = float(os.getenv("SECURESHIELD_EXPORT_INTERVAL", str(24 * 60 * 60)))
+
+SessionKey = Tuple[str, str]
+
+
+def load_checkpoint(out_dir: str) -> Dict[SessionKey, int]:
+    """Return the number of exported messages per (user_id, conversation_id)."""
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        data = json.load(file)
+    return {(entry["user_id"], entry["conversation_id"]): entry["exported"] for entry in data["sessions"]}
+
+
+def save_checkpoint(out_dir: str, checkpoint: Dict[SessionKey, int]) -> None:
+    """Atomically replace the checkpoint of an output folder."""
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    data = {
+        "exported_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "sessions": [
+            {"user_id": user_id, "conversation_id": conversation_id, "exported": exported}
+            for (user_id, conversation_id), exported in sorted(checkpoint.items())
+        ],
+    }
+    with open(path + ".tmp", "w") as file:
+        json.dump(data, file, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def iter_transcript_records(managers, checkpoint: Dict[SessionKey, int]) -> Iterator[Dict[str, Any]]:
+    """Yield the messages added since the checkpoint, one conversation at a time.
+
+    Histories are first brought up to date with the shared cache, so every
+    worker numbers the messages of a conversation the same way and only the
+    first one to export them writes them.
+
+    Updates `checkpoint` with the number of messages yielded per conversation.
+    """
+    for manager in managers:
+        for (user_id, conversation_id), history in list(manager.store.items()):
+            manager.sync_session_history(user_id, conversation_id)
+            key = (str(user_id), str(conversation_id))
+            start = checkpoint.get(key, 0)
+            if start > len(history):
+                # The history was cleared since the last export
+                start = 0
+            for index, role, content, timestamp, intent, latency_ms in history.iter_records(start):
+                yield {
+                    "user_id": key[0],
+                    "conversation_id": key[1],
+                    "message_index": index,
+                    "role": role,
+                    "content": content,
+                    "timestamp": timestamp,
+                    "intent": intent,
+                    "latency_ms": latency_ms,
+                }
+                checkpoint[key] = index + 1
+
+
+def _utc(timestamp: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+class _JsonlPart:
+    def __init__(self, path: str):
+        self.file = open(path, "w")
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            self.file.write(json.dumps({**row, "timestamp": _utc(row["timestamp"]).isoformat()}) + "\n")
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _ParquetPart:
+    def __init__(self, path: str):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ("user_id", pa.string()),
+            ("conversation_id", pa.string()),
+            ("message_index", pa.int64()),
+            ("role", pa.string()),
+            ("content", pa.string()),
+            ("timestamp", pa.timestamp("ms", tz="UTC")),
+            ("intent", pa.string()),
+            ("latency_ms", pa.float32()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        # One row group per chunk
+        columns = {name: [row[name] for row in rows] for name in COLUMNS}
+        columns["timestamp"] = [_utc(value) for value in columns["timestamp"]]
+        self.writer.write_table(self.pa.table(columns, schema=self.schema))
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class TranscriptExporter:
+    """Writes transcript records to date-partitioned files in chunks.
+
+    Files are laid out as {out_dir}/date=YYYY-MM-DD/part-{run}-{n:04d}.jsonl
+    (or .parquet), one row per message with the columns in COLUMNS. At most
+    one chunk per partition is held in memory. A checkpoint in the output
+    folder records how many messages of each conversation were exported, so
+    a run only writes the messages added since the previous one. Files are
+    renamed into place and the checkpoint saved only once all of them were
+    written, so a failed run leaves no partial files and is retried in full.
+    Parquet output needs pyarrow.
+    """
+
+    def __init__(
+        self,
+        out_dir: str,
+        fmt: str = "jsonl",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        rows_per_file: int = DEFAULT_ROWS_PER_FILE,
+    ):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported export format '{fmt}'; use one of {', '.join(FORMATS)}.")
+        if fmt == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError as e:
+                raise ImportError("Parquet export needs pyarrow: pip install pyarrow") from e
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.rows_per_file = rows_per_file
+
+    def export(self, managers=None) -> Dict[str, Any]:
+        """Export the messages added since the last checkpoint.
+
+        Args:
+            managers: MemoryManagers to export; defaults to all of the process.
+
+        Returns:
+            The number of rows and the files written.
+        """
+        if managers is None:
+            # Imported like bot.py imports it, so both see the same registry
+            try:
+                from .memory import all_memory_managers
+            except ImportError:
+                from memory import all_memory_managers
+
+            managers = all_memory_managers()
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        # Workers sharing the folder would otherwise overwrite each other's checkpoint
+        with file_lock(os.path.join(self.out_dir, LOCK_FILE)):
+            return self._export(managers)
+
+    def _export(self, managers) -> Dict[str, Any]:
+        checkpoint = load_checkpoint(self.out_dir)
+        run = time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        part_numbers = itertools.count()
+        buffers: Dict[str, List[Dict[str, Any]]] = {}
+        parts: Dict[str, Tuple[Any, str, int]] = {}  # partition -> (writer, temporary path, rows)
+        finished: List[str] = []
+        rows = 0
+
+        def flush(partition: str) -> None:
+            writer, path, written = parts.get(partition, (None, "", 0))
+            if writer is None:
+                folder = os.path.join(self.out_dir, f"date={partition}")
+                os.makedirs(folder, exist_ok=True)
+                path = os.path.join(folder, f".part-{run}-{next(part_numbers):04d}.{self.fmt}.tmp")
+                writer = _ParquetPart(path) if self.fmt == "parquet" else _JsonlPart(path)
+            writer.write(buffers[partition])
+            written += len(buffers[partition])
+            buffers[partition] = []
+            if written >= self.rows_per_file:
+                writer.close()
+                finished.append(path)
+                parts.pop(partition, None)
+            else:
+                parts[partition] = (writer, path, written)
+
+        try:
+            for record in iter_transcript_records(managers, checkpoint):
+                partition = _utc(record["timestamp"]).date().isoformat()
+                buffers.setdefault(partition, []).append(record)
+                rows += 1
+                if len(buffers[partition]) >= self.chunk_size:
+                    flush(partition)
+            for partition, buffer in list(buffers.items()):
+                if buffer:
+                    flush(partition)
+            for writer, path, _ in parts.values():
+                writer.close()
+                finished.append(path)
+        except BaseException:
+            for writer, path, _ in parts.values():
+                writer.close()
+                finished.append(path)
+            for path in finished:
+                os.remove(path)
+            raise
+
+        files = []
+        for path in finished:
+            final_path = os.path.join(os.path.dirname(path), os.path.basename(path)[1:-len(".tmp")])
+            os.replace(path, final_path)
+            files.append(final_path)
+        save_checkpoint(self.out_dir, checkpoint)
+        return {"rows": rows, "files": files}
+
+
+def export_transcripts(out_dir: str, fmt: str = "jsonl", managers=None, **kwargs) -> Dict[str, Any]:
+    """Export the messages added since the last export to `out_dir`."""
+    return TranscriptExporter(out_dir, fmt, **kwargs).export(managers)
+
+
+_export_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+
+
+def _export_periodically(out_dir: str, fmt: str, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            summary = export_transcripts(out_dir, fmt)
+            logger.info(f"Exported {summary['rows']} transcript messages to {len(summary['files'])} files")
+        except Exception as e:
+            logger.warning(f"Transcript export failed: {e!r}")
+
+
+def start_export_scheduler(
+    out_dir: str = EXPORT_DIR, fmt: str = EXPORT_FORMAT, interval: float = EXPORT_INTERVAL
+) -> Optional[threading.Thread]:
+    """Export the transcripts every `interval` seconds on a daemon thread.
+
+    Does nothing without an output folder; later calls are no-ops.
+
+    Returns:
+        The export thread, or None if exports are not configured.
+    """
+    global _export_thread
+    if not out_dir:
+        return None
+    with _lock:
+        if _export_thread is None:
+            _export_thread = threading.Thread(
+                target=_export_periodically, args=(out_dir, fmt, interval), name="transcript-export", daemon=True
+            )
+            _export_thread.start()
+        return _export_thread
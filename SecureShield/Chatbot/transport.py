@@ -0,0 +1,391 @@
+# Import necessary modules and classes
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional, TypeVar
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from langchain_core.runnables import Runnable
+from langchain_openai import OpenAIEmbeddings
+
+from scheduler import CancelToken, current_cancel_token, current_deadline
+from tracing import metrics
+
+load_dotenv()
+
+T = TypeVar("T")
+
+# Connection pool limits shared by every model and embedding client
+MAX_CONNECTIONS = int(os.getenv("SECURESHIELD_HTTP_MAX_CONNECTIONS", 32))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SECURESHIELD_HTTP_MAX_KEEPALIVE", 16))
+KEEPALIVE_EXPIRY = 60.0
+
+# Maximum number of duplicate requests from hedging in flight at once
+MAX_HEDGES = int(os.getenv("SECURESHIELD_MAX_HEDGES", max(1, MAX_CONNECTIONS // 4)))
+
+# Default timeouts in seconds; model stages override the read timeout per request
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 30.0
+
+# Errors worth retrying: the request may succeed when sent again
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    httpx.TimeoutException,
+    httpx.TransportError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the provider's circuit is open."""
+
+
+class CircuitBreaker:
+    """Circuit breaker that fails fast once a provider keeps failing.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    are rejected immediately. After `reset_timeout` seconds a single trial call
+    is let through; its outcome closes the circuit or opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """Initialize a closed circuit.
+
+        Args:
+            name: Name of the protected dependency, used in error messages.
+            failure_threshold: Consecutive failures that open the circuit.
+            reset_timeout: Seconds the circuit stays open before a trial call.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        """Whether calls are currently rejected."""
+        with self._lock:
+            return self.opened_at is not None and (
+                self._trial_in_flight
+                or time.monotonic() - self.opened_at < self.reset_timeout
+            )
+
+    def _before_call(self) -> None:
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if self._trial_in_flight or time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"Circuit for {self.name} is open.")
+            self._trial_in_flight = True
+
+    def _record(self, success: Optional[bool]) -> None:
+        with self._lock:
+            self._trial_in_flight = False
+            if success is None:
+                return
+            if success:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.failure_threshold or self.opened_at is not None:
+                    self.opened_at = time.monotonic()
+
+    def call(self, fn: Callable[[], T]) -> T:
+        """Run `fn` through the breaker.
+
+        Only retryable provider errors count as failures; other exceptions
+        (e.g. a shed request) pass through without affecting the circuit.
+
+        Raises:
+            CircuitOpenError: If the circuit is open.
+        """
+        self._before_call()
+        try:
+            result = fn()
+        except RETRYABLE_ERRORS:
+            self._record(success=False)
+            raise
+        except Exception:
+            self._record(success=None)
+            raise
+        self._record(success=True)
+        return result
+
+
+def retry_with_backoff(
+    fn: Callable[[], T],
+    retries: int = 2,
+    base_delay: float = 0.25,
+    max_delay: float = 4.0,
+    deadline: Optional[float] = None,
+) -> T:
+    """Call `fn`, retrying retryable errors with full-jitter exponential backoff.
+
+    Args:
+        fn: The call to make.
+        retries: Maximum number of retries after the first attempt.
+        base_delay: Backoff ceiling in seconds for the first retry.
+        max_delay: Upper bound for the backoff ceiling.
+        deadline: Monotonic time after which no further retry is started.
+
+    Returns:
+        The result of the first successful call.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except RETRYABLE_ERRORS:
+            if attempt >= retries:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+
+_hedge_executor = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS, thread_name_prefix="hedge")
+_hedges_in_flight = 0
+_hedges_lock = threading.Lock()
+
+
+def _reserve_hedge() -> bool:
+    global _hedges_in_flight
+    with _hedges_lock:
+        if _hedges_in_flight >= MAX_HEDGES:
+            return False
+        _hedges_in_flight += 1
+        return True
+
+
+def _release_hedge_when_done(futures) -> None:
+    # The duplicate counts until both attempts returned, whichever of them lost
+    remaining = [len(futures)]
+
+    def done(_):
+        global _hedges_in_flight
+        with _hedges_lock:
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                _hedges_in_flight -= 1
+
+    for future in futures:
+        future.add_done_callback(done)
+
+
+def _run_cancellable(fn: Callable[[], T], cancel_token: CancelToken) -> T:
+    current_cancel_token.set(cancel_token)
+    return fn()
+
+
+def _start_attempt(fn: Callable[[], T], cancel_token: CancelToken) -> Future:
+    # Each attempt runs in a copy of the caller's context, so its spans join the trace
+    context = contextvars.copy_context()
+    future: Future = Future()
+    future.set_running_or_notify_cancel()
+
+    def run():
+        try:
+            future.set_result(context.run(_run_cancellable, fn, cancel_token))
+        except BaseException as e:
+            future.set_exception(e)
+
+    # Started right away rather than queued behind the hedge executor, so it
+    # goes straight to the scheduler, which orders and sheds it by priority
+    threading.Thread(target=run, name="hedge-first", daemon=True).start()
+    return future
+
+
+def _submit_hedge(fn: Callable[[], T], cancel_token: CancelToken) -> Future:
+    return _hedge_executor.submit(contextvars.copy_context().run, _run_cancellable, fn, cancel_token)
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def _may_hedge(saturated: Optional[Callable[[], bool]]) -> bool:
+    with _hedges_lock:
+        if _hedges_in_flight >= MAX_HEDGES:
+            return False
+    return saturated is None or not saturated()
+
+
+def hedged(
+    fn: Callable[[], T],
+    hedge_after: float,
+    saturated: Optional[Callable[[], bool]] = None,
+    deadline: Optional[float] = None,
+) -> T:
+    """Call `fn` and, if it has not answered after `hedge_after` seconds, call it
+    again in parallel. The first successful answer wins, and the other call is
+    cancelled: it leaves the scheduler queue if it is still waiting there.
+
+    No duplicate is sent while MAX_HEDGES of them are in flight or while
+    `saturated` returns True, e.g. when the scheduler has no free slot; if
+    that is already the case when the call starts, `fn` runs on the calling
+    thread. Only the duplicate runs on the hedge executor.
+
+    Only use for calls without side effects.
+
+    Raises:
+        TimeoutError: If no attempt answered by `deadline` (monotonic time).
+    """
+    if not _may_hedge(saturated):
+        metrics.inc("secureshield_hedges_skipped_total")
+        return fn()
+
+    tokens = {}
+    first_token = CancelToken()
+    first = _start_attempt(fn, first_token)
+    tokens[first] = first_token
+    pending = {first}
+    error: Optional[BaseException] = None
+    try:
+        timeout = _remaining(deadline)
+        done, pending = wait(pending, timeout=hedge_after if timeout is None else min(hedge_after, timeout))
+        if not done and _remaining(deadline) != 0:
+            if (saturated is not None and saturated()) or not _reserve_hedge():
+                metrics.inc("secureshield_hedges_skipped_total")
+            else:
+                second_token = CancelToken()
+                second = _submit_hedge(fn, second_token)
+                _release_hedge_when_done([first, second])
+                tokens[second] = second_token
+                pending.add(second)
+
+        while done or pending:
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                break
+            timeout = _remaining(deadline)
+            if timeout == 0:
+                raise TimeoutError("No attempt answered within the latency budget.")
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        raise error
+    finally:
+        for future in pending:
+            tokens[future].cancel()
+
+
+class ResilientRunnable(Runnable):
+    """Wraps a chat model with a circuit breaker, retries and optional hedging."""
+
+    def __init__(
+        self,
+        runnable: Runnable,
+        breaker: CircuitBreaker,
+        timeout: float,
+        hedge_after: Optional[float] = None,
+        retries: int = 2,
+    ):
+        """Initialize the wrapper.
+
+        Args:
+            runnable: The chat model to wrap.
+            breaker: Circuit breaker of the model's provider endpoint.
+            timeout: Latency budget in seconds; no retry starts after it elapses.
+            hedge_after: Seconds after which a duplicate request is sent, or None.
+            retries: Maximum number of retries.
+        """
+        super().__init__()
+        self.runnable = runnable
+        self.breaker = breaker
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self.retries = retries
+
+    def invoke(self, input, config=None, **kwargs):
+        deadline = time.monotonic() + self.timeout
+
+        def attempt():
+            if self.hedge_after is None:
+                return self.runnable.invoke(input, config, **kwargs)
+            return hedged(
+                lambda: self.runnable.invoke(input, config, **kwargs),
+                self.hedge_after,
+                saturated=getattr(self.runnable, "is_saturated", None),
+                deadline=deadline,
+            )
+
+        # The scheduler sheds the call once the deadline passes, whatever its max_wait
+        reset = current_deadline.set(deadline)
+        try:
+            return self.breaker.call(
+                lambda: retry_with_backoff(attempt, retries=self.retries, deadline=deadline)
+            )
+        finally:
+            current_deadline.reset(reset)
+
+
+_http_client: Optional[httpx.Client] = None
+_breakers: Dict[str, CircuitBreaker] = {}
+_pinecone = None
+_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """Return the shared keep-alive HTTP client used for all model calls."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            )
+        return _http_client
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Return the circuit breaker for a dependency, creating it on first use."""
+    with _lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def is_degraded() -> bool:
+    """Whether any dependency is currently failing fast."""
+    with _lock:
+        breakers = list(_breakers.values())
+    return any(breaker.is_open for breaker in breakers)
+
+
+def get_embeddings(model: str) -> OpenAIEmbeddings:
+    """Create an embeddings client that shares the pooled HTTP client."""
+    return OpenAIEmbeddings(
+        model=model,
+        http_client=get_http_client(),
+        request_timeout=READ_TIMEOUT,
+        max_retries=2,
+    )
+
+
+def get_pinecone():
+    """Return the shared Pinecone client, creating it on first use."""
+    global _pinecone
+    with _lock:
+        if _pinecone is None:
+            from pinecone import Pinecone
+
+            _pinecone = Pinecone(pool_threads=MAX_KEEPALIVE_CONNECTIONS)
+        return _pinecone
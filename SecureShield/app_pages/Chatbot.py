@@ -1,7 +1,5 @@
 import streamlit as st
 import time
-from SecureShield.Chatbot.bot import MainChatbot  # Import the chatbot class
-import sqlitecloud  
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -9,6 +7,21 @@ load_dotenv()
 def check_auth():
     return 'logged_in' in st.session_state and st.session_state.logged_in
 
+# Function to get the chatbot of this session; the engine is imported on first use
+def get_bot():
+    from SecureShield.Chatbot.bot import MainChatbot  # Import the chatbot class
+    from SecureShield.Chatbot.jobs import enqueue, track_jobs
+
+    bot = st.session_state.get('bot')
+    if bot is None:
+        bot = MainChatbot()
+        st.session_state['bot'] = bot
+        # Connect to the policy documents before the first policy question
+        track_jobs(st.session_state, [enqueue("build_rag_chain", dedupe_key="build_rag_chain", local=True)])
+    if getattr(bot, 'conversation_id', None) != st.session_state['conversation_id']:
+        bot.user_login(username=st.session_state['username'], conversation_id=st.session_state['conversation_id'])
+    return bot
+
 # Function to simulate streaming response
 def simulate_streaming(message):
     buffer = ""
@@ -29,8 +42,19 @@ if not check_auth():
 else:
     st.title("Secure Shield Chatbot")
 
-    username = st.session_state['username']
+    if 'messages' not in st.session_state:
+        st.session_state.messages = []
 
+    # Show the progress of this session's background jobs
+    if st.session_state.get('jobs'):
+        from SecureShield.Chatbot.jobs import track_jobs
+        for job_id, job in list(track_jobs(st.session_state).items()):
+            if job['status'] in ('queued', 'running'):
+                st.sidebar.progress(job['progress'], text=job['message'] or job['kind'].replace('_', ' '))
+            else:
+                del st.session_state['jobs'][job_id]
+                if job['status'] == 'failed':
+                    st.sidebar.warning(f"Background job '{job['kind']}' failed: {job['error']}")
 
     # Display chat messages from history on app rerun
     for message in st.session_state.messages:
@@ -45,14 +69,14 @@ else:
         with st.chat_message("user", avatar="👤"):
             st.markdown(user_input)
 
-        # Initialize the chatbot instance
-        bot = MainChatbot()
-        bot.user_login(username=username)
-
         with st.spinner('Thinking...'):
             try:
-                # Process user input using the bot
-                response = bot.process_user_input({"user_input": user_input})
+                # Get the chatbot instance of this session
+                bot = get_bot()
+                # Process user input using the bot, profiling it if the request asks for it
+                from SecureShield.Chatbot.profiling import PROFILE_HEADER
+                profile = True if st.context.headers.get(PROFILE_HEADER) == "1" else None
+                response = bot.process_user_input({"user_input": user_input}, profile=profile)
                 with st.chat_message("assistant", avatar="🤖"):
                     st.markdown(response, unsafe_allow_html=True)
                 # Add assistant response to chat history
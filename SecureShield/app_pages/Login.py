@@ -1,27 +1,14 @@
-import sqlite3
 import streamlit as st
 import time
+from SecureShield.Chatbot.auth import AuthenticationError, authenticate, get_auth_service
 
-# Database setup
-conn = sqlite3.connect("secure_shield.db")  # Path to your SQLite database
-cursor = conn.cursor()
+auth = get_auth_service()
 
-# Helper Functions
-def check_if_email_exists(email):
-    cursor = conn.cursor()
-    cursor.execute("SELECT email FROM Employees WHERE email = ?", (email,))
-    return cursor.fetchone() is not None
-
-def verify_user(email, password):
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM Employees WHERE email = ? AND password = ?", (email, password))
-    return cursor.fetchone()
-
-def get_username_by_email(email):
-    cursor = conn.cursor()
-    cursor.execute("SELECT first_name FROM Employees WHERE email = ?", (email,))
-    result = cursor.fetchone()
-    return result[0] if result else None
+# Reruns with a valid session token never touch the database
+session = auth.validate(st.session_state.get('session_token'))
+if session:
+    st.session_state['logged_in'] = True
+    st.switch_page("app_pages/Chatbot.py")
 
 # Login Form
 st.title("Login")
@@ -35,24 +22,21 @@ with st.form("login_form"):
         if not email or not password:
             st.error("Please fill all fields")
             st.session_state.logged_in = False
-        elif not check_if_email_exists(email):
-            st.error("Email not registered")
-            st.session_state.logged_in = False
         else:
-            # Verify user with email and password
-            user = verify_user(email, password)
-            if user:
-                # Fetch and store the username in session state
-                username = get_username_by_email(email)
-                st.session_state['username'] = username
-                st.session_state['user_email'] = email
+            try:
+                # Verify user with email and password and open a new conversation
+                session = authenticate(email, password)
+            except AuthenticationError as e:
+                st.error(str(e))
+                st.session_state.logged_in = False
+            else:
+                # Store the session in session state
+                st.session_state['session_token'] = session.token
+                st.session_state['username'] = session.first_name
+                st.session_state['user_email'] = session.email
+                st.session_state['conversation_id'] = session.conversation_id
                 st.session_state['logged_in'] = True
-                
-                st.success(f"Welcome, {username}!")
-                update_user_conversation_id(username)
+
+                st.success(f"Welcome, {session.first_name}!")
                 time.sleep(1)
                 st.switch_page("app_pages/Chatbot.py")
-            else:
-                st.error("Incorrect password")
-                st.session_state.logged_in = False
-
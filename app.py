@@ -49,8 +49,26 @@ with st.sidebar:
         # Hide pages that are not relevant for logged-in users (Login and Register)
         if st.button("Log Out"):
             # Update session state on logout
+            from SecureShield.Chatbot.auth import get_auth_service
+            get_auth_service().logout(st.session_state.get('session_token'))
+            # Save the conversation without holding up the logout
+            if st.session_state.get('bot') is not None and getattr(st.session_state['bot'], 'conversation_id', None):
+                st.session_state['bot'].save_memory_in_background()
             st.session_state['logged_in'] = False
             st.session_state['username'] = None
+            st.session_state['session_token'] = None
             st.sidebar.empty()  # Clear the logout button from the sidebar
     else:
         st.sidebar.empty()
+
+# Warm up the chatbot engine in the background now that the page is served
+from SecureShield.Chatbot.startup import warm_up_in_background
+warm_up_in_background()
+
+# Run slow non-interactive work (history saves, chain builds, exports) on background workers
+from SecureShield.Chatbot.jobs import start_job_workers
+start_job_workers()
+
+# Export conversation transcripts periodically if SECURESHIELD_EXPORT_DIR is set
+from SecureShield.Chatbot.transcripts import start_export_scheduler
+start_export_scheduler()
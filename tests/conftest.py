@@ -0,0 +1,71 @@
+# Import necessary modules and classes
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+SECURESHIELD_DIR = os.path.join(REPO_DIR, "SecureShield")
+CHATBOT_DIR = os.path.join(SECURESHIELD_DIR, "Chatbot")
+
+# The same import roots as the benchmark: the repository for the Streamlit pages,
+# SecureShield for `Chatbot.*` and the Chatbot folder for its top-level modules
+sys.path[:0] = [REPO_DIR, SECURESHIELD_DIR, CHATBOT_DIR]
+
+# The metrics endpoint is not needed and would clash between parallel test runs
+os.environ.setdefault("SECURESHIELD_METRICS_PORT", "0")
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Path of an empty, migrated SecureShield database."""
+    from database import connect, create_schema, migrate
+
+    path = str(tmp_path / "secure_shield.db")
+    con = connect(path)
+    create_schema(con)
+    migrate(con)
+    con.close()
+    monkeypatch.setenv("SECURESHIELD_DB_PATH", path)
+    return path
+
+
+@pytest.fixture
+def seeded_db(tmp_path, monkeypatch):
+    """Path of a small synthetic SecureShield database (see benchmark/seed.py)."""
+    from benchmark.seed import create_synthetic_database
+
+    path = create_synthetic_database(str(tmp_path / "secure_shield.db"), clients=20, policies=40, claims=100)
+    monkeypatch.setenv("SECURESHIELD_DB_PATH", path)
+    return path
+
+
+@pytest.fixture
+def fake_models():
+    """Serve every registry stage with the offline fake chat model of the benchmark."""
+    import model_registry
+    import transport
+    from benchmark.fakes import build_fake_registry
+
+    previous = model_registry._registry
+    model_registry.set_registry(build_fake_registry(latency=0.0, tokens_per_second=1e9))
+    yield model_registry.get_registry()
+    model_registry.set_registry(previous)
+    # Failures injected by a test must not open the circuits of the next one
+    transport._breakers.clear()
+
+
+@pytest.fixture
+def bot(seeded_db, fake_models):
+    """A logged-in MainChatbot with the offline router encoder and policy retriever."""
+    from benchmark.fakes import FakeEncoder, build_fake_retriever
+    from Chatbot.bot import MainChatbot
+    from router.loader import load_intention_classifier
+
+    bot = MainChatbot(
+        intention_classifier=load_intention_classifier(encoder=FakeEncoder()),
+        rag_retriever=build_fake_retriever(),
+    )
+    bot.user_login(username="ana", conversation_id="1")
+    return bot
@@ -0,0 +1,32 @@
+# Import necessary modules and classes
+from analytics import ClaimsAnalyticsQuery, summarize_claims, summarize_claims_adhoc
+from database import connect, create_schema
+
+
+def by_policy_type(con):
+    query = ClaimsAnalyticsQuery(metric="amount_claimed", group_by=["policy_type"])
+    return summarize_claims(con, query).rows, summarize_claims_adhoc(con, query).rows
+
+
+def test_claim_stats_follow_policy_and_claim_changes(seeded_db):
+    con = connect(seeded_db)
+    con.execute("UPDATE Claims SET status = 'Rejected' WHERE claim_id <= 10")
+    con.execute("UPDATE Policies SET policy_type = 'Car' WHERE policy_id = 2")
+    con.execute("DELETE FROM Policies WHERE policy_id = 1")
+    con.commit()
+
+    summary, adhoc = by_policy_type(con)
+    assert [row[0] for row in summary] == [row[0] if isinstance(row[0], str) else "Unknown" for row in adhoc]
+    assert [row[1] for row in summary] == [row[1] for row in adhoc]
+    assert "Unknown" in [row[0] for row in summary]
+    con.close()
+
+
+def test_reading_an_unmigrated_database_writes_nothing(tmp_path):
+    con = connect(str(tmp_path / "secure_shield.db"))
+    create_schema(con)
+
+    page = summarize_claims(con, ClaimsAnalyticsQuery(metric="count"))
+    assert page.rows == [(0,)]
+    assert con.execute("SELECT name FROM sqlite_master WHERE name = 'ClaimStats'").fetchone() is None
+    con.close()
@@ -0,0 +1,53 @@
+# Import necessary modules and classes
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from conftest import REPO_DIR
+
+# Runs from the repository root with nothing else on sys.path, like the Streamlit pages
+LOGIN_SCRIPT = """
+import json
+from SecureShield.Chatbot.auth import AuthenticationError, authenticate
+
+first = authenticate("ana@secureshield.com", "hunter2")
+second = authenticate("ana@secureshield.com", "hunter2")
+try:
+    authenticate("ana@secureshield.com", "")
+    rejected = False
+except AuthenticationError:
+    rejected = True
+print(json.dumps([first.first_name, first.conversation_id, second.conversation_id, rejected]))
+"""
+
+
+def test_authenticate_from_repository_root(db_path):
+    con = sqlite3.connect(db_path)
+    con.execute(
+        "INSERT INTO Employees (first_name, last_name, email, role, password) VALUES (?, ?, ?, ?, ?)",
+        ("Ana", "Silva", "ana@secureshield.com", "Manager", "hunter2"),
+    )
+    con.commit()
+    con.close()
+
+    env = {**os.environ, "SECURESHIELD_DB_PATH": db_path, "SECURESHIELD_SCRYPT_N": "16"}
+    env.pop("PYTHONSAFEPATH", None)
+    result = subprocess.run(
+        [sys.executable, "-c", LOGIN_SCRIPT], cwd=REPO_DIR, env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout) == ["Ana", "1", "2", True]
+
+    # The plaintext password was replaced by a hash that the old plaintext query cannot match
+    con = sqlite3.connect(db_path)
+    password, password_hash = con.execute(
+        "SELECT password, password_hash FROM Employees WHERE email = 'ana@secureshield.com'"
+    ).fetchone()
+    assert password_hash.startswith("scrypt$")
+    for guess in ("", "hunter2"):
+        assert con.execute(
+            "SELECT * FROM Employees WHERE email = ? AND password = ?", ("ana@secureshield.com", guess)
+        ).fetchone() is None
+    con.close()
@@ -0,0 +1,77 @@
+# Import necessary modules and classes
+import json
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from batch import BatchProcessor
+
+REQUESTS = [
+    {"id": "u1", "text": "Set claim 5 to approved"},
+    {"id": "q1", "text": "What is the status of claim 7?"},
+]
+
+
+class CrashingChain:
+    def batch(self, *args, **kwargs):
+        raise RuntimeError("crash")
+
+
+def count_updates(processor, monkeypatch):
+    chain = processor.sql_chains["Update_Claim_Status"]
+    applied = []
+    apply_update = chain.apply_update
+
+    def counting_apply_update(query, con):
+        applied.append(query)
+        return apply_update(query, con)
+
+    monkeypatch.setattr(chain, "apply_update", counting_apply_update)
+    return applied
+
+
+def test_resumed_batch_does_not_apply_committed_updates_again(bot, tmp_path, monkeypatch):
+    checkpoint = str(tmp_path / "checkpoint.jsonl")
+    processor = BatchProcessor(bot)
+    applied = count_updates(processor, monkeypatch)
+    # The run dies after the update committed but before it was answered
+    monkeypatch.setattr(processor.sql_chains["Update_Claim_Status"], "chain", CrashingChain())
+    with pytest.raises(RuntimeError):
+        list(processor.run(REQUESTS, checkpoint_path=checkpoint))
+    assert len(applied) == 1
+
+    resumed = BatchProcessor(bot)
+    applied_again = count_updates(resumed, monkeypatch)
+    results = {result.request_id: result for result in resumed.run(REQUESTS, checkpoint_path=checkpoint)}
+    assert applied_again == []
+    assert set(results) == {"u1", "q1"}
+    assert results["u1"].intent == "Update_Claim_Status" and results["u1"].error is None
+
+    # Everything is in the checkpoint now, so a third run has nothing to do
+    assert list(BatchProcessor(bot).run(REQUESTS, checkpoint_path=checkpoint)) == []
+    with open(checkpoint) as file:
+        entries = [json.loads(line) for line in file]
+    assert [entry["request_id"] for entry in entries if "status" in entry] == ["u1"]
+
+
+def test_failing_update_does_not_abort_the_batch(bot, seeded_db, monkeypatch):
+    import sqlite3
+
+    processor = BatchProcessor(bot)
+    chain = processor.sql_chains["Update_Claim_Status"]
+    apply_update = chain.apply_update
+
+    def apply_update_rejecting_claim_5(query, con):
+        if 5 in query.claim_ids:
+            raise sqlite3.IntegrityError("CHECK constraint failed: status")
+        return apply_update(query, con)
+
+    monkeypatch.setattr(chain, "apply_update", apply_update_rejecting_claim_5)
+    requests = [{"id": "u1", "text": "Set claim 5 to approved"}, {"id": "u2", "text": "Set claim 6 to denied"}]
+    results = {result.request_id: result for result in processor.run(requests)}
+
+    assert set(results) == {"u1", "u2"}
+    con = sqlite3.connect(seeded_db)
+    assert con.execute("SELECT status FROM Claims WHERE claim_id = 6").fetchone() == ("denied",)
+    con.close()
@@ -0,0 +1,147 @@
+# Import necessary modules and classes
+import sqlite3
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from claim_updates import ClaimIdRange, ClaimSelection, parse_confirmation, update_claim_statuses
+
+
+def _statuses(path, claim_ids):
+    con = sqlite3.connect(path)
+    rows = con.execute(
+        f"SELECT claim_id, status FROM Claims WHERE claim_id IN ({','.join('?' * len(claim_ids))})", claim_ids
+    ).fetchall()
+    con.close()
+    return dict(rows)
+
+
+def _chain_config(user_id="ana", conversation_id="1"):
+    return {"configurable": {"user_id": user_id, "conversation_id": conversation_id}}
+
+
+def test_single_claim_is_updated_directly(seeded_db):
+    con = sqlite3.connect(seeded_db)
+    result = update_claim_statuses(con, ClaimSelection(claim_ids=[5]), "approved")
+    con.close()
+    assert result.applied and not result.needs_confirmation
+    assert _statuses(seeded_db, [5]) == {5: "approved"}
+
+
+def test_bulk_update_needs_the_previewed_count(seeded_db):
+    before = _statuses(seeded_db, [1, 2, 3])
+    selection = ClaimSelection(ranges=[ClaimIdRange(start=1, end=3)])
+    con = sqlite3.connect(seeded_db)
+
+    preview = update_claim_statuses(con, selection, "denied")
+    assert not preview.applied and preview.needs_confirmation and preview.matched == 3
+    assert _statuses(seeded_db, [1, 2, 3]) == before
+
+    # A confirmation of another preview does not write
+    stale = update_claim_statuses(con, selection, "denied", confirmed_matched=2)
+    assert not stale.applied and stale.needs_confirmation
+
+    applied = update_claim_statuses(con, selection, "denied", confirmed_matched=3)
+    con.close()
+    assert applied.applied
+    assert _statuses(seeded_db, [1, 2, 3]) == {1: "denied", 2: "denied", 3: "denied"}
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("confirm", True),
+        ("Yes, confirm please.", True),
+        ("go ahead", True),
+        ("cancel", False),
+        ("no", False),
+        ("yes", None),
+        ("confirm claim 12 is approved", None),
+        ("What is the status of claim 3?", None),
+    ],
+)
+def test_parse_confirmation(text, expected):
+    assert parse_confirmation(text) == expected
+
+
+def test_chain_previews_then_applies_on_confirmation(seeded_db, fake_models):
+    from Chains.Update_Claim_Status import CONFIRMATION_REQUEST, UpdateClaimStatusChain
+
+    before = _statuses(seeded_db, [10, 11, 12])
+    chain = UpdateClaimStatusChain()
+    config = _chain_config()
+
+    response = chain.invoke({"user_input": "Set claims 10-12 to pending", "chat_history": []}, config)
+    assert response.endswith(CONFIRMATION_REQUEST)
+    assert _statuses(seeded_db, [10, 11, 12]) == before
+
+    # The confirmation only applies to the session that saw the preview
+    chain.invoke({"user_input": "confirm", "chat_history": []}, _chain_config(conversation_id="2"))
+    assert _statuses(seeded_db, [10, 11, 12]) == before
+
+    chain.invoke({"user_input": "confirm", "chat_history": []}, config)
+    assert _statuses(seeded_db, [10, 11, 12]) == {10: "pending", 11: "pending", 12: "pending"}
+
+
+def test_chain_cancellation_discards_the_preview(seeded_db, fake_models):
+    from Chains.Update_Claim_Status import UpdateClaimStatusChain
+
+    before = _statuses(seeded_db, [20, 21])
+    chain = UpdateClaimStatusChain()
+    config = _chain_config(conversation_id="3")
+    chain.invoke({"user_input": "Set claims 20 and 21 to approved", "chat_history": []}, config)
+    chain.invoke({"user_input": "cancel", "chat_history": []}, config)
+    chain.invoke({"user_input": "confirm", "chat_history": []}, config)
+    assert _statuses(seeded_db, [20, 21]) == before
+
+
+def test_chain_dry_run_asks_for_no_confirmation(seeded_db, fake_models):
+    from Chains.Update_Claim_Status import CONFIRMATION_REQUEST, UpdateClaimStatusChain
+
+    before = _statuses(seeded_db, [30, 31, 32])
+    chain = UpdateClaimStatusChain()
+    config = _chain_config(conversation_id="4")
+    response = chain.invoke({"user_input": "Preview how many claims 30-32 would be set to denied", "chat_history": []}, config)
+    assert CONFIRMATION_REQUEST not in response
+
+    # Only counted, so a later confirmation has nothing to apply
+    chain.invoke({"user_input": "confirm", "chat_history": []}, config)
+    assert _statuses(seeded_db, [30, 31, 32]) == before
+
+
+def test_chain_refuses_to_write_when_extraction_fails(seeded_db, fake_models):
+    from langchain_core.language_models import FakeListChatModel
+
+    import model_registry
+    from Chains.Update_Claim_Status import REPHRASE_MESSAGE, UpdateClaimStatusChain
+
+    registry = model_registry.get_registry()
+    llm_factory = registry.llm_factory
+    registry.llm_factory = lambda stage, tier, timeout, temperature: (
+        FakeListChatModel(responses=["Sorry, I cannot parse that."])
+        if stage == "update_claim.extract"
+        else llm_factory(stage, tier, timeout, temperature)
+    )
+    before = _statuses(seeded_db, [12])
+    chain = UpdateClaimStatusChain()
+    response = chain.invoke(
+        {"user_input": "Approve claim 12 submitted on 2024-03-05", "chat_history": []}, _chain_config()
+    )
+    assert response == REPHRASE_MESSAGE
+    assert _statuses(seeded_db, [12]) == before
+
+
+def test_bot_routes_the_next_reply_to_the_preview(bot, seeded_db):
+    before = _statuses(seeded_db, [30, 31])
+    bot.handle_request("Update_Claim_Status", {"user_input": "Set claims 30 and 31 to denied"})
+
+    # Any other message discards the preview, so a later "confirm" writes nothing
+    bot.process_user_input({"user_input": "Hello, how are you today?"})
+    bot.process_user_input({"user_input": "confirm"})
+    assert _statuses(seeded_db, [30, 31]) == before
+
+    # Worded differently, so it is not merged with the first preview as a duplicate submission
+    bot.handle_request("Update_Claim_Status", {"user_input": "Please set claims 30 and 31 to denied"})
+    bot.process_user_input({"user_input": "confirm"})
+    assert _statuses(seeded_db, [30, 31]) == {30: "denied", 31: "denied"}
@@ -0,0 +1,85 @@
+# Import necessary modules and classes
+import threading
+from collections import Counter
+
+import pytest
+
+import model_registry
+import result_sets
+from benchmark.fakes import FakeChatModel, FakeEncoder, build_fake_registry, build_fake_retriever
+from router.loader import load_intention_classifier
+
+calls = Counter()
+
+
+class CountingChatModel(FakeChatModel):
+    """FakeChatModel counting the calls of each stage."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        calls[self.stage] += 1
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+@pytest.fixture
+def slow_models(fake_models):
+    # Slow enough for concurrent requests to overlap
+    registry = build_fake_registry(latency=0.3, tokens_per_second=1e9)
+    registry.llm_factory = lambda stage, tier, timeout, temperature: CountingChatModel(
+        stage=stage, latency=0.3, tokens_per_second=1e9
+    )
+    model_registry.set_registry(registry)
+    calls.clear()
+    return registry
+
+
+def make_bot(username):
+    from Chatbot.bot import MainChatbot
+
+    bot = MainChatbot(
+        intention_classifier=load_intention_classifier(encoder=FakeEncoder()),
+        rag_retriever=build_fake_retriever(),
+    )
+    bot.user_login(username=username, conversation_id="1")
+    return bot
+
+
+def test_sessions_share_the_extraction_but_answer_on_their_own(seeded_db, slow_models):
+    bots = [make_bot("ana"), make_bot("rui")]
+    question = "Show me the claims of client 3"
+    start = threading.Barrier(len(bots))
+    responses = {}
+
+    def ask(bot):
+        start.wait()
+        responses[bot.username] = bot.handle_request("Get_Claim_Info", {"user_input": question})
+
+    threads = [threading.Thread(target=ask, args=(bot,)) for bot in bots]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert set(responses) == {"ana", "rui"}
+    # One extraction for both; each session answers with its own history
+    assert calls["claim_info.extract"] == 1
+    assert calls["claim_info.response"] == 2
+    # Each session can page on from its own copy of the results
+    for bot in bots:
+        assert result_sets._last_requests[(bot.username, "1")].query.title == "Claims for client '3'"
+
+
+def test_conversation_dependent_requests_are_not_shared(seeded_db, slow_models):
+    bots = [make_bot("ana"), make_bot("rui")]
+    start = threading.Barrier(len(bots))
+
+    def ask(bot):
+        start.wait()
+        bot.handle_request("Get_Claim_Info", {"user_input": "Show me the next page"})
+
+    threads = [threading.Thread(target=ask, args=(bot,)) for bot in bots]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls["claim_info.extract"] == 2
@@ -0,0 +1,56 @@
+# Import necessary modules and classes
+import pytest
+
+from benchmark.fakes import FakeEncoder
+from decomposition import decompose_request
+
+
+@pytest.fixture
+def encoder_calls(monkeypatch):
+    """Texts of each call to the offline router encoder."""
+    calls = []
+    encode = FakeEncoder.__call__
+
+    def counting_encode(self, docs):
+        calls.append(list(docs))
+        return encode(self, docs)
+
+    monkeypatch.setattr(FakeEncoder, "__call__", counting_encode)
+    return calls
+
+
+def test_compound_message_is_encoded_once(bot, encoder_calls):
+    text = "Update claim 4 to approved and show me policy 12"
+
+    sub_requests = decompose_request(text, bot.get_user_intents)
+
+    assert [(sub.text, sub.write) for sub in sub_requests] == [
+        ("Update claim 4 to approved", True),
+        ("show me policy 12", False),
+    ]
+    assert encoder_calls == [[text, "Update claim 4 to approved", "show me policy 12"]]
+
+
+def test_simple_message_is_encoded_once(bot, encoder_calls):
+    text = "What is the status of claim 7?"
+
+    sub_requests = decompose_request(text, bot.get_user_intents)
+
+    assert [(sub.text, sub.intent) for sub in sub_requests] == [(text, "Get_Claim_Info")]
+    assert encoder_calls == [[text]]
+
+
+def test_parts_of_one_request_take_the_intent_of_the_whole_message():
+    intents = {"Approve claims 4 and 5": "Update_Claim_Status", "Approve claims 4": "Update_Claim_Status"}
+    calls = []
+
+    def classify(texts):
+        calls.append(texts)
+        return [intents.get(text) for text in texts]
+
+    sub_requests = decompose_request("Approve claims 4 and 5", classify)
+
+    assert [(sub.text, sub.intent, sub.write) for sub in sub_requests] == [
+        ("Approve claims 4 and 5", "Update_Claim_Status", True)
+    ]
+    assert len(calls) == 1
@@ -0,0 +1,69 @@
+# Import necessary modules and classes
+import pytest
+
+pytest.importorskip("langchain")
+
+from Chains.Get_Claim_Info import extract_claim_query_deterministic
+from Chains.Get_Policy_Info import extract_policy_query_deterministic
+from Chains.Update_Claim_Status import extract_claim_update_deterministic
+
+
+def _update(text):
+    return extract_claim_update_deterministic({"user_input": text})
+
+
+def test_update_ignores_dates():
+    update = _update("Approve claim 12 submitted on 2024-03-05")
+    assert update.claim_ids == [12]
+    assert update.ranges == []
+    assert update.status == "approved"
+
+
+def test_update_ignores_other_entities():
+    update = _update("Deny claim 4 for client 12")
+    assert update.claim_ids == [4]
+    assert update.ranges == []
+    assert update.status == "denied"
+
+
+def test_update_lists_and_ranges():
+    update = _update("Set claims 3, 5 and 101-180 to denied")
+    assert update.claim_ids == [3, 5]
+    assert [(claim_range.start, claim_range.end) for claim_range in update.ranges] == [(101, 180)]
+
+    update = _update("Please mark claims 7 to 9 as pending")
+    assert update.claim_ids == []
+    assert [(claim_range.start, claim_range.end) for claim_range in update.ranges] == [(7, 9)]
+    assert update.status == "pending"
+
+
+def test_update_filters():
+    update = _update("Reject all pending claims on policy 7")
+    assert update.claim_ids == [] and update.ranges == []
+    assert update.policy_id == 7
+    assert update.current_status == "pending"
+    assert update.status == "denied"
+
+
+def test_update_without_claims_is_rejected():
+    with pytest.raises(ValueError):
+        _update("Approve everything from 2024-03-05 for client 12")
+
+
+def test_claim_query_prefers_the_named_identifier():
+    query = extract_claim_query_deterministic({"user_input": "Show the claims of client 7 submitted on 2024-03-05"})
+    assert (query.query_type, query.value) == ("claims_by_client", "7")
+
+    query = extract_claim_query_deterministic({"user_input": "Claims filed on 05/03/2024 for policy #31"})
+    assert (query.query_type, query.value) == ("claims_by_policy", "31")
+
+    query = extract_claim_query_deterministic({"user_input": "What is the status of claim 12 for client 4?"})
+    assert (query.query_type, query.value) == ("claims_by_client", "4")
+
+
+def test_policy_query_prefers_the_named_identifier():
+    query = extract_policy_query_deterministic({"user_input": "Which policies started on 2023-01-01 for client 9?"})
+    assert (query.query_type, query.value) == ("policies_by_client", "9")
+
+    query = extract_policy_query_deterministic({"user_input": "Details of policy 15 renewed 2024-06-30"})
+    assert (query.query_type, query.value) == ("policy_details", "15")
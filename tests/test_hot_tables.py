@@ -0,0 +1,59 @@
+# Import necessary modules and classes
+from database import connect, create_schema
+from hot_tables import HotTables
+
+
+def test_reading_an_unmigrated_database_writes_nothing(tmp_path):
+    path = str(tmp_path / "secure_shield.db")
+    con = connect(path)
+    create_schema(con)
+    con.execute("INSERT INTO Clients (name, age, gender, email, phone) VALUES ('Ana', 30, 'F', 'ana@x', '1')")
+    con.commit()
+
+    hot_tables = HotTables(path)
+    assert hot_tables.resolve_client("Ana") == 1
+    con.execute("INSERT INTO Clients (name, age, gender, email, phone) VALUES ('Rui', 40, 'M', 'rui@x', '2')")
+    con.commit()
+    # Without the change counters every commit reloads, so the new client is visible
+    assert hot_tables.resolve_client("Rui") == 2
+    assert con.execute("SELECT name FROM sqlite_master WHERE name = 'TableVersions'").fetchone() is None
+    hot_tables.close()
+    con.close()
+
+
+def test_claim_updates_do_not_reload_a_migrated_database(seeded_db):
+    hot_tables = HotTables(seeded_db)
+    hot_tables.lookup("policy", 1)
+    con = connect(seeded_db)
+    con.execute("UPDATE Claims SET status = 'Pending' WHERE claim_id = 1")
+    con.commit()
+    hot_tables.lookup("policy", 1)
+    assert hot_tables.reloads == 1
+
+    con.execute("UPDATE Policies SET policy_level = 'Gold' WHERE policy_id = 1")
+    con.commit()
+    columns, rows = hot_tables.lookup("policy", 1)
+    assert rows[0][columns.index("policy_level")] == "Gold"
+    assert hot_tables.reloads == 2
+    hot_tables.close()
+    con.close()
+
+
+def test_claims_by_client_resolve_the_client_in_memory(seeded_db, fake_models):
+    from Chains.Get_Claim_Info import ClaimQueryType, GetClaimInfoChain
+
+    chain = GetClaimInfoChain(registry=fake_models)
+    config = {"configurable": {"user_id": "ana", "conversation_id": "1"}}
+    con = connect(seeded_db)
+    name, client_id = con.execute("SELECT name, client_id FROM Clients ORDER BY client_id LIMIT 1").fetchone()
+    statements = []
+    con.set_trace_callback(statements.append)
+
+    by_name = chain.run_query(ClaimQueryType(query_type="claims_by_client", value=name), con, config)
+    by_id = chain.run_query(ClaimQueryType(query_type="claims_by_client", value=str(client_id)), con, config)
+    missing = chain.run_query(ClaimQueryType(query_type="claims_by_client", value="Nobody"), con, config)
+    con.close()
+
+    assert by_name.splitlines()[1:] == by_id.splitlines()[1:]
+    assert missing == "Claims for client 'Nobody': no results."
+    assert not any("Clients" in statement for statement in statements)
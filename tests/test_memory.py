@@ -0,0 +1,64 @@
+# Import necessary modules and classes
+import sys
+import threading
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from memory import InMemoryHistory
+
+THREADS = 8
+EXCHANGES = 1000
+
+
+def test_concurrent_appends_keep_exchanges_and_offsets_intact():
+    # Switch threads as often as possible, so unguarded appends would interleave
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        _run_concurrent_appends()
+    finally:
+        sys.setswitchinterval(previous)
+
+
+def _run_concurrent_appends():
+    history = InMemoryHistory()
+    start = threading.Barrier(THREADS)
+
+    def add_exchanges(worker):
+        start.wait()
+        for index in range(EXCHANGES):
+            history.add_messages([
+                HumanMessage(content=f"question {worker}-{index}"),
+                AIMessage(content=f"answer {worker}-{index}"),
+            ])
+
+    threads = [threading.Thread(target=add_exchanges, args=(worker,)) for worker in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    messages = history.messages
+    assert len(messages) == 2 * THREADS * EXCHANGES
+    # Every answer directly follows its own question
+    for question, answer in zip(messages[::2], messages[1::2]):
+        assert isinstance(question, HumanMessage) and isinstance(answer, AIMessage)
+        assert question.content.replace("question", "answer") == answer.content
+    assert {message.content for message in messages[::2]} == {
+        f"question {worker}-{index}" for worker in range(THREADS) for index in range(EXCHANGES)
+    }
+
+    # Offsets survive a round trip through the shared-cache encoding
+    records = list(InMemoryHistory.from_bytes(history.to_bytes()).iter_records())
+    assert [record[2] for record in records] == [message.content for message in messages]
+
+
+def test_replace_keeps_the_history_object():
+    history = InMemoryHistory()
+    history.add_messages([HumanMessage(content="old")])
+    other = InMemoryHistory()
+    other.add_messages([HumanMessage(content="new"), AIMessage(content="reply")])
+
+    history.replace(other)
+
+    assert [message.content for message in history.messages] == ["new", "reply"]
@@ -0,0 +1,69 @@
+# Import necessary modules and classes
+from typing import Any, List, Optional
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from scheduler import SchedulerOverloaded
+
+
+class FailingChatModel(BaseChatModel):
+    """Chat model whose every call raises `error`."""
+
+    error: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "failing"
+
+    def _generate(self, messages: List, stop: Optional[List[str]] = None, run_manager=None, **kwargs):
+        raise self.error
+
+
+def _serve_classifier_with(registry, model):
+    llm_factory = registry.llm_factory
+    registry.llm_factory = lambda stage, tier, timeout, temperature: (
+        model if stage == "prompt_injection.classify" else llm_factory(stage, tier, timeout, temperature)
+    )
+
+
+@pytest.mark.parametrize(
+    "model",
+    [
+        FailingChatModel(error=SchedulerOverloaded("queue full")),
+        FailingChatModel(error=TimeoutError("budget exceeded")),
+        FakeListChatModel(responses=["I am not sure."]),
+    ],
+    ids=["shed", "timeout", "unparsable"],
+)
+def test_classifier_failure_refuses_the_input(fake_models, model):
+    from Chains.Prompt_Injection_Tolerance import IsPromptInjection, UnverifiedInput
+
+    _serve_classifier_with(fake_models, model)
+    verdict = IsPromptInjection().invoke({"user_input": "What is the status of claim 3?"})
+    assert verdict.is_prompt_injection
+    assert isinstance(verdict, UnverifiedInput)
+
+
+def test_classifier_failure_in_a_batch_refuses_every_input(fake_models):
+    from Chains.Prompt_Injection_Tolerance import IsPromptInjection
+
+    _serve_classifier_with(fake_models, FailingChatModel(error=SchedulerOverloaded("queue full")))
+    verdicts = IsPromptInjection().batch(
+        [{"user_input": "What is the status of claim 3?"}, {"user_input": "Hello"}], return_exceptions=True
+    )
+    assert all(verdict.is_prompt_injection for verdict in verdicts)
+
+
+def test_bot_does_not_handle_unchecked_input(bot, fake_models):
+    from Chatbot.bot import UNVERIFIED_INPUT_RESPONSE
+
+    _serve_classifier_with(fake_models, FailingChatModel(error=SchedulerOverloaded("queue full")))
+    handled = []
+    bot.handle_request = lambda intent, user_input: handled.append(intent)
+    assert bot.process_user_input({"user_input": "Set claim 3 to approved"}) == UNVERIFIED_INPUT_RESPONSE
+    assert handled == []
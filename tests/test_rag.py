@@ -0,0 +1,60 @@
+# Import necessary modules and classes
+import os
+
+from langchain_core.documents import Document
+
+from benchmark.fakes import FakeEmbeddings, FakeVectorStore
+from ingestion import POLICIES_DIR, ingest_policies, stored_chunk_ids
+from rag import RagChain
+
+# Chunks as loaded before ingestion.py tagged them with their product and tier
+UNTAGGED_CHUNKS = [
+    "AutoGuard Gold adds roadside assistance and a replacement vehicle.",
+    "HomeProtect covers fire, flooding and burglary damage.",
+]
+
+
+def untagged_store():
+    vector_store = FakeVectorStore(embedding=FakeEmbeddings())
+    vector_store.add_documents([Document(page_content=text) for text in UNTAGGED_CHUNKS], ids=["old-1", "old-2"])
+    return vector_store
+
+
+def test_old_index_is_searched_without_the_filter(fake_models):
+    chain = RagChain(username=None, retriever=untagged_store().as_retriever(search_kwargs={"k": 1}))
+
+    documents = chain.retrieve("What does the AutoGuard Gold plan add?")
+
+    assert [document.page_content for document in documents] == [UNTAGGED_CHUNKS[0]]
+
+
+def test_tagged_index_is_filtered(fake_models):
+    vector_store = untagged_store()
+    ingest_policies(vector_store=vector_store)
+    chain = RagChain(username=None, retriever=vector_store.as_retriever(search_kwargs={"k": 4}))
+
+    documents = chain.retrieve("What does the HomeProtect Gold plan cover for fire?")
+
+    assert documents
+    assert {document.metadata["product"] for document in documents} == {"HomeProtect"}
+    assert {document.metadata["tier"] for document in documents} <= {"Gold", "all"}
+
+
+def test_reingestion_deletes_untagged_and_stale_chunks():
+    vector_store = untagged_store()
+    vector_store.add_documents([Document(page_content="Removed section", metadata={"product": "AutoGuard"})], ids=["gone"])
+
+    counts = ingest_policies(vector_store=vector_store)
+
+    assert counts["deleted"] == 3
+    ids = stored_chunk_ids(vector_store)
+    assert len(ids) == sum(count for product, count in counts.items() if product != "deleted")
+    assert all("product" in vector_store.store[chunk]["metadata"] for chunk in ids)
+
+
+def test_partial_ingestion_keeps_other_chunks():
+    vector_store = untagged_store()
+    counts = ingest_policies([os.path.join(POLICIES_DIR, "AutoGuard.pdf")], vector_store=vector_store)
+
+    assert "deleted" not in counts
+    assert {"old-1", "old-2"} <= set(stored_chunk_ids(vector_store))
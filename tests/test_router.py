@@ -0,0 +1,57 @@
+# Import necessary modules and classes
+import json
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("semantic_router")
+
+from router.live import record_correction
+
+
+def test_concurrent_corrections_are_all_kept(tmp_path):
+    path = str(tmp_path / "corrections.json")
+    errors = []
+
+    def learn(worker):
+        try:
+            for number in range(25):
+                record_correction(f"message {worker}-{number}", "Chitchat", path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=learn, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with open(path) as file:
+        corrections = json.load(file)
+    assert errors == []
+    assert len(corrections) == 200
+    assert sorted(item["Id"] for item in corrections) == list(range(1, 201))
+
+
+def test_route_sources_keep_the_order_of_the_layer():
+    from router.build import LAYER_PATH, load_route_sources
+
+    with open(LAYER_PATH) as file:
+        layer = json.load(file)
+    assert [route["name"] for route in load_route_sources()] == [route["name"] for route in layer["routes"]]
+
+
+def test_loading_a_layer_writes_its_sidecar(tmp_path):
+    from benchmark.fakes import FakeEncoder
+    from router.build import build_layer
+    from router.loader import build_route_layer
+
+    layer_path, sidecar_path = str(tmp_path / "layer.json"), str(tmp_path / "layer.embeddings.npz")
+    build_layer(
+        encoder=FakeEncoder(), encoder_name=FakeEncoder().name,
+        layer_path=layer_path, sidecar_path=sidecar_path, cache_path=str(tmp_path / "embedding_cache.db"),
+    )
+    os.remove(sidecar_path)
+    build_route_layer(layer_path, encoder=FakeEncoder())
+    assert os.path.exists(sidecar_path)
@@ -0,0 +1,151 @@
+# Import necessary modules and classes
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import memory
+from memory import MemoryManager
+from shared_cache import SharedCache
+
+SESSION = ("ana", "1")
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "shared_cache.db")
+
+
+def worker(cache_path):
+    """A MemoryManager as in one app process, with its own cache connections."""
+    return MemoryManager(shared_cache=SharedCache(cache_path))
+
+
+def exchange(manager, text):
+    manager.get_session_history(*SESSION).add_messages([HumanMessage(content=text), AIMessage(content=f"re: {text}")])
+
+
+def contents(manager):
+    return [message.content for message in manager.get_session_history(*SESSION).messages]
+
+
+def test_conflicting_publishes_keep_both_exchanges(cache_path):
+    first, second = worker(cache_path), worker(cache_path)
+    exchange(first, "hello")
+    first.publish_session_history(*SESSION)
+    assert second.sync_session_history(*SESSION)
+
+    # Both answer a request based on version 1
+    exchange(first, "from first")
+    exchange(second, "from second")
+    first.publish_session_history(*SESSION)
+    second.publish_session_history(*SESSION)
+
+    expected = ["hello", "re: hello", "from first", "re: from first", "from second", "re: from second"]
+    assert contents(second) == expected
+    assert second.versions[SESSION] == 3
+
+    third = worker(cache_path)
+    assert contents(third) == expected
+    assert first.sync_session_history(*SESSION)
+    assert contents(first) == expected
+
+
+def test_publish_writes_only_new_messages(cache_path):
+    manager = worker(cache_path)
+    exchange(manager, "a" * 4000)
+    manager.publish_session_history(*SESSION)
+    exchange(manager, "short")
+    manager.publish_session_history(*SESSION)
+
+    segment = manager.shared_cache.get("history:ana:1:2")
+    assert memory.InMemoryHistory.from_bytes(segment).messages[0].content == "short"
+    assert len(segment) < 200
+
+    # A worker that has version 1 reads only the second segment
+    reader = worker(cache_path)
+    reader.store[SESSION] = memory.InMemoryHistory.from_bytes(manager.shared_cache.get("history:ana:1:1"))
+    reader.versions[SESSION], reader.shared_counts[SESSION] = 1, 2
+    manager.shared_cache.delete("history:ana:1:1")
+    assert reader.sync_session_history(*SESSION)
+    assert contents(reader) == contents(manager)
+
+
+def test_history_is_compacted(cache_path, monkeypatch):
+    monkeypatch.setattr(memory, "MAX_HISTORY_SEGMENTS", 3)
+    manager = worker(cache_path)
+    for index in range(5):
+        exchange(manager, f"message {index}")
+        manager.publish_session_history(*SESSION)
+
+    head = manager.shared_cache.get("history:ana:1")
+    assert head == {"version": 5, "base": 4, "count": 10}
+    assert [manager.shared_cache.get(f"history:ana:1:{version}") for version in (1, 2, 3)] == [None] * 3
+    assert contents(worker(cache_path)) == contents(manager)
+
+
+def test_concurrent_workers_lose_no_updates(cache_path):
+    workers = [worker(cache_path) for _ in range(4)]
+    start = threading.Barrier(len(workers))
+
+    def serve(index, manager):
+        start.wait()
+        for turn in range(10):
+            manager.sync_session_history(*SESSION)
+            exchange(manager, f"worker {index} turn {turn}")
+            manager.publish_session_history(*SESSION)
+
+    threads = [threading.Thread(target=serve, args=item) for item in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    shared = contents(worker(cache_path))
+    assert sorted(shared[::2]) == sorted(f"worker {i} turn {t}" for i in range(4) for t in range(10))
+
+
+def test_compaction_during_a_conflict_does_not_duplicate_messages(cache_path, monkeypatch):
+    first, second = worker(cache_path), worker(cache_path)
+    exchange(first, "hello")
+    first.publish_session_history(*SESSION)
+    assert second.sync_session_history(*SESSION)
+    exchange(first, "from first")
+    first.publish_session_history(*SESSION)
+    exchange(second, "from second")
+
+    # The first worker compacts the history while the second one reads it after its conflict
+    load_shared = second._load_shared
+    compacted = []
+
+    def load_during_compaction(key, head):
+        if not compacted:
+            monkeypatch.setattr(memory, "MAX_HISTORY_SEGMENTS", 1)
+            exchange(first, "compacted")
+            first.publish_session_history(*SESSION)
+            compacted.append(True)
+        return load_shared(key, head)
+
+    monkeypatch.setattr(second, "_load_shared", load_during_compaction)
+    second.publish_session_history(*SESSION)
+
+    expected = ["hello", "from first", "compacted", "from second"]
+    assert contents(worker(cache_path))[::2] == expected
+    assert contents(second)[::2] == expected
+
+
+def test_sync_keeps_unpublished_messages(cache_path):
+    first, second = worker(cache_path), worker(cache_path)
+    exchange(first, "hello")
+    first.publish_session_history(*SESSION)
+    assert second.sync_session_history(*SESSION)
+
+    exchange(first, "from first")
+    first.publish_session_history(*SESSION)
+    # Not published yet when the newer shared copy is synced
+    exchange(second, "from second")
+    assert second.sync_session_history(*SESSION)
+    assert contents(second)[::2] == ["hello", "from first", "from second"]
+
+    second.publish_session_history(*SESSION)
+    assert contents(worker(cache_path))[::2] == ["hello", "from first", "from second"]
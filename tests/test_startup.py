@@ -0,0 +1,39 @@
+# Import necessary modules and classes
+import startup
+import tracing
+from benchmark.fakes import FakeEncoder
+
+
+def test_warm_up_marks_the_engine_ready(seeded_db, monkeypatch):
+    from router import loader
+
+    load_intention_classifier = loader.load_intention_classifier
+    monkeypatch.setattr(loader, "load_intention_classifier", lambda: load_intention_classifier(encoder=FakeEncoder()))
+    monkeypatch.setattr(startup, "_warmup_report", {})
+    tracing.set_ready(False)
+
+    assert startup.warm_up(), startup.warm_up_report()
+    assert tracing.is_ready()
+    assert all("error" not in step for name, step in startup.warm_up_report().items() if name != "connections")
+
+
+def test_warm_up_leaves_the_registry_and_claims_untouched(seeded_db, monkeypatch):
+    import model_registry
+    from database import connect
+    from router import loader
+
+    load_intention_classifier = loader.load_intention_classifier
+    monkeypatch.setattr(loader, "load_intention_classifier", lambda: load_intention_classifier(encoder=FakeEncoder()))
+    monkeypatch.setattr(model_registry, "_registry", None)
+
+    def claims():
+        con = connect(seeded_db)
+        try:
+            return con.execute("SELECT claim_id, status FROM Claims ORDER BY claim_id").fetchall()
+        finally:
+            con.close()
+
+    before = claims()
+    startup.warm_up()
+    assert model_registry._registry is None
+    assert claims() == before
@@ -0,0 +1,50 @@
+# Import necessary modules and classes
+import socket
+
+import pytest
+
+import tracing
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def metrics_server(monkeypatch):
+    """Start the metrics endpoint of this process on a fresh server."""
+    monkeypatch.setattr(tracing, "_server", None)
+    servers = []
+
+    def start(**kwargs):
+        server = tracing.start_metrics_server(**kwargs)
+        servers.append(server)
+        monkeypatch.setattr(tracing, "_server", None)
+        return server
+
+    yield start
+    for server in servers:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+def test_metrics_endpoint_is_local_by_default(metrics_server):
+    server = metrics_server(port=free_port())
+    assert server.server_address[0] == "127.0.0.1"
+
+
+def test_each_worker_gets_its_own_port(metrics_server):
+    from urllib.request import urlopen
+
+    port = free_port()
+    # Two workers of one host: the second must not give up on the taken port
+    first = metrics_server(port=port, ports=4)
+    second = metrics_server(port=port, ports=4)
+
+    assert first.server_address[1] == port
+    assert second is not None and second.server_address[1] != port
+    with urlopen(f"http://127.0.0.1:{second.server_address[1]}/metrics") as response:
+        assert response.status == 200
@@ -0,0 +1,101 @@
+# Import necessary modules and classes
+import glob
+import json
+import os
+import threading
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from memory import MemoryManager
+from shared_cache import SharedCache
+import transcripts
+from transcripts import export_transcripts, load_checkpoint
+
+
+def read_rows(out_dir):
+    rows = []
+    for path in glob.glob(os.path.join(out_dir, "date=*", "*.jsonl")):
+        with open(path) as file:
+            rows.extend(json.loads(line) for line in file)
+    return rows
+
+
+def test_workers_export_each_message_once(tmp_path, monkeypatch):
+    # Widen the window between reading the checkpoint and saving it
+    load = transcripts.load_checkpoint
+
+    def slow_load(out_dir):
+        checkpoint = load(out_dir)
+        time.sleep(0.05)
+        return checkpoint
+
+    monkeypatch.setattr(transcripts, "load_checkpoint", slow_load)
+    cache_path, out_dir = str(tmp_path / "cache.db"), str(tmp_path / "export")
+    workers = [MemoryManager(shared_cache=SharedCache(cache_path)) for _ in range(4)]
+
+    # Sessions served by different workers, each published to the shared cache
+    for number in range(8):
+        session = ("ana", str(number))
+        owner = workers[number % len(workers)]
+        owner.get_session_history(*session).add_messages(
+            [HumanMessage(content=f"question {number}"), AIMessage(content=f"answer {number}")]
+        )
+        owner.publish_session_history(*session)
+    # Every worker has loaded every session, e.g. as users moved between them
+    for worker in workers:
+        for number in range(8):
+            worker.get_session_history("ana", str(number))
+
+    start = threading.Barrier(len(workers))
+
+    def export(worker):
+        start.wait()
+        export_transcripts(out_dir, managers=[worker])
+
+    threads = [threading.Thread(target=export, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    rows = read_rows(out_dir)
+    assert sorted((row["conversation_id"], row["message_index"]) for row in rows) == [
+        (str(number), index) for number in range(8) for index in range(2)
+    ]
+    assert load_checkpoint(out_dir) == {("ana", str(number)): 2 for number in range(8)}
+
+
+def test_stale_worker_exports_only_new_messages(tmp_path):
+    cache_path, out_dir = str(tmp_path / "cache.db"), str(tmp_path / "export")
+    first, second = (MemoryManager(shared_cache=SharedCache(cache_path)) for _ in range(2))
+    first.get_session_history("ana", "1").add_messages([HumanMessage(content="one"), AIMessage(content="two")])
+    first.publish_session_history("ana", "1")
+    second.get_session_history("ana", "1")
+    export_transcripts(out_dir, managers=[first])
+
+    # The session moved to the first worker; the second still holds the old copy
+    first.get_session_history("ana", "1").add_messages([HumanMessage(content="three")])
+    first.publish_session_history("ana", "1")
+    summary = export_transcripts(out_dir, managers=[second])
+
+    assert summary["rows"] == 1
+    assert sorted(row["content"] for row in read_rows(out_dir)) == ["one", "three", "two"]
+
+
+def test_export_job_exports_the_sessions_of_the_app(tmp_path):
+    # The app imports the engine as a package, so the job must find its sessions there
+    from SecureShield.Chatbot.jobs import PROCESS_ID, JobQueue
+    from SecureShield.Chatbot.memory import MemoryManager as AppMemoryManager
+
+    manager = AppMemoryManager()
+    manager.get_session_history("ana", "1").add_messages([HumanMessage(content="one"), AIMessage(content="two")])
+    out_dir = str(tmp_path / "export")
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+
+    job_id = queue.enqueue("export_transcripts", {"out_dir": out_dir})
+    assert queue.get(job_id)["owner"] == PROCESS_ID
+    assert queue.run_next()
+
+    assert queue.get(job_id)["status"] == "done"
+    assert sorted(row["content"] for row in read_rows(out_dir)) == ["one", "two"]
@@ -0,0 +1,142 @@
+# Import necessary modules and classes
+import threading
+import time
+from contextvars import ContextVar
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from scheduler import CallCancelled, CancelToken, LLMScheduler, Priority, ScheduledRunnable, SchedulerOverloaded
+import transport
+from transport import hedged
+
+request_id: ContextVar = ContextVar("request_id", default=None)
+
+
+def scheduled(fn, scheduler):
+    return ScheduledRunnable(RunnableLambda(fn), Priority.LOOKUP, scheduler)
+
+
+def test_hedged_calls_see_the_callers_context():
+    seen = []
+    attempts = iter([0.3, 0.0])
+
+    def call():
+        seen.append(request_id.get())
+        time.sleep(next(attempts))
+        return "done"
+
+    request_id.set("abc")
+    assert hedged(call, hedge_after=0.05) == "done"
+    assert seen == ["abc", "abc"]
+
+
+def test_losing_call_holds_its_slot_until_it_returns():
+    scheduler = LLMScheduler(max_concurrency=2)
+    slow_call_may_finish = threading.Event()
+    attempts = iter(["slow", "fast"])
+
+    def call(_):
+        if next(attempts) == "slow":
+            slow_call_may_finish.wait(5)
+            return "slow"
+        return "fast"
+
+    model = scheduled(call, scheduler)
+    assert hedged(lambda: model.invoke("question"), hedge_after=0.05) == "fast"
+    # The slow request is still sent, so it still counts against the limit
+    assert scheduler.metrics()["in_flight"] == 1
+
+    slow_call_may_finish.set()
+    time.sleep(0.05)
+    assert scheduler.metrics()["in_flight"] == 0
+
+
+def test_no_hedge_is_sent_while_the_scheduler_is_saturated():
+    scheduler = LLMScheduler(max_concurrency=1)
+    calls = []
+
+    def call(_):
+        calls.append(True)
+        time.sleep(0.2)
+        return "done"
+
+    model = scheduled(call, scheduler)
+    assert hedged(lambda: model.invoke("question"), 0.05, saturated=model.is_saturated) == "done"
+    assert len(calls) == 1
+
+
+def test_hedges_in_flight_are_capped(monkeypatch):
+    monkeypatch.setattr(transport, "MAX_HEDGES", 1)
+    loser_may_finish = threading.Event()
+    # The first call loses its hedge and keeps running; the next one is merely slow
+    delays = iter([None, 0.0, 0.2])
+    calls = []
+
+    def call():
+        calls.append(True)
+        delay = next(delays)
+        if delay is None:
+            loser_may_finish.wait(5)
+        else:
+            time.sleep(delay)
+        return "done"
+
+    assert hedged(call, hedge_after=0.05) == "done"
+    # The first loser is still running, so the second call is not duplicated
+    assert hedged(call, hedge_after=0.05) == "done"
+    assert len(calls) == 3
+
+    loser_may_finish.set()
+
+
+def test_hedged_call_stops_waiting_at_its_deadline():
+    call_may_finish = threading.Event()
+
+    def call():
+        call_may_finish.wait(5)
+        return "late"
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        hedged(call, hedge_after=0.05, deadline=started + 0.2)
+    assert time.monotonic() - started < 1
+    call_may_finish.set()
+
+
+def test_cancelled_request_leaves_the_queue():
+    scheduler = LLMScheduler(max_concurrency=1)
+    holder = scheduler.acquire(Priority.LOOKUP, 10)
+    cancel_token = CancelToken()
+    outcome = []
+
+    def wait_for_slot():
+        try:
+            scheduler.acquire(Priority.LOOKUP, 10, cancel_token)
+        except CallCancelled:
+            outcome.append("cancelled")
+
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    time.sleep(0.05)
+    assert scheduler.metrics()["priorities"]["LOOKUP"]["queue_depth"] == 1
+
+    cancel_token.cancel()
+    waiter.join(1)
+    assert outcome == ["cancelled"]
+    assert scheduler.metrics()["priorities"]["LOOKUP"]["queue_depth"] == 0
+    scheduler.release(holder)
+    assert scheduler.metrics()["in_flight"] == 0
+
+
+def test_queued_request_is_shed_at_its_deadline():
+    scheduler = LLMScheduler(max_concurrency=1)
+    holder = scheduler.acquire(Priority.CLAIM_UPDATE, 10)
+
+    started = time.monotonic()
+    with pytest.raises(SchedulerOverloaded):
+        scheduler.acquire(Priority.CLAIM_UPDATE, 10, deadline=started + 0.1)
+    # Long before the 30s a claim update may otherwise wait
+    assert time.monotonic() - started < 1
+    assert scheduler.metrics()["priorities"]["CLAIM_UPDATE"]["shed"] == 1
+    scheduler.release(holder)